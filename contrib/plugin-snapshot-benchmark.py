@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+"""Compare WSGI worker startup with and without a plugin snapshot
+
+Every run starts a fresh Python interpreter, bootstraps and finalizes the
+server API the same way install/share/wsgi.py does and reports the startup
+time and the time to execute the first command lookup:
+
+    $ python3 contrib/plugin-snapshot-benchmark.py --runs 10
+
+The script needs a configured IPA server (or an in-tree ~/.ipa/default.conf
+with --confdir) but it does not connect to LDAP.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+WORKER = """
+import json, sys, time
+start = time.time()
+from ipalib import create_api
+api = create_api(mode=None)
+api.bootstrap(context='server', in_server=True, confdir=sys.argv[1],
+              plugin_snapshot=sys.argv[2], log=None)
+api.finalize()
+started = time.time()
+api.Command[sys.argv[3]].params
+first = time.time()
+print(json.dumps(dict(startup=started - start, first=first - started,
+                      modules=len(sys.modules))))
+"""
+
+SAVE = """
+import sys
+from ipalib import create_api
+api = create_api(mode=None)
+api.bootstrap(context='server', in_server=True, confdir=sys.argv[1],
+              plugins_on_demand=True, plugin_snapshot='', log=None)
+api.finalize()
+api.save_plugin_snapshot(sys.argv[2])
+"""
+
+
+def run(args, snapshot):
+    out = subprocess.check_output([
+        sys.executable, '-c', WORKER, args.confdir, snapshot, args.command])
+    return json.loads(out.decode('utf-8').splitlines()[-1])
+
+
+def report(name, results):
+    for key, label in (('startup', 'startup'), ('first', 'first command')):
+        values = [r[key] * 1000 for r in results]
+        print('{:<10} {:<14} mean {:8.1f} ms  median {:8.1f} ms  '
+              'min {:8.1f} ms'.format(
+                  name, label, statistics.mean(values),
+                  statistics.median(values), min(values)))
+    print('{:<10} {:<14} {:d}'.format(
+        name, 'modules', results[-1]['modules']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--confdir', default='/etc/ipa')
+    parser.add_argument('--command', default='user_show',
+                        help='command looked up after startup')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        snapshot = os.path.join(tmpdir, 'plugin-snapshot.json')
+        subprocess.check_call(
+            [sys.executable, '-c', SAVE, args.confdir, snapshot])
+
+        full = [run(args, '') for _i in range(args.runs)]
+        lazy = [run(args, snapshot) for _i in range(args.runs)]
+
+    report('full', full)
+    report('snapshot', lazy)
+
+
+if __name__ == '__main__':
+    main()
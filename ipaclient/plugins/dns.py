@@ -32,7 +32,7 @@ from ipalib.dns import (get_record_rrtype,
                         part_name_format,
                         record_name_format)
 from ipalib.frontend import Command
-from ipalib.parameters import Bool, Str
+from ipalib.parameters import Bool, File, Str
 from ipalib.plugable import Registry
 from ipalib import _, ngettext
 from ipalib import util
@@ -130,6 +130,75 @@ class dnszone_mod(DNSZoneMethodOverride):
     pass
 
 
+@register(override=True, no_fail=True)
+class dnszone_import(MethodOverride):
+    takes_options = (
+        File(
+            'file?',
+            label=_("Input file"),
+            doc=_("File to load the zone from"),
+            include='cli',
+        ),
+    )
+
+    def get_options(self):
+        for option in super(dnszone_import, self).get_options():
+            if option.name == 'zonefile' and self.api.env.context == 'cli':
+                option = option.clone(required=False)
+            yield option
+
+    def forward(self, *keys, **options):
+        if self.api.env.context == 'cli':
+            if 'zonefile' in options and 'file' in options:
+                raise errors.MutuallyExclusiveError(
+                    reason=_("cannot specify both zone file and file"))
+            if 'file' in options:
+                options['zonefile'] = options.pop('file')
+
+        return super(dnszone_import, self).forward(*keys, **options)
+
+
+@register(override=True, no_fail=True)
+class dnszone_export(MethodOverride):
+    def forward(self, *keys, **options):
+        if 'out' in options:
+            util.check_writable_file(options['out'])
+
+        result = super(dnszone_export, self).forward(*keys, **options)
+        # the lines of the zone file directives start with "$"
+        if 'out' in options:
+            count = 0
+            with open(options['out'], 'w') as f:
+                for line in result.pop('result'):
+                    f.write(line)
+                    f.write(u'\n')
+                    if not line.startswith(u'$'):
+                        count += 1
+            result['summary'] = (
+                _("%(count)d records stored in file '%(file)s'")
+                % dict(count=count, file=options['out'])
+            )
+        else:
+            count = sum(1 for line in result['result']
+                        if not line.startswith(u'$'))
+            result['summary'] = (
+                _('%(count)d records of DNS zone "%(value)s" exported')
+                % dict(count=count, value=result['value'])
+            )
+
+        return result
+
+    def output_for_cli(self, textui, output, *keys, **options):
+        if 'result' in output:
+            # print the zone data as is, it is a zone file or JSON lines
+            for line in output['result']:
+                textui.print_plain(line)
+            return 0
+
+        return super(dnszone_export, self).output_for_cli(
+            textui, output, *keys, **options)
+
+
 # Support old servers without dnsrecord_split_parts
 # Do not add anything new here!
 @register(no_fail=True)
@@ -932,6 +932,7 @@ Registry = plugable.Registry
 
 class API(plugable.API):
     bases = (Command, Object, Method, Backend, Updater)
+    snapshot_eager_bases = (Backend,)
 
     @property
     def packages(self):
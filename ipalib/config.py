@@ -38,6 +38,7 @@ from configparser import RawConfigParser, ParsingError
 
 import six
 
+from ipaplatform.paths import paths
 from ipaplatform.tasks import tasks
 from ipapython.dn import DN
 from ipalib.base import check_name
@@ -579,6 +580,13 @@ class Env:
         if 'log' not in self:
             self.log = self._join('logdir', '%s.log' % self.context)
 
+        # Set plugin_snapshot (only used by the WSGI server workers):
+        if 'plugin_snapshot' not in self:
+            if self.context == 'server' and not self.in_tree:
+                self.plugin_snapshot = paths.IPA_PLUGIN_SNAPSHOT
+            else:
+                self.plugin_snapshot = None
+
         # Workaround for ipa-server-install --uninstall. When no config file
         # is available, we set realm, domain, and basedn to RFC 2606 reserved
         # suffix to suppress attribute errors during uninstallation.
@@ -152,6 +152,21 @@ DEFAULT_CONFIG = (
     # How long to wait for an entry to appear on a replica
     ('replication_wait_timeout', 300),
 
+    # Number of idle bound LDAP connections kept per WSGI worker and the
+    # number of seconds an idle connection is kept
+    ('ldap_pool_size', 8),
+    ('ldap_pool_ttl', 300),
+    # Number of idle keep-alive HTTPS connections to the CA kept per WSGI
+    # worker for the RA agent
+    ('ra_pool_size', 4),
+    # Keep the group membership of all users and hosts in memory in every
+    # WSGI worker and check for changes at most every N seconds
+    ('membership_graph', True),
+    ('membership_poll_interval', 0),
+    # Check for new or removed certificates in the in-memory certificate
+    # expiration index of every WSGI worker at most every N seconds
+    ('cert_expiry_poll_interval', 60),
+
     # Web Application mount points
     ('mount_ipa', '/ipa/'),
 
@@ -243,6 +258,7 @@ DEFAULT_CONFIG = (
     ('in_server', object),  # Whether or not running in-server (bool)
     ('logdir', object),  # Directory containing log files
     ('log', object),  # Path to context specific log file
+    ('plugin_snapshot', object),  # Path to the plugin registry snapshot
 
 )
 
@@ -183,6 +183,8 @@ class Retrieve(PKQuery):
     Retrieve an entry by its primary key.
     """
 
+    read_only = True
+
     has_output = output.standard_entry
 
 
@@ -239,6 +241,8 @@ class Search(Method):
     Retrieve all entries that match a given search criteria.
     """
 
+    read_only = True
+
     has_output = output.standard_list_of_entries
 
     def get_args(self):
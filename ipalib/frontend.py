@@ -26,6 +26,7 @@ import six
 
 from ipapython.version import API_VERSION
 from ipapython.ipautil import APIVersion
+from ipapython import metrics
 from ipalib.base import NameSpace
 from ipalib.plugable import Plugin, APINameSpace
 from ipalib.parameters import create_param, Param, Str, Flag
@@ -46,6 +47,11 @@ logger = logging.getLogger(__name__)
 
 RULE_FLAG = 'validation_rule'
 
+command_duration = metrics.registry.histogram(
+    'ipa_command_duration_seconds',
+    'Duration of the phases of command execution',
+    ('command', 'phase'))
+
 def rule(obj):
     assert not hasattr(obj, RULE_FLAG)
     setattr(obj, RULE_FLAG, True)
@@ -423,6 +429,10 @@ class Command(HasParam):
     msg_summary = None
     msg_truncated = _('Results are truncated, try a more specific search')
 
+    # Commands which never modify any data can be executed concurrently
+    # (see the batch command)
+    read_only = False
+
     callback_types = ('interactive_prompt',)
 
     api_version = API_VERSION
@@ -461,21 +471,24 @@ class Command(HasParam):
                 # add message only on server side
                 self.add_message(
                     messages.VersionMissing(server_version=self.api_version))
-        params = self.args_options_2_params(*args, **options)
-        logger.debug(
-            'raw: %s(%s)', self.name, ', '.join(self._repr_iter(**params))
-        )
-        if self.api.env.in_server:
-            params.update(self.get_default(**params))
-        params = self.normalize(**params)
-        params = self.convert(**params)
-        logger.debug(
-            '%s(%s)', self.name, ', '.join(self._repr_iter(**params))
-        )
+        with command_duration.time(command=self.name, phase='convert'):
+            params = self.args_options_2_params(*args, **options)
+            logger.debug(
+                'raw: %s(%s)', self.name, ', '.join(self._repr_iter(**params))
+            )
+            if self.api.env.in_server:
+                params.update(self.get_default(**params))
+            params = self.normalize(**params)
+            params = self.convert(**params)
+            logger.debug(
+                '%s(%s)', self.name, ', '.join(self._repr_iter(**params))
+            )
         if self.api.env.in_server:
-            self.validate(**params)
+            with command_duration.time(command=self.name, phase='validate'):
+                self.validate(**params)
         (args, options) = self.params_2_args_options(**params)
-        ret = self.run(*args, **options)
+        with command_duration.time(command=self.name, phase='execute'):
+            ret = self.run(*args, **options)
         if isinstance(ret, dict):
             for message in self.context.__messages:
                 messages.add_message(options['version'], ret, message)
@@ -486,7 +499,8 @@ class Command(HasParam):
         ):
             ret['summary'] = self.get_summary_default(ret)
         if self.use_output_validation and (self.output or ret is not None):
-            self.validate_output(ret, options['version'])
+            with command_duration.time(command=self.name, phase='output'):
+                self.validate_output(ret, options['version'])
         return ret
 
     def add_message(self, message):
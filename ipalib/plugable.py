@@ -35,6 +35,8 @@ import optparse  # pylint: disable=deprecated-module
 import textwrap
 import collections
 import importlib
+import json
+import tempfile
 
 import six
 
@@ -289,6 +291,49 @@ class Plugin(ReadOnly):
         )
 
 
+class SnapshotPlugin:
+    """
+    Stand-in for a plugin class recorded in a plugin snapshot.
+
+    The module which defines the plugin is imported only when the plugin is
+    instantiated or when a class attribute other than those recorded in the
+    snapshot is accessed.
+    """
+
+    def __init__(self, module, qualname, name, version, bases):
+        self.module = module
+        self.qualname = qualname
+        self.name = name
+        self.version = version
+        self.full_name = '{}/{}'.format(name, version)
+        self.bases = bases
+        self._plugin = None
+
+    @property
+    def plugin(self):
+        """
+        Return the actual plugin class, import its module if necessary.
+        """
+        if self._plugin is None:
+            plugin = importlib.import_module(self.module)
+            for attr in self.qualname.split('.'):
+                plugin = getattr(plugin, attr)
+            self._plugin = plugin
+        return self._plugin
+
+    def __call__(self, api):
+        return self.plugin(api)
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_plugin':
+            raise AttributeError(name)
+        return getattr(self.plugin, name)
+
+    def __repr__(self):
+        return '<%s %s.%s>' % (
+            self.__class__.__name__, self.module, self.qualname)
+
+
 class APINameSpace(Mapping):
     def __init__(self, api, base):
         self.__api = api
@@ -359,6 +404,7 @@ class API(ReadOnly):
         self.__instances = {}
         self.__next = {}
         self.__done = set()
+        self.__from_snapshot = False
         self.env = Env()
 
     @property
@@ -369,6 +415,14 @@ class API(ReadOnly):
     def packages(self):
         raise NotImplementedError
 
+    @property
+    def snapshot_eager_bases(self):
+        """
+        Plugin bases which are instantiated during finalization even when
+        the plugins were loaded from a plugin snapshot.
+        """
+        return ()
+
     def __len__(self):
         """
         Return the number of plugin namespaces in this API object.
@@ -622,9 +676,139 @@ class API(ReadOnly):
         self.__do_if_not_done('bootstrap')
         if self.env.mode in ('dummy', 'unit_test'):
             return
+        if self.env.plugin_snapshot and not self.env.validate_api:
+            if self.load_plugin_snapshot(self.env.plugin_snapshot):
+                return
         for package in self.packages:
             self.add_package(package)
 
+    def __snapshot_modules(self):
+        """
+        Return a description of plugin modules used to validate a snapshot.
+
+        Each plugin package is described by the names, sizes and modification
+        times of its modules, so that adding, removing or updating any plugin
+        module invalidates the snapshot.
+        """
+        result = []
+        for package in self.packages:
+            package_dir = path.dirname(path.abspath(package.__file__))
+            modules = getattr(
+                package, 'modules', find_modules_in_dir(package_dir))
+            stats = []
+            for name in modules:
+                st = os.stat(path.join(package_dir, '%s.py' % name))
+                stats.append([name, st.st_size, st.st_mtime_ns])
+            result.append([package.__name__, stats])
+        return result
+
+    def save_plugin_snapshot(self, filename):
+        """
+        Save the finalized plugin registry to ``filename``.
+
+        The snapshot records the plugin class index (module, class, name,
+        version and namespaces of every plugin) and the default version map.
+        A fresh `API` instance can load it in `API.load_plugins` instead of
+        importing all plugin modules.
+
+        :param filename: path of the snapshot file
+        """
+        if not self.isdone('finalize'):
+            raise Exception(
+                '%s.finalize() was not called' % self.__class__.__name__)
+
+        plugins = []
+        for plugin in sorted(self.__plugins,
+                             key=operator.attrgetter('full_name')):
+            if isinstance(plugin, SnapshotPlugin):
+                plugin = plugin.plugin
+            module = sys.modules[plugin.__module__]
+            qualname = plugin.__qualname__
+            resolved = module
+            for attr in qualname.split('.'):
+                resolved = getattr(resolved, attr, None)
+            if resolved is not plugin:
+                raise ValueError(
+                    "plugin %s.%s cannot be recorded in a snapshot" % (
+                        plugin.__module__, qualname))
+            plugins.append(dict(
+                module=plugin.__module__,
+                qualname=qualname,
+                name=plugin.name,
+                version=plugin.version,
+                bases=[
+                    base.__name__ for base in self.bases
+                    if any(issubclass(b, base) for b in plugin.bases)
+                ],
+            ))
+
+        snapshot = dict(
+            version=VERSION,
+            api_version=API_VERSION,
+            packages=self.__snapshot_modules(),
+            plugins=plugins,
+            default_map=self.__default_map,
+        )
+
+        dirname = path.dirname(path.abspath(filename))
+        with tempfile.NamedTemporaryFile(
+                'w', dir=dirname, delete=False) as f:
+            json.dump(snapshot, f, sort_keys=True)
+        os.chmod(f.name, 0o644)
+        os.rename(f.name, filename)
+        logger.debug("saved %d plugins to snapshot %s",
+                     len(plugins), filename)
+
+    def load_plugin_snapshot(self, filename):
+        """
+        Register plugins from a snapshot saved by `API.save_plugin_snapshot`.
+
+        Plugin modules are not imported, the plugins are represented by
+        `SnapshotPlugin` instances which import their module on first use.
+        The snapshot is ignored if it does not match the installed IPA
+        version or plugin modules.
+
+        :param filename: path of the snapshot file
+        :returns: ``True`` if the plugins were loaded from the snapshot
+        """
+        try:
+            with open(filename) as f:
+                snapshot = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            logger.debug("cannot read plugin snapshot %s: %s", filename, e)
+            return False
+
+        try:
+            valid = (
+                snapshot['version'] == VERSION and
+                snapshot['api_version'] == API_VERSION and
+                snapshot['packages'] == self.__snapshot_modules()
+            )
+        except (KeyError, OSError):
+            valid = False
+        if not valid:
+            logger.info("plugin snapshot %s is out of date, ignoring",
+                        filename)
+            return False
+
+        bases = {base.__name__: base for base in self.bases}
+        for record in snapshot['plugins']:
+            plugin = SnapshotPlugin(
+                record['module'],
+                record['qualname'],
+                record['name'],
+                record['version'],
+                tuple(bases[name] for name in record['bases']),
+            )
+            self.__plugins.add(plugin)
+            self.__plugins_by_key[plugin.full_name] = plugin
+        self.__default_map.update(snapshot['default_map'])
+        self.__from_snapshot = True
+
+        logger.debug("loaded %d plugins from snapshot %s",
+                     len(snapshot['plugins']), filename)
+        return True
+
     # FIXME: This method has no unit test
     def add_package(self, package):
         """
@@ -750,6 +934,9 @@ class API(ReadOnly):
                     "IPA_CONFDIR env sets confdir to '%s'.", self.env.confdir)
 
         for plugin in self.__plugins:
+            if self.__from_snapshot:
+                # the default map was loaded along with the plugins
+                break
             if not self.env.validate_api:
                 if plugin.full_name not in DEFAULT_PLUGINS:
                     continue
@@ -769,12 +956,14 @@ class API(ReadOnly):
             self.__default_map[plugin.name] = plugin.version
 
         production_mode = self.is_production_mode()
+        on_demand = self.env.plugins_on_demand or self.__from_snapshot
 
         for base in self.bases:
+            eager = base in self.snapshot_eager_bases
             for plugin in self.__plugins:
                 if not any(issubclass(b, base) for b in plugin.bases):
                     continue
-                if not self.env.plugins_on_demand:
+                if not on_demand or (self.__from_snapshot and eager):
                     self._get(plugin)
 
             name = base.__name__
@@ -782,10 +971,10 @@ class API(ReadOnly):
                 assert not hasattr(self, name)
             setattr(self, name, APINameSpace(self, base))
 
-        for instance in six.itervalues(self.__instances):
+        for instance in list(six.itervalues(self.__instances)):
             if not production_mode:
                 assert instance.api is self
-            if not self.env.plugins_on_demand:
+            if not on_demand or self.__from_snapshot:
                 instance.ensure_finalized()
                 if not production_mode:
                     assert islocked(instance)
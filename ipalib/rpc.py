@@ -42,6 +42,7 @@ import json
 import re
 import socket
 import gzip
+import types
 import urllib
 from ssl import SSLError
 
@@ -160,7 +161,7 @@ def xml_wrap(value, version):
 
     :param value: The simple scalar or simple compound value to wrap.
     """
-    if type(value) in (list, tuple):
+    if type(value) in (list, tuple, types.GeneratorType):
         return tuple(xml_wrap(v, version) for v in value)
     if isinstance(value, dict):
         return dict(
@@ -331,6 +332,7 @@ class _JSONPrimer(dict):
             bytes: self._enc_bytes,
             list: self._enc_list,
             tuple: self._enc_list,
+            types.GeneratorType: self._enc_list,
             dict: self._enc_dict,
             crypto_x509.Certificate: self._enc_certificate,
             crypto_x509.CertificateSigningRequest: self._enc_certificate,
@@ -418,6 +420,74 @@ def json_encode_binary(val, version, pretty_print=False):
         return json.dumps(result)
 
 
+def _json_iterencode(val, primer, _dumps=json.dumps):
+    """Yield JSON text fragments of val
+
+    Dictionaries are walked recursively, list items are primed, serialized
+    and dropped from the list one at a time. Generators are serialized as
+    lists while they produce their items.
+    """
+    if val.__class__ is dict:
+        yield '{'
+        sep = ''
+        for k, v in six.iteritems(val):
+            yield '%s%s: ' % (sep, _dumps(unicode(k)))
+            for text in _json_iterencode(v, primer):
+                yield text
+            sep = ', '
+        yield '}'
+    elif val.__class__ is list:
+        yield '['
+        for i, v in enumerate(val):
+            # release the item as soon as it has been serialized
+            val[i] = None
+            if i:
+                yield ', '
+            yield _dumps(primer.convert(v))
+        yield ']'
+    elif val.__class__ is types.GeneratorType:
+        yield '['
+        sep = ''
+        for v in val:
+            yield sep
+            yield _dumps(primer.convert(v))
+            sep = ', '
+        yield ']'
+    else:
+        yield _dumps(primer.convert(val))
+
+
+def json_encode_binary_iter(val, version, chunk_size=65536):
+    """Serialize a Python object structure to JSON incrementally
+
+    Unlike json_encode_binary(), the structure is never primed or serialized
+    as a whole. Lists are serialized item by item and every item is released
+    from its list once it was written out, so the memory used by the
+    serializer does not grow with the number of items. Generators are
+    consumed while the output is produced, so their items are never held
+    all at once. The output is identical to json_encode_binary(val, version).
+
+    :param object val: Python object structure, lists and generators in it
+        are consumed
+    :param str version: client version
+    :param int chunk_size: approximate size of the yielded chunks in bytes
+    :return: iterator of UTF-8 encoded chunks
+    """
+    primer = _JSONPrimer(version)
+    chunk = []
+    size = 0
+    for text in _json_iterencode(val, primer):
+        data = text.encode('utf-8')
+        chunk.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
 def _ipa_obj_hook(dct, _iteritems=six.iteritems, _list=list):
     """JSON object hook
 
@@ -33,11 +33,14 @@ from __future__ import print_function
 
 import os
 import binascii
+import collections
 import datetime
+import hashlib
 import ipaddress
 import ssl
 import base64
 import re
+import threading
 
 from cryptography import x509 as crypto_x509
 from cryptography import utils as crypto_utils
@@ -81,6 +84,10 @@ EKU_PLACEHOLDER = '1.3.6.1.4.1.3319.6.10.16'
 SAN_UPN = '1.3.6.1.4.1.311.20.2.3'
 SAN_KRB5PRINCIPALNAME = '1.3.6.1.5.2.2'
 
+# Number of certificates loaded by load_der_x509_certificate() which are
+# kept decoded in memory
+CERTIFICATE_CACHE_SIZE = 512
+
 
 @crypto_utils.register_interface(crypto_x509.Certificate)
 class IPACertificate:
@@ -96,29 +103,38 @@ class IPACertificate:
         self._cert = cert
         self.backend = default_backend() if backend is None else backend()
 
-        # initialize the certificate fields
-        # we have to do it this way so that some systems don't explode since
-        # some field types encode-decoding is not strongly defined
-        self._subject = self.__get_der_field('subject')
-        self._issuer = self.__get_der_field('issuer')
-        self._serial_number = self.__get_der_field('serialNumber')
+        # fields derived from the certificate, decoded on first use; the
+        # certificate itself never changes
+        self._fields = {}
 
     def __getstate__(self):
         state = {
             '_cert': self.public_bytes(Encoding.DER),
             '_subject': self.subject_bytes,
             '_issuer': self.issuer_bytes,
-            '_serial_number': self._serial_number,
+            '_serial_number': self.serial_number_bytes,
         }
         return state
 
     def __setstate__(self, state):
-        self._subject = state['_subject']
-        self._issuer = state['_issuer']
-        self._issuer = state['_serial_number']
+        self._fields = {
+            'subject_bytes': state['_subject'],
+            'issuer_bytes': state['_issuer'],
+            'serial_number_bytes': state['_serial_number'],
+        }
         self._cert = crypto_x509.load_der_x509_certificate(
             state['_cert'], backend=default_backend())
 
+    def __get_field(self, name, decode):
+        """
+        :returns: the value of ``decode()``, computed only once
+        """
+        try:
+            return self._fields[name]
+        except KeyError:
+            value = self._fields[name] = decode()
+            return value
+
     def __eq__(self, other):
         """
         Checks equality.
@@ -166,8 +182,10 @@ class IPACertificate:
         """
         :returns: a field of the certificate in pyasn1 representation
         """
-        cert_bytes = self.tbs_certificate_bytes
-        cert = decoder.decode(cert_bytes, rfc2459.TBSCertificate())[0]
+        cert = self.__get_field(
+            'tbs_certificate',
+            lambda: decoder.decode(self.tbs_certificate_bytes,
+                                   rfc2459.TBSCertificate())[0])
         field = cert[field]
         return field
 
@@ -176,6 +194,8 @@ class IPACertificate:
         :field: the name of the field of the certificate
         :returns: bytes representing the value of a certificate field
         """
+        # we have to do it this way so that some systems don't explode since
+        # some field types encode-decoding is not strongly defined
         return encoder.encode(self.__get_pyasn1_field(field))
 
     def public_bytes(self, encoding):
@@ -194,7 +214,9 @@ class IPACertificate:
         """
         Counts fingerprint of the wrapped cryptography.Certificate
         """
-        return self._cert.fingerprint(algorithm)
+        return self.__get_field(
+            ('fingerprint', algorithm.name),
+            lambda: self._cert.fingerprint(algorithm))
 
     @property
     def serial_number(self):
@@ -202,7 +224,9 @@ class IPACertificate:
 
     @property
     def serial_number_bytes(self):
-        return self._serial_number
+        return self.__get_field(
+            'serial_number_bytes',
+            lambda: self.__get_der_field('serialNumber'))
 
     @property
     def version(self):
@@ -210,11 +234,12 @@ class IPACertificate:
 
     @property
     def subject(self):
-        return self._cert.subject
+        return self.__get_field('subject', lambda: self._cert.subject)
 
     @property
     def subject_bytes(self):
-        return self._subject
+        return self.__get_field(
+            'subject_bytes', lambda: self.__get_der_field('subject'))
 
     @property
     def signature_hash_algorithm(self):
@@ -240,11 +265,12 @@ class IPACertificate:
 
     @property
     def issuer(self):
-        return self._cert.issuer
+        return self.__get_field('issuer', lambda: self._cert.issuer)
 
     @property
     def issuer_bytes(self):
-        return self._issuer
+        return self.__get_field(
+            'issuer_bytes', lambda: self.__get_der_field('issuer'))
 
     @property
     def not_valid_before(self):
@@ -274,13 +300,20 @@ class IPACertificate:
 
     @property
     def extended_key_usage(self):
+        eku = self.__get_field('extended_key_usage', self.__get_eku)
+        if eku is None:
+            return None
+        # callers are free to modify the returned set
+        return set(eku)
+
+    def __get_eku(self):
         try:
             ext_key_usage = self._cert.extensions.get_extension_for_oid(
                 crypto_x509.oid.ExtensionOID.EXTENDED_KEY_USAGE).value
         except crypto_x509.ExtensionNotFound:
             return None
 
-        return set(oid.dotted_string for oid in ext_key_usage)
+        return frozenset(oid.dotted_string for oid in ext_key_usage)
 
     @property
     def extended_key_usage_bytes(self):
@@ -319,6 +352,20 @@ class IPACertificate:
         and should go away.
 
         """
+        return list(self.__get_field(
+            'san_general_names', self.__get_san_general_names))
+
+    @property
+    def san_processed_general_names(self):
+        """
+        Return SAN general names with the otherNames of known type
+        instantiated to the specific types, see ``process_othernames``.
+        """
+        return list(self.__get_field(
+            'san_processed_general_names',
+            lambda: tuple(process_othernames(self.san_general_names))))
+
+    def __get_san_general_names(self):
         gns = self.__pyasn1_get_san_general_names()
 
         GENERAL_NAME_CONSTRUCTORS = {
@@ -340,7 +387,7 @@ class IPACertificate:
                 result.append(
                     GENERAL_NAME_CONSTRUCTORS[gn_type](gn.getComponent()))
 
-        return result
+        return tuple(result)
 
     def __pyasn1_get_san_general_names(self):
         # pyasn1 returns None when the key is not present in the certificate
@@ -361,6 +408,10 @@ class IPACertificate:
 
     @property
     def san_a_label_dns_names(self):
+        return list(self.__get_field(
+            'san_a_label_dns_names', self.__get_san_a_label_dns_names))
+
+    def __get_san_a_label_dns_names(self):
         gns = self.__pyasn1_get_san_general_names()
         result = []
 
@@ -368,7 +419,7 @@ class IPACertificate:
             if gn.getName() == 'dNSName':
                 result.append(unicode(gn.getComponent()))
 
-        return result
+        return tuple(result)
 
     def match_hostname(self, hostname):
         match_cert = {}
@@ -402,6 +453,46 @@ def load_pem_x509_certificate(data):
     )
 
 
+class _CertificateCache:
+    """
+    LRU cache of ``IPACertificate`` objects keyed by the digest of their DER
+    encoding.
+
+    The objects are immutable, so the same certificate loaded again, e.g.
+    from LDAP in another request, can reuse the decoded fields.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._certs = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, data, load):
+        key = hashlib.sha256(data).digest()
+        with self._lock:
+            cert = self._certs.pop(key, None)
+            if cert is not None:
+                self._certs[key] = cert
+                self.hits += 1
+                return cert
+            self.misses += 1
+
+        cert = load(data)
+        with self._lock:
+            self._certs[key] = cert
+            while len(self._certs) > self.max_size:
+                self._certs.popitem(last=False)
+        return cert
+
+    def clear(self):
+        with self._lock:
+            self._certs.clear()
+
+
+_cert_cache = _CertificateCache(CERTIFICATE_CACHE_SIZE)
+
+
 def load_der_x509_certificate(data):
     """
     Load an X.509 certificate in DER format.
@@ -409,9 +500,11 @@ def load_der_x509_certificate(data):
     :returns: a ``IPACertificate`` object.
     :raises: ``ValueError`` if unable to load the certificate.
     """
-    return IPACertificate(
-        crypto_x509.load_der_x509_certificate(data, backend=default_backend())
-    )
+    return _cert_cache.get(
+        data,
+        lambda data: IPACertificate(
+            crypto_x509.load_der_x509_certificate(
+                data, backend=default_backend())))
 
 
 def load_unknown_x509_certificate(data):
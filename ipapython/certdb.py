@@ -202,8 +202,7 @@ def verify_kdc_cert_validity(kdc_cert, ca_certs, realm):
             raise ValueError("invalid for a KDC")
 
         principal = str(Principal(['krbtgt', realm], realm))
-        gns = x509.process_othernames(kdc_cert.san_general_names)
-        for gn in gns:
+        for gn in kdc_cert.san_processed_general_names:
             if isinstance(gn, x509.KRB5PrincipalName) and gn.name == principal:
                 break
         else:
@@ -17,6 +17,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import collections
 import copy
 import logging
 import operator
@@ -24,9 +25,12 @@ import random
 
 import dns.name
 import dns.exception
+import dns.rdata
 import dns.resolver
 import dns.rdataclass
 import dns.rdatatype
+import dns.tokenizer
+import dns.ttl
 
 
 import six
@@ -463,3 +467,110 @@ def query_srv(qname, resolver=None, **kwargs):
         resolver = dns.resolver
     answer = resolver.query(qname, rdtype=dns.rdatatype.SRV, **kwargs)
     return sort_prio_weight(answer)
+
+
+ZoneFileRecord = collections.namedtuple(
+    'ZoneFileRecord', ['line', 'name', 'ttl', 'rdtype', 'value', 'error'])
+
+
+class _ZoneFileTokenizer(dns.tokenizer.Tokenizer):
+    """Tokenizer which remembers the last token read"""
+    last = None
+
+    def get(self, *args, **kwargs):
+        token = super(_ZoneFileTokenizer, self).get(*args, **kwargs)
+        self.last = token
+        return token
+
+
+def iter_zone_file(f, origin):
+    """Parse a zone file in RFC 1035 master file format record by record.
+
+    Unlike ``dns.zone.from_text()`` the zone is never built in memory and
+    a malformed record does not stop the parsing. For every resource
+    record a ZoneFileRecord is yielded with the absolute owner DNSName,
+    the TTL (None when neither the record nor $TTL specify it), the record
+    type and the record data in text form with absolute domain names. For a
+    record which cannot be parsed only ``line`` and ``error`` are set.
+
+    $ORIGIN and $TTL directives are supported, $INCLUDE and $GENERATE are
+    not. Only records of the IN class are accepted.
+
+    :param f: file object or string with the zone file
+    :param origin: absolute name of the zone
+    """
+    tok = _ZoneFileTokenizer(f)
+    current_origin = origin
+    default_ttl = None
+    last_name = None
+
+    while True:
+        token = tok.get(want_leading=True)
+        if token.is_eof():
+            break
+        if token.is_eol():
+            continue
+        line = tok.line_number
+
+        try:
+            if token.is_identifier() and token.value.startswith('$'):
+                directive = token.value.upper()
+                if directive == '$TTL':
+                    default_ttl = dns.ttl.from_text(tok.get_string())
+                elif directive == '$ORIGIN':
+                    current_origin = dns.name.from_text(
+                        tok.get_string(), current_origin)
+                else:
+                    raise dns.exception.SyntaxError(
+                        "unsupported directive %s" % token.value)
+                tok.get_eol()
+                continue
+
+            if token.is_whitespace():
+                if last_name is None:
+                    raise dns.exception.SyntaxError("missing owner name")
+                name = last_name
+            else:
+                name = dns.name.from_text(token.value, current_origin)
+                last_name = name
+
+            ttl = None
+            rdclass = None
+            token = tok.get()
+            for _i in range(2):
+                if not token.is_identifier():
+                    raise dns.exception.SyntaxError("missing record type")
+                if ttl is None:
+                    try:
+                        ttl = dns.ttl.from_text(token.value)
+                    except dns.ttl.BadTTL:
+                        pass
+                    else:
+                        token = tok.get()
+                        continue
+                if rdclass is None:
+                    try:
+                        rdclass = dns.rdataclass.from_text(token.value)
+                    except dns.rdataclass.UnknownRdataclass:
+                        break
+                    else:
+                        token = tok.get()
+            if rdclass not in (None, dns.rdataclass.IN):
+                raise dns.exception.SyntaxError(
+                    "unsupported class %s" % dns.rdataclass.to_text(rdclass))
+            if ttl is None:
+                ttl = default_ttl
+
+            rdtype = dns.rdatatype.from_text(token.value)
+            rdata = dns.rdata.from_text(
+                dns.rdataclass.IN, rdtype, tok, current_origin, False)
+        except (dns.exception.DNSException, ValueError) as e:
+            # skip the rest of the malformed record
+            while tok.last is not None and not tok.last.is_eol_or_eof():
+                tok.get()
+            yield ZoneFileRecord(line, None, None, None, None, e)
+            continue
+
+        yield ZoneFileRecord(
+            line, DNSName(name), ttl, dns.rdatatype.to_text(rdtype),
+            rdata.to_text(origin=None, relativize=False), None)
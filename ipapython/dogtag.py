@@ -20,7 +20,11 @@
 import collections
 import gzip
 import io
+import itertools
 import logging
+import select
+import threading
+import time
 from urllib.parse import urlencode
 import xml.dom.minidom
 import zlib
@@ -48,6 +52,11 @@ if six.PY3:
 
 logger = logging.getLogger(__name__)
 
+# errors of a reused keep-alive connection which was closed by the server
+_STALE_CONNECTION_ERRORS = (httplib.BadStatusLine, ConnectionError)
+# requests which may be sent again when the response was not received
+_IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD'])
+
 Profile = collections.namedtuple('Profile', ['profile_id', 'description', 'store_issued'])
 
 INCLUDED_PROFILES = {
@@ -147,13 +156,146 @@ def ca_status(ca_host=None):
     return _parse_ca_status(body)
 
 
+class HTTPConnectionPool:
+    """
+    Thread-safe pool of idle keep-alive HTTP(S) connections.
+
+    Connections are keyed by the protocol, host, port and the TLS client
+    settings they were created with. At most ``max_size`` idle connections
+    are kept, least recently used connections are closed first. Idle
+    connections are closed after ``ttl`` seconds, which should be shorter
+    than the keep-alive timeout of the server.
+    """
+
+    def __init__(self, max_size=4, ttl=15):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._serial = itertools.count()
+        # (key, serial) -> (connection, last used), least recently used first
+        self._idle = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.retries = 0
+        self.errors = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _evict_expired(self, now):
+        expired = [
+            k for k, (_conn, last_used) in self._idle.items()
+            if now - last_used >= self.ttl
+        ]
+        return [self._idle.pop(k)[0] for k in expired]
+
+    @staticmethod
+    def _is_dropped(conn):
+        """
+        Check whether the server closed an idle connection
+
+        An idle keep-alive connection is readable only when the server
+        closed it (or sent garbage), either way it can't be used.
+        """
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            # not connected, it is connected again on the next request
+            return False
+        try:
+            readable, _w, _x = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def checkout(self, key):
+        """
+        Return an idle connection for ``key`` or None
+        """
+        to_close = []
+        while True:
+            with self._lock:
+                to_close.extend(self._evict_expired(time.time()))
+                conn = None
+                for idle_key in reversed(self._idle):
+                    if idle_key[0] == key:
+                        conn = self._idle.pop(idle_key)[0]
+                        break
+            if conn is not None and self._is_dropped(conn):
+                to_close.append(conn)
+                with self._lock:
+                    self.evictions += 1
+                continue
+            break
+        with self._lock:
+            if conn is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        for stale in to_close:
+            stale.close()
+        return conn
+
+    def release(self, key, conn):
+        """
+        Put a connection with a fully read response back into the pool
+        """
+        to_close = []
+        with self._lock:
+            self._idle[(key, next(self._serial))] = (conn, time.time())
+            while len(self._idle) > self.max_size:
+                _k, (lru, _last_used) = self._idle.popitem(last=False)
+                self.evictions += 1
+                to_close.append(lru)
+        for stale in to_close:
+            stale.close()
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def failed(self):
+        with self._lock:
+            self.errors += 1
+
+    def clear(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle = [conn for conn, _last_used in self._idle.values()]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """
+        Return a dictionary with pool counters
+        """
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                retries=self.retries,
+                errors=self.errors,
+                idle=len(self._idle),
+                max_size=self.max_size,
+            )
+
+
 def https_request(
         host, port, url, cafile, client_certfile, client_keyfile,
-        method='POST', headers=None, body=None, **kw):
+        method='POST', headers=None, body=None, pool=None, **kw):
     """
     :param method: HTTP request method (defalut: 'POST')
     :param url: The path (not complete URL!) to post to.
     :param body: The request body (encodes kw if None)
+    :param pool: HTTPConnectionPool to take the connection from and to
+        return it to (default: new connection for every request)
     :param kw:  Keyword arguments to encode into POST body.
     :return:   (http_status, http_headers, http_body)
                as (integer, dict, str)
@@ -174,7 +316,8 @@ def https_request(
         body = urlencode(kw)
     return _httplib_request(
         'https', host, port, url, connection_factory, body,
-        method=method, headers=headers)
+        method=method, headers=headers, pool=pool,
+        pool_key=(cafile, client_certfile, client_keyfile))
 
 
 def http_request(host, port, url, timeout=None, **kw):
@@ -200,7 +343,8 @@ def http_request(host, port, url, timeout=None, **kw):
 
 def _httplib_request(
         protocol, host, port, path, connection_factory, request_body,
-        method='POST', headers=None, connection_options=None):
+        method='POST', headers=None, connection_options=None, pool=None,
+        pool_key=None):
     """
     :param request_body: Request body
     :param connection_factory: Connection class to use. Will be called
@@ -208,11 +352,16 @@ def _httplib_request(
     :param method: HTTP request method (default: 'POST')
     :param connection_options: a dictionary that will be passed to
         connection_factory as keyword arguments.
+    :param pool: HTTPConnectionPool for keep-alive connections
+    :param pool_key: additional key of pooled connections, e.g. the TLS
+        client settings
 
     Perform a HTTP(s) request.
     """
     if connection_options is None:
         connection_options = {}
+    if pool is not None and not pool.enabled:
+        pool = None
 
     uri = u'%s://%s%s' % (protocol, ipautil.format_netloc(host, port), path)
     logger.debug('request %s %s', method, uri)
@@ -225,18 +374,43 @@ def _httplib_request(
     ):
         headers['content-type'] = 'application/x-www-form-urlencoded'
 
-    try:
-        conn = connection_factory(host, port, **connection_options)
-        conn.request(method, uri, body=request_body, headers=headers)
-        res = conn.getresponse()
-
-        http_status = res.status
-        http_headers = res.msg
-        http_body = res.read()
-        conn.close()
-    except Exception as e:
-        logger.debug("httplib request failed:", exc_info=True)
-        raise NetworkError(uri=uri, error=str(e))
+    key = (protocol, host, port, pool_key)
+    while True:
+        conn = pool.checkout(key) if pool is not None else None
+        reused = conn is not None
+        sent = False
+        try:
+            if conn is None:
+                conn = connection_factory(host, port, **connection_options)
+            conn.request(method, uri, body=request_body, headers=headers)
+            sent = True
+            res = conn.getresponse()
+
+            http_status = res.status
+            http_headers = res.msg
+            http_body = res.read()
+        except Exception as e:
+            if conn is not None:
+                conn.close()
+            if (reused and isinstance(e, _STALE_CONNECTION_ERRORS) and
+                    (not sent or method in _IDEMPOTENT_METHODS)):
+                # the server closed the idle connection. Once the request
+                # was sent, the server may have processed it before it
+                # closed the connection, e.g. issued a certificate, so only
+                # requests without side effects are sent again then.
+                logger.debug("pooled connection closed by peer: %s", e)
+                pool.retried()
+                continue
+            if pool is not None:
+                pool.failed()
+            logger.debug("httplib request failed:", exc_info=True)
+            raise NetworkError(uri=uri, error=str(e))
+
+        if pool is not None and not res.will_close:
+            pool.release(key, conn)
+        else:
+            conn.close()
+        break
 
     encoding = res.getheader('Content-Encoding')
     if encoding == 'gzip':
@@ -8,18 +8,31 @@ class Graph:
     """
     Simple oriented graph structure
 
-    G = (V, E) where G is graph, V set of vertices and E list of edges.
+    G = (V, E) where G is graph, V set of vertices and E set of edges.
     E = (tail, head) where tail and head are vertices
+
+    Edges are indexed by both tail and head, so that adding, removing and
+    looking up edges of a vertex does not need to scan all edges.
     """
 
     def __init__(self):
         self.vertices = set()
-        self.edges = []
-        self._adj = dict()
+        # tail -> heads, head -> tails; dicts are used as ordered sets
+        self._succ = dict()
+        self._pred = dict()
+
+    @property
+    def edges(self):
+        return [
+            (tail, head)
+            for tail, heads in self._succ.items()
+            for head in heads
+        ]
 
     def add_vertex(self, vertex):
         self.vertices.add(vertex)
-        self._adj[vertex] = []
+        self._succ.setdefault(vertex, dict())
+        self._pred.setdefault(vertex, dict())
 
     def add_edge(self, tail, head):
         if tail not in self.vertices:
@@ -28,17 +41,17 @@ class Graph:
         if head not in self.vertices:
             raise ValueError("head is not a vertex")
 
-        self.edges.append((tail, head))
-        self._adj[tail].append(head)
+        self._succ[tail][head] = None
+        self._pred[head][tail] = None
 
     def remove_edge(self, tail, head):
         try:
-            self.edges.remove((tail, head))
+            del self._succ[tail][head]
         except KeyError:
             raise ValueError(
                 "graph does not contain edge: ({0}, {1})".format(tail, head)
             )
-        self._adj[tail].remove(head)
+        del self._pred[head][tail]
 
     def remove_vertex(self, vertex):
         try:
@@ -48,27 +61,33 @@ class Graph:
                 "graph does not contain vertex: {0}".format(vertex)
             )
 
-        # delete _adjacencies
-        del self._adj[vertex]
-        for adj in self._adj.values():
-            adj[:] = [v for v in adj if v != vertex]
-
         # delete edges
-        self.edges = [
-            e for e in self.edges if vertex not in (e[0], e[1])
-        ]
+        for head in self._succ.pop(vertex):
+            del self._pred[head][vertex]
+        for tail in self._pred.pop(vertex):
+            del self._succ[tail][vertex]
 
     def get_tails(self, head):
         """
         Get list of vertices where a vertex is on the right side of an edge
         """
-        return [e[0] for e in self.edges if e[1] == head]
+        return list(self._pred.get(head, ()))
 
     def get_heads(self, tail):
         """
         Get list of vertices where a vertex is on the left side of an edge
         """
-        return [e[1] for e in self.edges if e[0] == tail]
+        return list(self._succ.get(tail, ()))
+
+    def is_symmetric(self):
+        """
+        Return True if every edge has an edge in the opposite direction
+        """
+        return all(
+            tail in self._succ[head]
+            for tail, heads in self._succ.items()
+            for head in heads
+        )
 
     def bfs(self, start=None):
         """
@@ -84,5 +103,170 @@ class Graph:
             vertex = queue.popleft()
             if vertex not in visited:
                 visited.add(vertex)
-                queue.extend(set(self._adj.get(vertex, [])) - visited)
+                queue.extend(set(self._succ.get(vertex, ())) - visited)
         return visited
+
+    def _get_heads(self, tail, ignored_vertices, ignored_edges):
+        return [
+            head for head in self._succ[tail]
+            if head not in ignored_vertices and
+            (tail, head) not in ignored_edges
+        ]
+
+    def strongly_connected_components(self, ignored_vertices=(),
+                                      ignored_edges=()):
+        """
+        Find strongly connected components with Tarjan's algorithm.
+
+        The graph is traversed as if `ignored_vertices` and `ignored_edges`
+        were removed from it, the graph itself is not modified.
+
+        Return list of sets of vertices. A component is always listed after
+        all components reachable from it.
+        """
+        ignored_vertices = set(ignored_vertices)
+        ignored_edges = set(ignored_edges)
+
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        component_stack = []
+        components = []
+
+        for root in self.vertices:
+            if root in index or root in ignored_vertices:
+                continue
+
+            index[root] = lowlink[root] = len(index)
+            component_stack.append(root)
+            on_stack.add(root)
+            stack = [(root, iter(self._get_heads(
+                root, ignored_vertices, ignored_edges)))]
+
+            while stack:
+                vertex, heads = stack[-1]
+                for head in heads:
+                    if head not in index:
+                        index[head] = lowlink[head] = len(index)
+                        component_stack.append(head)
+                        on_stack.add(head)
+                        stack.append((head, iter(self._get_heads(
+                            head, ignored_vertices, ignored_edges))))
+                        break
+                    elif head in on_stack:
+                        lowlink[vertex] = min(lowlink[vertex], index[head])
+                else:
+                    stack.pop()
+                    if stack:
+                        tail = stack[-1][0]
+                        lowlink[tail] = min(lowlink[tail], lowlink[vertex])
+
+                    if lowlink[vertex] == index[vertex]:
+                        component = set()
+                        while True:
+                            member = component_stack.pop()
+                            on_stack.remove(member)
+                            component.add(member)
+                            if member == vertex:
+                                break
+                        components.append(component)
+
+        return components
+
+    def get_reachable(self, ignored_vertices=(), ignored_edges=()):
+        """
+        Get vertices reachable from each vertex of the graph.
+
+        The reachable sets are computed once per strongly connected
+        component on the condensation of the graph, see
+        `strongly_connected_components` for the meaning of the arguments.
+
+        Return dict vertex -> frozenset of vertices, vertices of one
+        component share the same set.
+        """
+        ignored_vertices = set(ignored_vertices)
+        ignored_edges = set(ignored_edges)
+
+        components = self.strongly_connected_components(
+            ignored_vertices, ignored_edges)
+        component_of = {
+            vertex: i
+            for i, component in enumerate(components)
+            for vertex in component
+        }
+
+        reachable = []
+        for i, component in enumerate(components):
+            successors = set()
+            for vertex in component:
+                for head in self._get_heads(
+                        vertex, ignored_vertices, ignored_edges):
+                    successors.add(component_of[head])
+            successors.discard(i)
+
+            visited = set(component)
+            for j in successors:
+                visited.update(reachable[j])
+            reachable.append(frozenset(visited))
+
+        return {
+            vertex: reachable[i] for vertex, i in component_of.items()
+        }
+
+    def get_cuts(self):
+        """
+        Find cut vertices and bridges of the graph taken as undirected.
+
+        A cut vertex (bridge) is a vertex (edge) whose removal increases
+        the number of connected components. Both are found in a single
+        depth-first traversal (Hopcroft-Tarjan).
+
+        Return tuple (set of vertices, set of bridges) where a bridge is
+        a frozenset of its two end vertices.
+        """
+        neighbors = {
+            vertex: set(self._succ[vertex]) | set(self._pred[vertex])
+            for vertex in self.vertices
+        }
+
+        index = {}
+        lowlink = {}
+        cut_vertices = set()
+        bridges = set()
+
+        for root in self.vertices:
+            if root in index:
+                continue
+
+            index[root] = lowlink[root] = len(index)
+            root_children = 0
+            stack = [(root, None, iter(neighbors[root]))]
+
+            while stack:
+                vertex, parent, adjacent = stack[-1]
+                for other in adjacent:
+                    if other == parent:
+                        continue
+                    if other in index:
+                        lowlink[vertex] = min(lowlink[vertex], index[other])
+                    else:
+                        index[other] = lowlink[other] = len(index)
+                        stack.append((other, vertex, iter(neighbors[other])))
+                        break
+                else:
+                    stack.pop()
+                    if parent is None:
+                        continue
+
+                    lowlink[parent] = min(lowlink[parent], lowlink[vertex])
+                    if lowlink[vertex] > index[parent]:
+                        bridges.add(frozenset((parent, vertex)))
+                    if parent == root:
+                        root_children += 1
+                    elif lowlink[vertex] >= index[parent]:
+                        cut_vertices.add(parent)
+
+            if root_children > 1:
+                cut_vertices.add(root)
+
+        return cut_vertices, bridges
@@ -21,7 +21,10 @@
 
 import binascii
 import errno
+import hashlib
 import logging
+import pickle
+import tempfile
 import time
 import datetime
 from decimal import Decimal
@@ -42,10 +45,11 @@ import six
 
 # pylint: disable=ipa-forbidden-import
 from ipalib import errors, x509, _
-from ipalib.constants import LDAP_GENERALIZED_TIME_FORMAT
+from ipalib.constants import LDAP_GENERALIZED_TIME_FORMAT, USER_CACHE_PATH
 # pylint: enable=ipa-forbidden-import
 from ipapython.ipautil import format_netloc, CIDict
 from ipapython.dn import DN
+from ipapython import metrics
 from ipapython.dnsutil import DNSName
 from ipapython.kerberos import Principal
 
@@ -80,6 +84,11 @@ TRUNCATED_ADMIN_LIMIT = object()
 
 DIRMAN_DN = DN(('cn', 'directory manager'))
 
+ldap_operation_duration = metrics.registry.histogram(
+    'ipa_ldap_operation_duration_seconds',
+    'Duration of LDAP operations',
+    ('operation',))
+
 
 if six.PY2 and hasattr(ldap, 'LDAPBytesWarning'):
     # XXX silence python-ldap's BytesWarnings
@@ -137,27 +146,48 @@ class _ServerSchema:
 class SchemaCache:
     '''
     Cache the schema's from individual LDAP servers.
+
+    If *cache_dir* is set, the parsed schema is also stored on disk, so that
+    it is shared by all processes of the same user. A different directory can
+    be given to each `get_schema` call. A schema read from disk
+    is revalidated with the ``modifyTimestamp`` and ``nsSchemaCSN``
+    attributes of the schema entry before it is used.
     '''
 
-    def __init__(self):
+    # operational attributes of the schema entry which change whenever the
+    # schema is modified
+    _validators = ('modifyTimestamp', 'nsSchemaCSN')
+
+    def __init__(self, cache_dir=None):
         self.servers = {}
+        self.cache_dir = cache_dir
 
-    def get_schema(self, url, conn, force_update=False):
+    def get_schema(self, url, conn, force_update=False, cache_dir=None):
         '''
         Return schema belonging to a specific LDAP server.
 
         For performance reasons the schema is retrieved once and
         cached unless force_update is True. force_update flushes the
         existing schema for the server from the cache and reacquires
-        it.
+        it. cache_dir overrides the on-disk cache directory of this
+        SchemaCache.
         '''
+        if cache_dir is None:
+            cache_dir = self.cache_dir
 
         if force_update:
             self.flush(url)
 
         server_schema = self.servers.get(url)
         if server_schema is None:
-            schema = self._retrieve_schema_from_server(url, conn)
+            schema = None
+            if not force_update:
+                schema = self._read_schema_from_disk(url, conn, cache_dir)
+            if schema is None:
+                schema_dn, validator, schema = (
+                    self._retrieve_schema_from_server(url, conn))
+                self._write_schema_to_disk(
+                    url, cache_dir, schema_dn, validator, schema)
             server_schema = _ServerSchema(url, schema)
             self.servers[url] = server_schema
         return server_schema.schema
@@ -169,6 +199,92 @@ class SchemaCache:
         except KeyError:
             pass
 
+    def _get_filename(self, url, cache_dir):
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(cache_dir, name)
+
+    def _get_validator(self, entry_attrs):
+        names = {name.lower(): name for name in entry_attrs}
+        validator = {}
+        for attr in self._validators:
+            name = names.get(attr.lower())
+            if name is not None:
+                validator[attr] = sorted(entry_attrs[name])
+        return validator
+
+    def _read_schema_from_disk(self, url, conn, cache_dir):
+        """
+        Return the schema of *url* stored in *cache_dir* if it is still valid.
+
+        Returns None if there is no usable schema on disk.
+        """
+        if cache_dir is None:
+            return None
+
+        filename = self._get_filename(url, cache_dir)
+        try:
+            with open(filename, 'rb') as f:
+                st = os.fstat(f.fileno())
+                # the file is unpickled, accept only a private file
+                if st.st_uid != os.geteuid() or st.st_mode & 0o022:
+                    logger.debug(
+                        'ignoring schema cache %s with unsafe ownership or '
+                        'permissions', filename)
+                    return None
+                cached_url, schema_dn, validator, schema = pickle.load(f)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                logger.debug('failed to read schema cache %s: %s',
+                             filename, e)
+            return None
+        except Exception as e:
+            logger.debug('failed to load schema cache %s: %s', filename, e)
+            return None
+
+        if cached_url != url:
+            return None
+
+        try:
+            entry = conn.search_s(schema_dn, ldap.SCOPE_BASE,
+                                  attrlist=list(self._validators))[0]
+        except (ldap.LDAPError, IndexError) as e:
+            logger.debug('failed to revalidate cached schema of %s: %s',
+                         url, e)
+            return None
+
+        if self._get_validator(entry[1]) != validator:
+            logger.debug('cached schema of %s is outdated', url)
+            return None
+
+        logger.debug('using cached schema of %s from %s', url, filename)
+        return schema
+
+    def _write_schema_to_disk(self, url, cache_dir, schema_dn, validator,
+                              schema):
+        if cache_dir is None or not validator:
+            return
+
+        try:
+            try:
+                os.makedirs(cache_dir, 0o700)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            with tempfile.NamedTemporaryFile(
+                    'wb', dir=cache_dir, delete=False) as f:
+                try:
+                    pickle.dump((url, schema_dn, validator, schema), f,
+                                pickle.HIGHEST_PROTOCOL)
+                    f.close()
+                except Exception:
+                    os.unlink(f.name)
+                    raise
+                else:
+                    os.rename(f.name, self._get_filename(url, cache_dir))
+        except Exception as e:
+            logger.warning('Failed to write schema cache for %s: %s', url, e)
+
     def _retrieve_schema_from_server(self, url, conn):
         """
         Retrieve the LDAP schema from the provided url and determine if
@@ -181,22 +297,27 @@ class SchemaCache:
 
         If a connection is provided then it the credentials bound to it are
         used. The connection is not closed when the request is done.
+
+        Returns a tuple of the DN of the schema entry, the values of its
+        validator attributes and the parsed schema.
         """
         assert conn is not None
 
         logger.debug(
             'retrieving schema for SchemaCache url=%s conn=%s', url, conn)
 
+        attrlist = ['attributetypes', 'objectclasses']
+        attrlist.extend(self._validators)
         try:
             try:
                 schema_entry = conn.search_s('cn=schema', ldap.SCOPE_BASE,
-                    attrlist=['attributetypes', 'objectclasses'])[0]
+                    attrlist=attrlist)[0]
             except ldap.NO_SUCH_OBJECT:
                 # try different location for schema
                 # openldap has schema located in cn=subschema
                 logger.debug('cn=schema not found, fallback to cn=subschema')
                 schema_entry = conn.search_s('cn=subschema', ldap.SCOPE_BASE,
-                    attrlist=['attributetypes', 'objectclasses'])[0]
+                    attrlist=attrlist)[0]
         except ldap.SERVER_DOWN:
             raise errors.NetworkError(uri=url,
                                error=u'LDAP Server Down, unable to retrieve LDAP schema')
@@ -210,9 +331,17 @@ class SchemaCache:
         # TODO: DS uses 'cn=schema', support for other server?
         #       raise a more appropriate exception
 
-        return ldap.schema.SubSchema(schema_entry[1])
+        schema_dn, entry_attrs = schema_entry
+        validator = self._get_validator(entry_attrs)
+        entry_attrs = {
+            k: v for k, v in entry_attrs.items()
+            if k.lower() in ('attributetypes', 'objectclasses')
+        }
+        return schema_dn, validator, ldap.schema.SubSchema(entry_attrs)
 
-schema_cache = SchemaCache()
+
+schema_cache = SchemaCache(
+    cache_dir=os.path.join(USER_CACHE_PATH, 'ipa', 'ldap-schema'))
 
 
 class LDAPEntry(MutableMapping):
@@ -635,6 +764,38 @@ class SingleValueLDAPEntryView(LDAPEntryView):
             self._entry[name] = [value]
 
 
+class LDAPEntryIterator:
+    """
+    Iterator over the entries found by `LDAPClient.iter_entries`.
+
+    The ``truncated`` attribute is set when the iteration is finished. It has
+    the same meaning as the truncated flag returned by
+    `LDAPClient.find_entries`. Closing the iterator before it is exhausted
+    abandons the search.
+    """
+
+    def __init__(self):
+        self.truncated = False
+        self._gen = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._gen)
+
+    next = __next__
+
+    def close(self):
+        self._gen.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 class LDAPClient:
     """LDAP backend class
 
@@ -745,7 +906,7 @@ class LDAPClient:
 
     def __init__(self, ldap_uri, start_tls=False, force_schema_updates=False,
                  no_schema=False, decode_attrs=True, cacert=None,
-                 sasl_nocanon=True):
+                 sasl_nocanon=True, schema_cache_dir=None):
         """Create LDAPClient object.
 
         :param ldap_uri: The LDAP URI to connect to
@@ -761,6 +922,9 @@ class LDAPClient:
         :param decode_attrs:
             If true, attributes are decoded to Python types according to their
             syntax.
+        :param schema_cache_dir:
+            Directory in which the parsed schema is cached on disk. The
+            per-user cache directory is used if it is not given.
         """
         if ldap_uri is not None:
             self.ldap_uri = ldap_uri
@@ -778,6 +942,7 @@ class LDAPClient:
         self._decode_attrs = decode_attrs
         self._cacert = cacert
         self._sasl_nocanon = sasl_nocanon
+        self._schema_cache_dir = schema_cache_dir
 
         self._has_schema = False
         self._schema = None
@@ -792,7 +957,8 @@ class LDAPClient:
         assert isinstance(dn, DN)
         dn = str(dn)
         modlist = [(a, b, self.encode(c)) for a, b, c in modlist]
-        return self.conn.modify_s(dn, modlist)
+        with ldap_operation_duration.time(operation='modify'):
+            return self.conn.modify_s(dn, modlist)
 
     @property
     def conn(self):
@@ -806,7 +972,8 @@ class LDAPClient:
             try:
                 schema = schema_cache.get_schema(
                     self.ldap_uri, self.conn,
-                    force_update=self._force_schema_updates)
+                    force_update=self._force_schema_updates,
+                    cache_dir=self._schema_cache_dir)
             except (errors.ExecutionError, IndexError):
                 schema = None
 
@@ -1156,8 +1323,9 @@ class LDAPClient:
             assert isinstance(bind_dn, DN)
             bind_dn = str(bind_dn)
             bind_password = self.encode(bind_password)
-            self.conn.simple_bind_s(
-                bind_dn, bind_password, server_controls, client_controls)
+            with ldap_operation_duration.time(operation='bind'):
+                self.conn.simple_bind_s(
+                    bind_dn, bind_password, server_controls, client_controls)
 
     def external_bind(self, server_controls=None, client_controls=None):
         """
@@ -1167,8 +1335,9 @@ class LDAPClient:
         with self.error_handler():
             auth_tokens = ldap.sasl.external(user_name)
             self._flush_schema()
-            self.conn.sasl_interactive_bind_s(
-                '', auth_tokens, server_controls, client_controls)
+            with ldap_operation_duration.time(operation='bind'):
+                self.conn.sasl_interactive_bind_s(
+                    '', auth_tokens, server_controls, client_controls)
 
     def gssapi_bind(self, server_controls=None, client_controls=None):
         """
@@ -1180,8 +1349,9 @@ class LDAPClient:
             else:
                 auth_tokens = SASL_GSSAPI
             self._flush_schema()
-            self.conn.sasl_interactive_bind_s(
-                '', auth_tokens, server_controls, client_controls)
+            with ldap_operation_duration.time(operation='bind'):
+                self.conn.sasl_interactive_bind_s(
+                    '', auth_tokens, server_controls, client_controls)
 
     def unbind(self):
         """
@@ -1447,7 +1617,8 @@ class LDAPClient:
             paged_search = False
 
         # pass arguments to python-ldap
-        with self.error_handler():
+        with self.error_handler(), \
+                ldap_operation_duration.time(operation='search'):
             if six.PY2:
                 filter = self.encode(filter)
                 attrs_list = self.encode(attrs_list)
@@ -1521,6 +1692,137 @@ class LDAPClient:
 
         return (res, truncated)
 
+    def iter_entries(
+            self, filter=None, attrs_list=None, base_dn=None,
+            scope=ldap.SCOPE_SUBTREE, time_limit=None, size_limit=None,
+            page_size=None, get_effective_rights=False,
+            server_controls=None):
+        """
+        Iterate over entries matching specified search parameters.
+
+        Unlike `find_entries`, the entries are not collected in a list. They
+        are retrieved page by page using the simple paged results control
+        and yielded as soon as they are received.
+
+        Keyword arguments are the same as for `find_entries`, plus:
+        :param page_size: number of entries in one page (default 1000)
+        :param server_controls: additional request controls, e.g. a
+            `ldap.controls.libldap.MatchedValuesControl`
+
+        Returns an `LDAPEntryIterator`. The result set may be empty, in which
+        case nothing is yielded, errors.EmptyResult is not raised. Whether
+        the result was truncated is available in the ``truncated`` attribute
+        of the iterator once it is exhausted. Use it as a context manager
+        to make sure an unfinished search is abandoned::
+
+            with ldap.iter_entries(filter, ['cn'], base_dn) as entries:
+                for entry in entries:
+                    ...
+            ldap.handle_truncated_result(entries.truncated)
+        """
+        result = LDAPEntryIterator()
+        result._gen = self.__iter_entries(
+            result, filter, attrs_list, base_dn, scope, time_limit,
+            size_limit, page_size, get_effective_rights, server_controls)
+        return result
+
+    def __iter_entries(self, result, filter, attrs_list, base_dn, scope,
+                       time_limit, size_limit, page_size,
+                       get_effective_rights, server_controls):
+        if base_dn is None:
+            base_dn = DN()
+        assert isinstance(base_dn, DN)
+        if not filter:
+            filter = '(objectClass=*)'
+
+        if time_limit is None:
+            time_limit = self.time_limit
+        if time_limit == 0:
+            time_limit = -1.0
+
+        if size_limit is None:
+            size_limit = self.size_limit
+
+        if not isinstance(size_limit, int):
+            size_limit = int(size_limit)
+        if not isinstance(time_limit, float):
+            time_limit = float(time_limit)
+
+        if page_size is None:
+            page_size = 1000
+        if 0 < size_limit < page_size:
+            page_size = size_limit
+
+        if attrs_list:
+            attrs_list = [a.lower() for a in set(attrs_list)]
+
+        base_sctrls = list(server_controls or [])
+        if get_effective_rights:
+            base_sctrls.append(self.__get_effective_rights_control())
+
+        if six.PY2:
+            filter = self.encode(filter)
+            attrs_list = self.encode(attrs_list)
+
+        cookie = ''
+        msgid = None
+        try:
+            with self.error_handler():
+                while True:
+                    sctrls = base_sctrls + [
+                        SimplePagedResultsControl(0, page_size, cookie)
+                    ]
+                    try:
+                        msgid = self.conn.search_ext(
+                            str(base_dn), scope, filter, attrs_list,
+                            serverctrls=sctrls, timeout=time_limit,
+                            sizelimit=size_limit
+                        )
+                        while True:
+                            objtype, res_list, _res_id, res_ctrls = (
+                                self.conn.result3(msgid, 0))
+                            if objtype == ldap.RES_SEARCH_RESULT:
+                                break
+                            for entry in self._convert_result(res_list):
+                                yield entry
+                        msgid = None
+                    except ldap.ADMINLIMIT_EXCEEDED:
+                        result.truncated = TRUNCATED_ADMIN_LIMIT
+                    except ldap.SIZELIMIT_EXCEEDED:
+                        result.truncated = TRUNCATED_SIZE_LIMIT
+                    except ldap.TIMELIMIT_EXCEEDED:
+                        result.truncated = TRUNCATED_TIME_LIMIT
+                    if result.truncated:
+                        msgid = None
+                        cookie = ''
+                        break
+
+                    # Get cookie for the next page
+                    for ctrl in res_ctrls:
+                        if isinstance(ctrl, SimplePagedResultsControl):
+                            cookie = ctrl.cookie
+                            break
+                    else:
+                        cookie = ''
+                    if not cookie:
+                        break
+        finally:
+            # the search was not finished, e.g. the iterator was closed
+            if msgid is not None:
+                try:
+                    self.conn.abandon(msgid)
+                except ldap.LDAPError as e:
+                    logger.warning("Error abandoning search: %s", e)
+            elif cookie:
+                sctrls = [SimplePagedResultsControl(0, 0, cookie)]
+                try:
+                    self.conn.search_ext_s(
+                        str(base_dn), scope, filter, attrs_list,
+                        serverctrls=sctrls, timeout=time_limit,
+                        sizelimit=size_limit)
+                except ldap.LDAPError as e:
+                    logger.warning("Error cancelling paged search: %s", e)
+
     def __get_effective_rights_control(self):
         """Construct a GetEffectiveRights control for current user."""
         bind_dn = self.conn.whoami_s()[4:]
@@ -1577,7 +1879,8 @@ class LDAPClient:
         # remove all [] values (python-ldap hates 'em)
         attrs = dict((k, v) for k, v in entry.raw.items() if v)
 
-        with self.error_handler():
+        with self.error_handler(), \
+                ldap_operation_duration.time(operation='add'):
             attrs = self.encode(attrs)
             self.conn.add_s(str(entry.dn), list(attrs.items()))
 
@@ -1610,8 +1913,10 @@ class LDAPClient:
             new_superior = str(DN(*new_dn[1:]))
 
         with self.error_handler():
-            self.conn.rename_s(str(dn), str(new_rdn), newsuperior=new_superior,
-                               delold=int(del_old))
+            with ldap_operation_duration.time(operation='modrdn'):
+                self.conn.rename_s(str(dn), str(new_rdn),
+                                   newsuperior=new_superior,
+                                   delold=int(del_old))
             time.sleep(.3)  # Give memberOf plugin a chance to work
 
     def update_entry(self, entry):
@@ -1625,7 +1930,8 @@ class LDAPClient:
             raise errors.EmptyModlist()
 
         # pass arguments to python-ldap
-        with self.error_handler():
+        with self.error_handler(), \
+                ldap_operation_duration.time(operation='modify'):
             modlist = [(a, str(b), self.encode(c))
                        for a, b, c in modlist]
             self.conn.modify_s(str(entry.dn), modlist)
@@ -1639,7 +1945,8 @@ class LDAPClient:
         else:
             dn = entry_or_dn.dn
 
-        with self.error_handler():
+        with self.error_handler(), \
+                ldap_operation_duration.time(operation='delete'):
             self.conn.delete_s(str(dn))
 
     def entry_exists(self, dn):
@@ -0,0 +1,277 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Light-weight in-process metrics with Prometheus text exposition
+
+Metrics are kept per process. Every histogram, counter or gauge is kept in
+a `MetricsRegistry`, the module level `registry` is the one exposed by the
+IPA server on /ipa/metrics.
+
+>>> example = MetricsRegistry()
+>>> seconds = example.histogram(
+...     'example_seconds', 'Duration of examples', ('name',))
+>>> with seconds.time(name='doctest'):
+...     pass
+>>> seconds.get(name='doctest')[0]
+1
+"""
+
+import contextlib
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0,
+)
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', r'\\').replace('\n', r'\n')
+        .replace('"', r'\"')
+    )
+
+
+def _format_labels(names, values, extra=()):
+    labels = list(zip(names, values)) + list(extra)
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, _escape(value)) for name, value in labels
+    )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    mtype = None
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "{}: expected labels {}, got {}".format(
+                    self.name, self.labelnames, tuple(labels)))
+        return tuple(labels[name] for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.doc),
+            '# TYPE {} {}'.format(self.name, self.mtype),
+        ]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing value
+    """
+    mtype = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield '{}{} {}'.format(
+                self.name, _format_labels(self.labelnames, key),
+                _format_value(value))
+
+
+class Gauge(_Metric):
+    """
+    Value which can go up and down
+    """
+    mtype = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    _samples = Counter._samples
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'count', 'sum')
+
+    def __init__(self, nbuckets):
+        self.buckets = [0] * nbuckets
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. durations in seconds
+    """
+    mtype = 'histogram'
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            hv = self._values.get(key)
+            if hv is None:
+                hv = self._values[key] = _HistogramValue(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hv.buckets[i] += 1
+                    break
+            hv.count += 1
+            hv.sum += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of the with block in seconds
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def time_iter(self, iterable, **labels):
+        """
+        Observe the time spent producing the items of *iterable*
+
+        Only the time spent in the iterator is counted, not the time the
+        consumer needs between two items, e.g. to send a chunk to the client.
+        The duration is observed once the iterator is exhausted or closed.
+        """
+        elapsed = 0.0
+        it = iter(iterable)
+        try:
+            while True:
+                start = time.monotonic()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.monotonic() - start
+                yield item
+        finally:
+            self.observe(elapsed, **labels)
+
+    def get(self, **labels):
+        """
+        Return (count, sum) of the observations for the given labels
+        """
+        with self._lock:
+            hv = self._values.get(self._key(labels))
+            if hv is None:
+                return 0, 0.0
+            return hv.count, hv.sum
+
+    def _samples(self):
+        for key, hv in sorted(self._values.items()):
+            cumulative = 0
+            bounds = self.buckets + (float('inf'),)
+            counts = hv.buckets + [hv.count - sum(hv.buckets)]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield '{}_bucket{} {}'.format(
+                    self.name,
+                    _format_labels(self.labelnames, key,
+                                   [('le', _format_value(bound))]),
+                    cumulative)
+            labels = _format_labels(self.labelnames, key)
+            yield '{}_sum{} {}'.format(self.name, labels, repr(hv.sum))
+            yield '{}_count{} {}'.format(self.name, labels, hv.count)
+
+
+class MetricsRegistry:
+    """
+    Collection of named metrics
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(
+                    "metric {} already registered as {}".format(
+                        name, metric.mtype))
+            return metric
+
+    def counter(self, name, doc, labelnames=()):
+        return self._register(Counter, name, doc, labelnames)
+
+    def gauge(self, name, doc, labelnames=()):
+        return self._register(Gauge, name, doc, labelnames)
+
+    def histogram(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, doc, labelnames, buckets)
+
+    def add_collector(self, name, collector):
+        """
+        Add a callable which returns extra metrics at exposition time
+
+        The callable takes no arguments and returns an iterable of metrics
+        (e.g. counters filled from counters maintained elsewhere). A collector
+        added under the name of a previous one replaces it.
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors.values())
+        for collector in collectors:
+            metrics.extend(collector())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        lines.append('')
+        return '\n'.join(lines)
+
+
+registry = MetricsRegistry()
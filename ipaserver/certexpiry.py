@@ -0,0 +1,221 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Per-process index of the expiration dates of the certificates in LDAP.
+
+Finding the certificates which expire in the next days otherwise requires
+a search for every ``userCertificate`` in the tree and parsing all the
+certificates found on every request. The index keeps one compact row per
+certificate and owner, (not after, issuer, serial number, owner DN), sorted
+by the expiration date, so that expiry windows are answered by bisection.
+
+The index is built on first use by a paged scan of the tree which parses
+the certificates as they are received. Afterwards it is kept current the
+same way as `ipaserver.membership.MembershipGraph`: when the ``lastusn``
+attribute of the root DSE changed, only the entries with a higher entryUSN
+are read again. Owners are tracked by their nsUniqueId, so renamed entries
+are recognized, and deleted entries are found by the entryUSN of their
+tombstones. Without the entryUSN plugin the index is rebuilt instead.
+
+The index holds the certificates of all entries. It must be refreshed with
+a connection which may read all of them, and the rows it returns have to
+be filtered by what the requester may read.
+"""
+
+from __future__ import absolute_import
+
+import bisect
+import logging
+import threading
+import time
+
+from ipalib import errors
+from ipalib import x509
+from ipapython.dn import DN
+
+logger = logging.getLogger(__name__)
+
+CERT_FILTER = '(usercertificate=*)'
+CERT_ATTRS = ['usercertificate', 'usercertificate;binary']
+TOMBSTONE_FILTER = '(objectclass=nstombstone)'
+
+
+class CertExpiryIndex:
+    """
+    Thread-safe index of certificates ordered by their expiration date.
+
+    Rows are ``(not_after, issuer, serial_number, owner)`` tuples, where
+    ``not_after`` is a naive UTC datetime, ``issuer`` and ``owner`` are DNs.
+    """
+
+    def __init__(self, poll_interval=0):
+        """
+        :param poll_interval: minimum number of seconds between two checks
+            for changes in the directory, 0 checks before every use
+        """
+        self.poll_interval = poll_interval
+
+        self._lock = threading.RLock()
+        # all rows, sorted
+        self._rows = []
+        # owner DN -> list of its rows
+        self._by_owner = {}
+        # nsUniqueId -> owner DN
+        self._owners = {}
+
+        self.last_usn = None
+        self._next_poll = None
+
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def _iter_rows(self, ldap, basedn, filter):
+        """
+        Yield (owner DN, nsUniqueId, rows) for the entries matching filter
+        """
+        result = ldap.iter_entries(
+            filter, CERT_ATTRS + ['nsuniqueid'], basedn,
+            time_limit=0, size_limit=-1)
+        with result:
+            for entry in result:
+                rows = []
+                for attr in CERT_ATTRS:
+                    for value in entry.raw.get(attr, []):
+                        try:
+                            cert = x509.load_der_x509_certificate(value)
+                            rows.append((cert.not_valid_after,
+                                         DN(cert.issuer),
+                                         cert.serial_number,
+                                         entry.dn))
+                        except ValueError:
+                            logger.warning(
+                                "Skipping invalid certificate of %s",
+                                entry.dn)
+                yield entry.dn, entry.single_value.get('nsuniqueid'), rows
+        ldap.handle_truncated_result(result.truncated)
+
+    def _iter_deleted(self, ldap, basedn, last_usn):
+        """
+        Yield the nsUniqueIds of the entries deleted after last_usn
+        """
+        result = ldap.iter_entries(
+            '(&{}(entryusn>={}))'.format(TOMBSTONE_FILTER, last_usn + 1),
+            ['nsuniqueid'], basedn, time_limit=0, size_limit=-1)
+        with result:
+            for entry in result:
+                yield entry.single_value.get('nsuniqueid')
+        ldap.handle_truncated_result(result.truncated)
+
+    def _get_last_usn(self, ldap):
+        try:
+            entry = ldap.get_entry(DN(), ['lastusn'])
+        except errors.NotFound:
+            return None
+        value = entry.single_value.get('lastusn')
+        if value is None:
+            return None
+        return int(value)
+
+    def _set_rows(self, owner, rows):
+        for row in self._by_owner.pop(owner, ()):
+            i = bisect.bisect_left(self._rows, row)
+            if i < len(self._rows) and self._rows[i] == row:
+                del self._rows[i]
+        rows = sorted(set(rows))
+        if rows:
+            self._by_owner[owner] = rows
+            for row in rows:
+                bisect.insort(self._rows, row)
+
+    def _load(self, ldap, basedn):
+        by_owner = {}
+        owners = {}
+        for owner, unique_id, rows in self._iter_rows(
+                ldap, basedn, CERT_FILTER):
+            if rows:
+                by_owner[owner] = sorted(set(rows))
+                owners[unique_id] = owner
+        with self._lock:
+            self._by_owner = by_owner
+            self._owners = owners
+            self._rows = sorted(
+                row for rows in by_owner.values() for row in rows)
+        self.full_loads += 1
+
+    def _update(self, ldap, basedn, last_usn):
+        # entries whose certificates were removed are read as well
+        changed = list(self._iter_rows(
+            ldap, basedn, '(entryusn>={})'.format(last_usn + 1)))
+        deleted = list(self._iter_deleted(ldap, basedn, last_usn))
+        with self._lock:
+            for unique_id in deleted:
+                owner = self._owners.pop(unique_id, None)
+                if owner is not None:
+                    self._set_rows(owner, [])
+            for owner, unique_id, rows in changed:
+                former = self._owners.pop(unique_id, None)
+                if former is not None and former != owner:
+                    # the entry was renamed
+                    self._set_rows(former, [])
+                self._set_rows(owner, rows)
+                if rows:
+                    self._owners[unique_id] = owner
+        self.incremental_loads += 1
+
+    def _is_current(self, now):
+        return self._next_poll is not None and now < self._next_poll
+
+    def refresh(self, ldap, basedn):
+        """
+        Bring the index up to date if ``poll_interval`` has elapsed
+
+        :param ldap: connected LDAPClient which may read all certificates
+        :param basedn: base DN of the IPA tree
+        """
+        now = time.time()
+        if self._is_current(now):
+            return
+
+        with self._lock:
+            if self._is_current(now):
+                # another thread refreshed the index meanwhile
+                return
+            usn = self._get_last_usn(ldap)
+            if usn is None or self.last_usn is None:
+                self._load(ldap, basedn)
+            elif usn != self.last_usn:
+                self._update(ldap, basedn, self.last_usn)
+            self.last_usn = usn
+            self._next_poll = now + self.poll_interval
+
+    def find(self, start=None, end=None, issuer=None):
+        """
+        Return the rows with ``start <= not_after < end``, soonest first
+
+        :param start: naive UTC datetime, ``None`` for no lower bound
+        :param end: naive UTC datetime, ``None`` for no upper bound
+        :param issuer: only return certificates issued by this DN
+        """
+        with self._lock:
+            lo = 0
+            if start is not None:
+                lo = bisect.bisect_left(self._rows, (start,))
+            hi = len(self._rows)
+            if end is not None:
+                hi = bisect.bisect_left(self._rows, (end,))
+            rows = self._rows[lo:hi]
+        if issuer is not None:
+            rows = [row for row in rows if row[1] == issuer]
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                certificates=len(self._rows),
+                owners=len(self._by_owner),
+                last_usn=self.last_usn,
+                full_loads=self.full_loads,
+                incremental_loads=self.incremental_loads,
+            )
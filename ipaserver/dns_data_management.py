@@ -5,6 +5,7 @@
 from __future__ import absolute_import
 
 import logging
+import threading
 
 import six
 
@@ -21,6 +22,8 @@ from time import sleep, time
 
 from ipalib import errors
 from ipalib.dns import record_name_format
+from ipalib.request import context
+from ipapython.dn import DN
 from ipapython.dnsutil import DNSName, resolve_rrsets
 
 if six.PY3:
@@ -57,6 +60,37 @@ IPA_DEFAULT_NTP_SRV_REC = (
 
 CA_RECORDS_DNS_TIMEOUT = 30  # timeout in seconds
 
+# (principal, all_servers) -> (signature of the master entries, servers
+# data) and principal -> (signature of the location entries, location names),
+# least recently used first. The data are read with the permissions of the
+# principal, so they are not shared between principals.
+_servers_cache = OrderedDict()
+_locations_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# maximum number of entries of each cache
+CACHE_SIZE = 16
+
+
+def _cache_get(cache, key, signature):
+    if signature is None:
+        return None
+    with _cache_lock:
+        cached = cache.get(key)
+        if cached is None or cached[0] != signature:
+            return None
+        cache.move_to_end(key)
+        return cached[1]
+
+
+def _cache_put(cache, key, signature, value):
+    if signature is None:
+        return
+    with _cache_lock:
+        cache[key] = (signature, value)
+        cache.move_to_end(key)
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
 
 class IPADomainIsNotManagedByIPAError(Exception):
     pass
@@ -92,7 +126,38 @@ class IPASystemRecords:
     def __get_location_suffix(self, location):
         return location + DNSName('_locations') + self.domain_abs
 
+    def __get_signature(self, container):
+        """
+        Return the signature of the entries in the container or None
+
+        Without the entryUSN plugin modifications of the entries cannot be
+        detected and None is returned, the data must not be cached then.
+        """
+        ldap = self.api_instance.Backend.ldap2
+        signature = ldap.get_entries_signature(
+            '(objectclass=*)',
+            DN(container, self.api_instance.env.basedn),
+            scope=ldap.SCOPE_SUBTREE)
+        if not signature[1]:
+            return None
+        return signature
+
     def __init_data(self, all_servers=False):
+        """
+        Load the servers, their locations and roles
+
+        The data are cached per process and principal until a master entry
+        or one of its service entries is added, modified or removed. The
+        records depend only on the roles provided by the service entries.
+        """
+        signature = self.__get_signature(
+            self.api_instance.env.container_masters)
+        key = (getattr(context, 'principal', None), all_servers)
+        cached = _cache_get(_servers_cache, key, signature)
+        if cached is not None:
+            self.servers_data = OrderedDict(cached)
+            return
+
         self.servers_data.clear()
 
         kwargs = dict(no_members=False)
@@ -109,6 +174,22 @@ class IPASystemRecords:
                 'roles': roles,
             }
 
+        _cache_put(_servers_cache, key, signature,
+                   OrderedDict(self.servers_data))
+
+    def __get_locations(self):
+        signature = self.__get_signature(
+            self.api_instance.env.container_locations)
+        key = getattr(context, 'principal', None)
+        cached = _cache_get(_locations_cache, key, signature)
+        if cached is not None:
+            return list(cached)
+
+        locations_result = self.api_instance.Command.location_find()['result']
+        locations = [l['idnsname'][0] for l in locations_result]
+        _cache_put(_locations_cache, key, signature, locations)
+        return list(locations)
+
     def __add_srv_records(
         self, zone_obj, hostname, rname_port_map,
         weight=100, priority=0, location=None
@@ -272,18 +353,78 @@ class IPASystemRecords:
                 update_dict[option_name].append(unicode(rdata.to_text()))
         return update_dict
 
+    def __get_current_records(self, record_names):
+        """
+        Return a dict of record name -> LDAP entry of the existing records
+
+        All entries are read with a single search, so that only the records
+        which differ from the expected ones have to be updated.
+        """
+        ldap = self.api_instance.Backend.ldap2
+        zone_dn = self.api_instance.Object.dnszone.get_dn(self.domain_abs)
+
+        names = {}
+        relative_names = []
+        for record_name in record_names:
+            relative_name = record_name.relativize(self.domain_abs).ToASCII()
+            names[DN(('idnsname', relative_name), zone_dn)] = record_name
+            relative_names.append(relative_name)
+        if not names:
+            return {}
+
+        current = {}
+        result = ldap.iter_entries(
+            ldap.make_filter_from_attr(
+                'idnsname', relative_names, ldap.MATCH_ANY),
+            ['*'], zone_dn, scope=ldap.SCOPE_ONELEVEL,
+            time_limit=0, size_limit=-1)
+        with result:
+            for entry in result:
+                record_name = names.get(entry.dn)
+                if record_name is not None:
+                    current[record_name] = entry
+        ldap.handle_truncated_result(result.truncated)
+        return current
+
+    def __is_up_to_date(self, entry, update_dict, cname_template=None):
+        if entry is None:
+            return False
+        for attr, values in update_dict.items():
+            if set(entry.get(attr, [])) != set(values):
+                return False
+        if cname_template is not None:
+            objectclasses = [oc.lower() for oc in entry.get('objectclass', [])]
+            if 'idnstemplateobject' not in objectclasses:
+                return False
+            if (entry.get('idnsTemplateAttribute;cnamerecord') !=
+                    [cname_template]):
+                return False
+        return True
+
     def __update_dns_records(
-            self, record_name, nodes, set_cname_template=True
+            self, record_name, nodes, set_cname_template=True, entry=None
     ):
+        """
+        Set the records of a name unless the entry already contains them
+
+        :param entry: current LDAP entry of the name, None if unknown
+        :return: True if the records were written
+        """
         update_dict = self.__prepare_records_update_dict(nodes)
+        cname_template_value = (
+            u'%s.\{substitutionvariable_ipalocation\}._locations' %
+            record_name.relativize(self.domain_abs))
         cname_template = {
             'addattr': [u'objectclass=idnsTemplateObject'],
             'setattr': [
-                u'idnsTemplateAttribute;cnamerecord=%s'
-                u'.\{substitutionvariable_ipalocation\}._locations' %
-                record_name.relativize(self.domain_abs)
+                u'idnsTemplateAttribute;cnamerecord=%s' % cname_template_value
             ]
         }
+        if self.__is_up_to_date(
+                entry, update_dict,
+                cname_template_value if set_cname_template else None):
+            return False
+
         try:
             if set_cname_template:
                 # only srv records should have configured cname templates
@@ -310,6 +451,7 @@ class IPASystemRecords:
                     pass
         except errors.EmptyModlist:
             pass
+        return True
 
     def get_base_records(
             self, servers=None, roles=None, include_master_role=True,
@@ -353,8 +495,7 @@ class IPASystemRecords:
         if servers is None:
             servers = list(self.servers_data)
 
-        locations_result = self.api_instance.Command.location_find()['result']
-        locations = [l['idnsname'][0] for l in locations_result]
+        locations = self.__get_locations()
 
         for server in servers:
             self._get_location_dns_records_for_server(
@@ -381,15 +522,20 @@ class IPASystemRecords:
         )
 
         base_zone = self.get_base_records()
+        current = self.__get_current_records(base_zone.keys())
+        updated = 0
         for record_name, node in base_zone.items():
             set_cname_template = record_name in names_requiring_cname_templates
             try:
-                self.__update_dns_records(
-                    record_name, node, set_cname_template)
+                updated += self.__update_dns_records(
+                    record_name, node, set_cname_template,
+                    entry=current.get(record_name))
             except errors.PublicError as e:
                 fail.append((record_name, node, e))
             else:
                 success.append((record_name, node))
+        logger.debug("Updated %d of %d IPA system record names",
+                     updated, len(base_zone.nodes))
         return success, fail
 
     def update_locations_records(self):
@@ -403,15 +549,20 @@ class IPASystemRecords:
         success = []
 
         location_zone = self.get_locations_records()
+        current = self.__get_current_records(location_zone.keys())
+        updated = 0
         for record_name, nodes in location_zone.items():
             try:
-                self.__update_dns_records(
+                updated += self.__update_dns_records(
                     record_name, nodes,
-                    set_cname_template=False)
+                    set_cname_template=False,
+                    entry=current.get(record_name))
             except errors.PublicError as e:
                 fail.append((record_name, nodes, e))
             else:
                 success.append((record_name, nodes))
+        logger.debug("Updated %d of %d IPA location record names",
+                     updated, len(location_zone.nodes))
         return success, fail
 
     def update_dns_records(self):
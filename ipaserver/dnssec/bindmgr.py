@@ -5,6 +5,7 @@
 from __future__ import absolute_import
 
 from datetime import datetime
+import hashlib
 import logging
 
 import dns.name
@@ -31,6 +32,15 @@ time_bindfmt = '%Y%m%d%H%M%S'
 FILE_PERM = (stat.S_IRUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IWUSR)
 DIR_PERM = (stat.S_IRWXU | stat.S_IRWXG)
 
+# attributes of idnsSecKey objects used to generate BIND key files
+KEY_ATTRS = (
+    'dn', 'idnsSecKeyZone', 'idnsSecKeyRef', 'idnsSecAlgorithm',
+    'idnsSecKeyPublish', 'idnsSecKeyActivate', 'idnsSecKeyInactive',
+    'idnsSecKeyDelete', 'idnsSecKeySep', 'idnsSecKeyRevoke',
+)
+# suffixes of the files written for a single key
+KEY_FILE_SUFFIXES = ('.key', '.private', '.uuid', '.dn')
+
 
 class BINDMgr:
     """BIND key manager. It does LDAP->BIND key files synchronization.
@@ -42,6 +52,9 @@ class BINDMgr:
         self.api = api
         self.ldap_keys = {}
         self.modified_zones = set()
+        # zone -> {uuid: (key attributes hash, base file name)} of the keys
+        # installed in BIND key directory of the zone by this instance
+        self.installed_keys = {}
 
     def notify_zone(self, zone):
         cmd = ['rndc', 'sign', zone.to_text()]
@@ -145,6 +158,27 @@ class BINDMgr:
             uuid_file.write(uuid)
         with open("%s/%s.dn" % (workdir, basename), 'w') as dn_file:
             dn_file.write(attrs['dn'])
+        return basename
+
+    def key_hash(self, attrs):
+        """Return hash of the key attributes which affect BIND key files."""
+        h = hashlib.sha256()
+        for attr in KEY_ATTRS:
+            h.update(repr((attr, attrs.get(attr))).encode('utf-8'))
+        return h.hexdigest()
+
+    def fix_hsm_permissions(self):
+        """Make the HSM token files accessible to both ODS and named."""
+        for prefix, dirs, files in os.walk(paths.DNSSEC_TOKENS_DIR,
+                                           topdown=True):
+            for name in dirs:
+                fpath = os.path.join(prefix, name)
+                logger.debug('Fixing directory permissions: %s', fpath)
+                os.chmod(fpath, DIR_PERM | stat.S_ISGID)
+            for name in files:
+                fpath = os.path.join(prefix, name)
+                logger.debug('Fixing file permissions: %s', fpath)
+                os.chmod(fpath, FILE_PERM)
 
     def get_zone_dir_name(self, zone):
         """Escape zone name to form suitable for file-system.
@@ -171,32 +205,21 @@ class BINDMgr:
         # strip trailing period
         return ''.join(escaped[:-1])
 
-    def sync_zone(self, zone):
-        logger.info('Synchronizing zone %s', zone)
-        zone_path = os.path.join(paths.BIND_LDAP_DNS_ZONE_WORKDIR,
-                self.get_zone_dir_name(zone))
-        try:
-            os.makedirs(zone_path)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise e
-
-        # fix HSM permissions
-        # TODO: move out
-        for prefix, dirs, files in os.walk(paths.DNSSEC_TOKENS_DIR, topdown=True):
-            for name in dirs:
-                fpath = os.path.join(prefix, name)
-                logger.debug('Fixing directory permissions: %s', fpath)
-                os.chmod(fpath, DIR_PERM | stat.S_ISGID)
-            for name in files:
-                fpath = os.path.join(prefix, name)
-                logger.debug('Fixing file permissions: %s', fpath)
-                os.chmod(fpath, FILE_PERM)
-        # TODO: move out
+    def remove_key_files(self, keys_dir, basename):
+        for suffix in KEY_FILE_SUFFIXES:
+            try:
+                os.unlink(os.path.join(keys_dir, basename + suffix))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise e
 
+    def install_zone_keys(self, zone, zone_path):
+        """Generate all keys of the zone and replace the key directory."""
+        installed = {}
         with TemporaryDirectory(zone_path) as tempdir:
-            for uuid, attrs in self.ldap_keys[zone].items():
-                self.install_key(zone, uuid, attrs, tempdir)
+            for uuid, attrs in self.ldap_keys.get(zone, {}).items():
+                basename = self.install_key(zone, uuid, attrs, tempdir)
+                installed[uuid] = (self.key_hash(attrs), basename)
             # keys were generated in a temporary directory, swap directories
             target_dir = "%s/keys" % zone_path
             try:
@@ -206,6 +229,62 @@ class BINDMgr:
                     raise e
             shutil.move(tempdir, target_dir)
             os.chmod(target_dir, DIR_PERM)
+        self.installed_keys[zone] = installed
+
+    def update_zone_keys(self, zone, zone_path):
+        """Install, replace and remove only the keys which changed.
+
+        :returns: True if the key directory was modified
+        """
+        installed = self.installed_keys[zone]
+        ldap_keys = self.ldap_keys.get(zone, {})
+        target_dir = "%s/keys" % zone_path
+
+        changed = {}
+        for uuid, attrs in ldap_keys.items():
+            key_hash = self.key_hash(attrs)
+            if uuid not in installed or installed[uuid][0] != key_hash:
+                changed[uuid] = (key_hash, attrs)
+        removed = [uuid for uuid in installed
+                   if uuid not in ldap_keys or uuid in changed]
+        if not changed and not removed:
+            return False
+        logger.debug('Zone %s: %d keys to install, %d to remove',
+                     zone, len(changed), len(removed))
+
+        for uuid in removed:
+            _key_hash, basename = installed.pop(uuid)
+            logger.info('Removing key %s (%s) of zone %s',
+                        uuid, basename, zone)
+            self.remove_key_files(target_dir, basename)
+
+        # keys are generated in a temporary directory and moved to place
+        # file by file, so BIND never sees incomplete key files
+        with TemporaryDirectory(zone_path) as tempdir:
+            for uuid, (key_hash, attrs) in changed.items():
+                basename = self.install_key(zone, uuid, attrs, tempdir)
+                for name in os.listdir(tempdir):
+                    os.rename(os.path.join(tempdir, name),
+                              os.path.join(target_dir, name))
+                installed[uuid] = (key_hash, basename)
+        return True
+
+    def sync_zone(self, zone):
+        logger.info('Synchronizing zone %s', zone)
+        zone_path = os.path.join(paths.BIND_LDAP_DNS_ZONE_WORKDIR,
+                self.get_zone_dir_name(zone))
+        try:
+            os.makedirs(zone_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise e
+
+        if zone not in self.installed_keys:
+            # the key directory may contain keys left by previous runs
+            self.install_zone_keys(zone, zone_path)
+        elif not self.update_zone_keys(zone, zone_path):
+            logger.debug('Keys of zone %s are up to date', zone)
+            return
 
         self.notify_zone(zone)
 
@@ -222,7 +301,11 @@ class BINDMgr:
         logger.debug('Key metadata in LDAP: %s', self.ldap_keys)
         logger.debug('Zones modified but skipped during bindmgr.sync: %s',
                      self.modified_zones - dnssec_zones)
-        for zone in self.modified_zones.intersection(dnssec_zones):
+        zones = self.modified_zones.intersection(dnssec_zones)
+        if zones:
+            # keys of all zones are stored in the same HSM token
+            self.fix_hsm_permissions()
+        for zone in zones:
             self.sync_zone(zone)
 
         self.modified_zones = set()
@@ -5,6 +5,7 @@
 from __future__ import absolute_import
 
 import logging
+import time
 
 import ldap.dn
 import os
@@ -23,12 +24,31 @@ logger = logging.getLogger(__name__)
 SIGNING_ATTR = 'idnsSecInlineSigning'
 OBJCLASS_ATTR = 'objectClass'
 
+# number of seconds to collect LDAP changes before a sync pass is run
+SYNC_DELAY = 2
+# shortest timeout for polling LDAP changes, python-ldap does not wait for
+# results at all with a timeout of 0
+MIN_POLL_TIMEOUT = 0.01
+
+# synchronization steps, in the order in which a sync pass runs them
+SYNC_ODS = 'ods'
+SYNC_HSM_MASTER = 'hsm_master'
+SYNC_HSM_REPLICA = 'hsm_replica'
+SYNC_BIND = 'bind'
+# download of keys to the replica HSM after removal of BIND keys. It is run
+# even if the pass downloaded the keys before, because BIND may still use a
+# deleted key until SYNC_BIND ran, e.g. during a key rollover.
+SYNC_HSM_REPLICA_CLEANUP = 'hsm_replica_cleanup'
+SYNC_STEPS = (SYNC_ODS, SYNC_HSM_MASTER, SYNC_HSM_REPLICA, SYNC_BIND,
+              SYNC_HSM_REPLICA_CLEANUP)
+
 
 class KeySyncer(SyncReplConsumer):
     def __init__(self, *args, **kwargs):
         # hack
         self.api = kwargs['ipa_api']
         del kwargs['ipa_api']
+        self.sync_delay = kwargs.pop('sync_delay', SYNC_DELAY)
 
         # DNSSEC master should have OpenDNSSEC installed
         # TODO: Is this the best way?
@@ -41,8 +61,64 @@ class KeySyncer(SyncReplConsumer):
         self.bindmgr = BINDMgr(self.api)
         self.init_done = False
         self.dnssec_zones = set()
+
+        # steps requested since the last sync pass and when to run them
+        self.pending_steps = set()
+        self.sync_deadline = None
+        self.counters = dict(events=0, passes=0, events_in_pass=0)
+        self.counters.update((step, 0) for step in SYNC_STEPS)
+
         SyncReplConsumer.__init__(self, *args, **kwargs)
 
+    def schedule_sync(self, step):
+        """Request a synchronization step in the next sync pass.
+
+        Steps requested within sync_delay seconds are coalesced and run
+        once by run_pending_sync().
+        """
+        if not self.init_done:
+            return
+        self.pending_steps.add(step)
+        if self.sync_deadline is None:
+            self.sync_deadline = time.time() + self.sync_delay
+
+    def sync_timeout(self):
+        """Return the number of seconds until the next sync pass is due.
+
+        None is returned when no sync pass is pending. The timeout is never
+        shorter than MIN_POLL_TIMEOUT, even if the pass is overdue.
+        """
+        if self.sync_deadline is None:
+            return None
+        return max(MIN_POLL_TIMEOUT, self.sync_deadline - time.time())
+
+    def run_pending_sync(self, force=False):
+        """Run a sync pass if one is pending and its time has come."""
+        if not self.pending_steps:
+            return
+        if not force and time.time() < self.sync_deadline:
+            return
+
+        steps = self.pending_steps
+        self.pending_steps = set()
+        self.sync_deadline = None
+
+        self.counters['passes'] += 1
+        logger.info('Sync pass %d: %d LDAP events, steps: %s',
+                    self.counters['passes'], self.counters['events_in_pass'],
+                    ', '.join(s for s in SYNC_STEPS if s in steps))
+        self.counters['events_in_pass'] = 0
+
+        for step in SYNC_STEPS:
+            if step in steps:
+                self.counters[step] += 1
+                getattr(self, 'run_%s_sync' % step)()
+        logger.debug('Sync counters: %s', self.counters)
+
+    def count_event(self):
+        self.counters['events'] += 1
+        self.counters['events_in_pass'] += 1
+
     def _get_objclass(self, attrs):
         """Get object class.
 
@@ -77,6 +153,7 @@ class KeySyncer(SyncReplConsumer):
         return vals[0].startswith(b'dnssec-replica:')
 
     def application_add(self, uuid, dn, newattrs):
+        self.count_event()
         objclass = self._get_objclass(newattrs)
         if objclass == b'idnszone':
             self.zone_add(uuid, dn, newattrs)
@@ -87,6 +164,7 @@ class KeySyncer(SyncReplConsumer):
             self.hsm_master_sync()
 
     def application_del(self, uuid, dn, oldattrs):
+        self.count_event()
         objclass = self._get_objclass(oldattrs)
         if objclass == b'idnszone':
             self.zone_del(uuid, dn, oldattrs)
@@ -97,6 +175,7 @@ class KeySyncer(SyncReplConsumer):
             self.hsm_master_sync()
 
     def application_sync(self, uuid, dn, newattrs, oldattrs):
+        self.count_event()
         objclass = self._get_objclass(oldattrs)
         if objclass == b'idnszone':
             olddn = ldap.dn.str2dn(oldattrs['dn'])
@@ -125,7 +204,8 @@ class KeySyncer(SyncReplConsumer):
         self.ods_sync()
         self.hsm_replica_sync()
         self.hsm_master_sync()
-        self.bindmgr.sync(self.dnssec_zones)
+        self.bindmgr_sync()
+        self.run_pending_sync(force=True)
 
     # idnsSecKey wrapper
     # Assumption: metadata points to the same key blob all the time,
@@ -134,20 +214,23 @@ class KeySyncer(SyncReplConsumer):
     def key_meta_add(self, uuid, dn, newattrs):
         self.hsm_replica_sync()
         self.bindmgr.ldap_event('add', uuid, newattrs)
-        self.bindmgr_sync(self.dnssec_zones)
+        self.bindmgr_sync()
 
     def key_meta_del(self, uuid, dn, oldattrs):
         self.bindmgr.ldap_event('del', uuid, oldattrs)
-        self.bindmgr_sync(self.dnssec_zones)
-        self.hsm_replica_sync()
+        self.bindmgr_sync()
+        if not self.ismaster:
+            self.schedule_sync(SYNC_HSM_REPLICA_CLEANUP)
 
     def key_metadata_sync(self, uuid, dn, oldattrs, newattrs):
         self.bindmgr.ldap_event('mod', uuid, newattrs)
-        self.bindmgr_sync(self.dnssec_zones)
+        self.bindmgr_sync()
 
-    def bindmgr_sync(self, dnssec_zones):
-        if self.init_done:
-            self.bindmgr.sync(dnssec_zones)
+    def bindmgr_sync(self):
+        self.schedule_sync(SYNC_BIND)
+
+    def run_bind_sync(self):
+        self.bindmgr.sync(self.dnssec_zones)
 
     # idnsZone wrapper
     def zone_add(self, uuid, dn, newattrs):
@@ -178,25 +261,31 @@ class KeySyncer(SyncReplConsumer):
     def ods_sync(self):
         if not self.ismaster:
             return
+        self.schedule_sync(SYNC_ODS)
 
-        if self.init_done:
-            self.odsmgr.sync()
+    def run_ods_sync(self):
+        self.odsmgr.sync()
 
     # triggered by modification to idnsSecKey objects
     def hsm_replica_sync(self):
-        """Download keys from LDAP to local HSM."""
         if self.ismaster:
             return
-        if not self.init_done:
-            return
+        self.schedule_sync(SYNC_HSM_REPLICA)
+
+    def run_hsm_replica_sync(self):
+        """Download keys from LDAP to local HSM."""
         ipautil.run([paths.IPA_DNSKEYSYNCD_REPLICA])
 
+    def run_hsm_replica_cleanup_sync(self):
+        self.run_hsm_replica_sync()
+
     # triggered by modification to ipk11PublicKey objects
     def hsm_master_sync(self):
-        """Download replica keys from LDAP to local HSM
-        & upload master and zone keys to LDAP."""
         if not self.ismaster:
             return
-        if not self.init_done:
-            return
+        self.schedule_sync(SYNC_HSM_MASTER)
+
+    def run_hsm_master_sync(self):
+        """Download replica keys from LDAP to local HSM
+        & upload master and zone keys to LDAP."""
         ipautil.run([paths.ODS_SIGNER, 'ipa-hsm-update'])
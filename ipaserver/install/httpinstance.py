@@ -43,7 +43,7 @@ from ipapython import ipautil
 from ipapython.dn import DN
 import ipapython.errors
 from ipaserver.install import sysupgrade
-from ipalib import api, x509
+from ipalib import api, create_api, x509
 from ipalib.constants import IPAAPI_USER, MOD_SSL_VERIFY_DEPTH
 from ipaplatform.constants import constants
 from ipaplatform.tasks import tasks
@@ -141,6 +141,7 @@ class HTTPInstance(service.Service):
         if not self.is_kdcproxy_configured():
             self.step("create KDC proxy config", self.create_kdcproxy_conf)
             self.step("enable KDC proxy", self.enable_kdcproxy)
+        self.step("writing API plugin snapshot", self.write_plugin_snapshot)
         self.step("starting httpd", self.start)
         self.step("configuring httpd to start on boot", self.__enable)
         self.step("enabling oddjobd", self.enable_and_start_oddjobd)
@@ -439,6 +440,21 @@ class HTTPInstance(service.Service):
         # only run during installation
         x509.write_certificate_list(certlist, paths.CA_CRT, mode=0o644)
 
+    def write_plugin_snapshot(self):
+        """
+        Write the plugin registry snapshot loaded by the WSGI workers
+        """
+        snapshot_api = create_api(mode=None)
+        snapshot_api.bootstrap(
+            context='server', in_server=True, confdir=paths.ETC_IPA,
+            plugins_on_demand=True, plugin_snapshot=None, log=None)
+        snapshot_api.finalize()
+        try:
+            snapshot_api.save_plugin_snapshot(paths.IPA_PLUGIN_SNAPSHOT)
+        except (ValueError, OSError) as e:
+            logger.warning("Failed to write plugin snapshot: %s", e)
+            installutils.remove_file(paths.IPA_PLUGIN_SNAPSHOT)
+
     def is_kdcproxy_configured(self):
         """Check if KDC proxy has already been configured in the past"""
         return os.path.isfile(paths.HTTPD_IPA_KDCPROXY_CONF)
@@ -539,6 +555,7 @@ class HTTPInstance(service.Service):
             paths.GSSAPI_SESSION_KEY,
             paths.HTTPD_PASSWORD_CONF,
             paths.SYSTEMD_SYSTEM_HTTPD_IPA_CONF,
+            paths.IPA_PLUGIN_SNAPSHOT,
         ]
         # NSS DB backups
         remove_files.extend(
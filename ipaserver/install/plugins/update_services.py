@@ -47,15 +47,14 @@ class update_service_principalalias(Updater):
 
         while True:
             # run the search in loop to avoid issues when LDAP limits are hit
-            # during update
+            # during update. The entries are collected before they are
+            # updated, modifying them while the paged search is still running
+            # on the same connection would invalidate its cookie.
             try:
-                (entries, truncated) = ldap.find_entries(search_filter,
-                    ['objectclass', 'krbprincipalname'], base_dn,
-                    time_limit=0, size_limit=0)
-            except errors.NotFound:
-                logger.debug("update_service_principalalias: no service "
-                             "to update found")
-                return False, []
+                with ldap.iter_entries(search_filter,
+                        ['objectclass', 'krbprincipalname'], base_dn,
+                        time_limit=0, size_limit=0) as result:
+                    entries = list(result)
             except errors.ExecutionError as e:
                 logger.error("update_service_principalalias: cannot "
                              "retrieve list of affected services: %s", e)
@@ -63,8 +62,9 @@ class update_service_principalalias(Updater):
             if not entries:
                 # no entry was returned, rather break than continue cycling
                 logger.debug("update_service_principalalias: no service "
-                             "was returned")
+                             "to update found")
                 return False, []
+            truncated = result.truncated
             logger.debug("update_service_principalalias: found %d "
                          "services to update, truncated: %s",
                          len(entries), truncated)
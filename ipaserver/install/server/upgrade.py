@@ -1927,6 +1927,7 @@ def upgrade_configuration():
     migrate_to_mod_ssl(http)
     update_http_keytab(http)
     http.configure_gssproxy()
+    http.write_plugin_snapshot()
     http.start()
 
     uninstall_selfsign(ds, http)
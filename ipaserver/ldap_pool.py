@@ -0,0 +1,269 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Per-process pool of authenticated LDAP connections.
+
+The WSGI workers create a new LDAP connection and perform a SASL GSSAPI bind
+for every request. The pool keeps bound python-ldap connections keyed by
+``(principal, ccache)`` so that subsequent requests of the same client can
+reuse them as long as the Kerberos credentials used for the bind are valid.
+
+Idle connections are evicted in LRU order when the pool is full and after
+they were not used for ``ttl`` seconds.
+
+Data which a worker keeps for all requests, like the group membership graph,
+is read through a separate `ServiceConnection` bound as the IPA server, so
+that it does not depend on the read permissions of the principal whose
+request happened to load it.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import itertools
+import logging
+import threading
+import time
+
+from ipalib import errors
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledConnection:
+    """
+    Book-keeping data of a connection owned by the pool.
+    """
+
+    def __init__(self, key, conn, expires):
+        self.key = key
+        self.conn = conn
+        self.expires = expires
+        self.created = time.time()
+        self.last_used = self.created
+
+
+class LDAPConnectionPool:
+    """
+    Thread-safe LRU/TTL pool of bound LDAP connections.
+
+    A connection is either checked out by exactly one thread or idle in the
+    pool; it is never shared by two requests at the same time.
+    """
+
+    def __init__(self, max_size=8, ttl=300, validate_interval=30):
+        """
+        :param max_size: maximum number of idle connections kept in the pool
+        :param ttl: number of seconds an idle connection is kept
+        :param validate_interval: connections idle for longer than this
+            number of seconds are probed with a WhoAmI request before reuse
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.validate_interval = validate_interval
+
+        self._lock = threading.Lock()
+        self._serial = itertools.count()
+        # (key, serial) -> _PooledConnection, least recently used first
+        self._idle = collections.OrderedDict()
+        # id(conn) -> _PooledConnection
+        self._in_use = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _close(self, pooled):
+        try:
+            pooled.conn.unbind_s()
+        except Exception as e:
+            logger.debug("Failed to unbind pooled LDAP connection: %s", e)
+
+    def _expired(self, pooled, now):
+        return (
+            now >= pooled.expires or
+            now - pooled.last_used >= self.ttl
+        )
+
+    def _alive(self, pooled, now):
+        if now - pooled.last_used < self.validate_interval:
+            return True
+        try:
+            pooled.conn.whoami_s()
+        except Exception as e:
+            logger.debug("Pooled LDAP connection is not usable: %s", e)
+            return False
+        return True
+
+    def _evict_expired(self, now):
+        """Remove expired idle connections. Caller must hold the lock."""
+        stale = [
+            (k, pooled) for k, pooled in self._idle.items()
+            if self._expired(pooled, now)
+        ]
+        for k, _pooled in stale:
+            del self._idle[k]
+        self.evictions += len(stale)
+        return [pooled for _k, pooled in stale]
+
+    def checkout(self, key):
+        """
+        Return an idle connection bound for *key* or ``None``.
+
+        The returned connection is marked as in use until it is released by
+        `release` or `discard`.
+        """
+        now = time.time()
+        to_close = []
+        pooled = None
+        with self._lock:
+            to_close.extend(self._evict_expired(now))
+            for k in reversed(self._idle):
+                if k[0] == key:
+                    pooled = self._idle.pop(k)
+                    break
+            if pooled is not None:
+                self._in_use[id(pooled.conn)] = pooled
+
+        if pooled is not None and not self._alive(pooled, now):
+            with self._lock:
+                self._in_use.pop(id(pooled.conn), None)
+                self.evictions += 1
+            to_close.append(pooled)
+            pooled = None
+
+        for stale in to_close:
+            self._close(stale)
+
+        with self._lock:
+            if pooled is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        pooled.last_used = now
+        return pooled.conn
+
+    def add(self, key, conn, expires):
+        """
+        Register a freshly bound connection *conn* as checked out for *key*.
+
+        :param expires: time stamp after which the credentials used to bind
+            the connection are no longer valid
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._in_use[id(conn)] = _PooledConnection(key, conn, expires)
+
+    def release(self, conn):
+        """
+        Return a checked out connection to the pool.
+
+        :returns: ``True`` if the pool took the connection over, ``False`` if
+            the connection does not belong to the pool and the caller is
+            responsible for closing it.
+        """
+        now = time.time()
+        to_close = []
+        with self._lock:
+            pooled = self._in_use.pop(id(conn), None)
+            if pooled is None:
+                return False
+            pooled.last_used = now
+            to_close.extend(self._evict_expired(now))
+            if now < pooled.expires:
+                self._idle[(pooled.key, next(self._serial))] = pooled
+            else:
+                to_close.append(pooled)
+            while len(self._idle) > self.max_size:
+                _k, lru = self._idle.popitem(last=False)
+                self.evictions += 1
+                to_close.append(lru)
+
+        for stale in to_close:
+            self._close(stale)
+        return True
+
+    def discard(self, conn):
+        """
+        Forget a checked out connection which must not be reused.
+
+        The connection stays open, closing it is up to its current user.
+        """
+        with self._lock:
+            self._in_use.pop(id(conn), None)
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self):
+        """
+        Return a dictionary with pool counters.
+        """
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                max_size=self.max_size,
+            )
+
+
+class ServiceConnection:
+    """
+    Lazily opened connection of a worker bound with the server's credentials.
+
+    The connection is used by one thread at a time. It is opened again after
+    a network error.
+    """
+
+    def __init__(self, connect):
+        """
+        :param connect: callable returning a new bound LDAPClient
+        """
+        self._connect = connect
+        self._lock = threading.RLock()
+        self._client = None
+
+        self.connects = 0
+
+    @contextlib.contextmanager
+    def use(self):
+        """
+        Context manager yielding the bound LDAPClient
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = self._connect()
+                self.connects += 1
+            try:
+                yield self._client
+            except errors.NetworkError:
+                self.close()
+                raise
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.unbind()
+            except Exception as e:
+                logger.debug("Failed to close service LDAP connection: %s",
+                             e)
@@ -0,0 +1,204 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Per-process graph of user group and host group membership.
+
+Commands like hbactest or the CA ACL check of cert_request need all groups
+of a user or of a host, including the nested ones. Instead of asking the
+directory server for memberOf and computing memberofindirect every time,
+the graph keeps the member edges of all user groups and host groups in
+memory and answers transitive-closure queries from there.
+
+The graph is loaded on first use. Afterwards it is kept current by polling
+the ``lastusn`` attribute of the root DSE (maintained by the entryUSN plugin)
+before it is used, at most every ``poll_interval`` seconds. When the value
+changed, only the entries with a higher entryUSN are fetched again. Deleted
+groups are detected through their former members: the memberOf plugin
+removes a deleted group from the memberOf values of its members, which
+updates their entryUSN. Without the entryUSN plugin the graph is reloaded
+completely instead.
+
+The graph is shared by all requests of a process, it has to be loaded with
+a connection bound as the server, see `ipaserver.plugins.ldap2`.
+"""
+
+from __future__ import absolute_import
+
+import threading
+import time
+
+from ipalib import errors
+from ipapython.dn import DN
+
+GROUP_FILTER = '(|(objectclass=ipausergroup)(objectclass=ipahostgroup))'
+GROUP_OBJECTCLASSES = frozenset(['ipausergroup', 'ipahostgroup'])
+
+
+class MembershipGraph:
+    """
+    Thread-safe graph of group membership with incremental updates.
+
+    Vertices are DNs of users, hosts, user groups and host groups, edges
+    point from a member to the group it is a direct member of.
+    """
+
+    def __init__(self, poll_interval=0):
+        """
+        :param poll_interval: minimum number of seconds between two checks
+            for changes in the directory, 0 checks before every use
+        """
+        self.poll_interval = poll_interval
+
+        self._lock = threading.RLock()
+        # group DN -> set of DNs of its direct members
+        self._members = {}
+        # member DN -> set of DNs of the groups it is a direct member of
+        self._memberof = {}
+        # member DN -> frozenset of all its groups, cleared on every change
+        self._closure = {}
+
+        self.last_usn = None
+        self._next_poll = None
+
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def _set_members(self, group, members):
+        old = self._members.get(group, set())
+        for member in old - members:
+            groups = self._memberof[member]
+            groups.discard(group)
+            if not groups:
+                del self._memberof[member]
+        for member in members - old:
+            self._memberof.setdefault(member, set()).add(group)
+        if members:
+            self._members[group] = members
+        else:
+            self._members.pop(group, None)
+
+    def _iter_entries(self, ldap, basedn, filter, attrs_list):
+        result = ldap.iter_entries(
+            filter, attrs_list, DN(('cn', 'accounts'), basedn),
+            size_limit=-1)
+        with result:
+            for entry in result:
+                yield entry
+        ldap.handle_truncated_result(result.truncated)
+
+    def _get_last_usn(self, ldap):
+        try:
+            entry = ldap.get_entry(DN(), ['lastusn'])
+        except errors.NotFound:
+            return None
+        value = entry.single_value.get('lastusn')
+        if value is None:
+            return None
+        return int(value)
+
+    def _load(self, ldap, basedn):
+        members = {
+            entry.dn: set(entry.get('member', []))
+            for entry in self._iter_entries(
+                ldap, basedn, GROUP_FILTER, ['member'])
+        }
+        with self._lock:
+            self._members = {}
+            self._memberof = {}
+            self._closure = {}
+            for group, group_members in members.items():
+                self._set_members(group, group_members)
+        self.full_loads += 1
+
+    def _update(self, ldap, basedn, last_usn):
+        # groups with changed members and the entries whose memberOf was
+        # changed, e.g. because one of their groups was deleted
+        changed = {}
+        memberof = {}
+        for entry in self._iter_entries(
+                ldap, basedn, '(entryusn>={})'.format(last_usn + 1),
+                ['objectclass', 'member', 'memberof']):
+            memberof[entry.dn] = set(entry.get('memberof', []))
+            objectclasses = entry.get('objectclass', [])
+            if {oc.lower() for oc in objectclasses} & GROUP_OBJECTCLASSES:
+                changed[entry.dn] = set(entry.get('member', []))
+        with self._lock:
+            for member, groups in memberof.items():
+                for group in self._memberof.get(member, set()) - groups:
+                    if group not in changed:
+                        # the group is gone, otherwise it was modified too
+                        self._set_members(group, set())
+            for group, group_members in changed.items():
+                self._set_members(group, group_members)
+            self._closure = {}
+        self.incremental_loads += 1
+
+    def _is_current(self, now):
+        return self._next_poll is not None and now < self._next_poll
+
+    def refresh(self, ldap, basedn):
+        """
+        Bring the graph up to date if ``poll_interval`` has elapsed
+
+        :param ldap: LDAPClient bound as the server used to read the groups
+        :param basedn: base DN of the IPA tree
+        """
+        now = time.time()
+        if self._is_current(now):
+            return
+
+        with self._lock:
+            if self._is_current(now):
+                # another thread refreshed the graph meanwhile
+                return
+            usn = self._get_last_usn(ldap)
+            if usn is None or self.last_usn is None:
+                self._load(ldap, basedn)
+            elif usn != self.last_usn:
+                self._update(ldap, basedn, self.last_usn)
+            self.last_usn = usn
+            self._next_poll = now + self.poll_interval
+
+    def get_groups(self, dn):
+        """
+        Return the DNs of all groups ``dn`` is a direct or indirect member of
+        """
+        with self._lock:
+            groups = self._closure.get(dn)
+            if groups is not None:
+                return groups
+
+            visited = set()
+            stack = list(self._memberof.get(dn, ()))
+            while stack:
+                group = stack.pop()
+                if group not in visited:
+                    visited.add(group)
+                    stack.extend(self._memberof.get(group, ()))
+            groups = self._closure[dn] = frozenset(visited)
+            return groups
+
+    def get_group_names(self, dn, container_dn):
+        """
+        Return the sorted names of all groups of ``dn`` in ``container_dn``
+
+        This is the union of the memberof and memberofindirect values of an
+        object for the group type stored in the container, e.g. the
+        memberof_group and memberofindirect_group output of user_show.
+        """
+        return sorted(set(
+            group[0].value for group in self.get_groups(dn)
+            if group.endswith(container_dn)
+        ))
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                groups=len(self._members),
+                members=len(self._memberof),
+                last_usn=self.last_usn,
+                full_loads=self.full_loads,
+                incremental_loads=self.incremental_loads,
+            )
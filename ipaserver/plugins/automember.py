@@ -841,6 +841,9 @@ class automember_find_orphans(LDAPSearch):
         '%(count)d rules matched', '%(count)d rules matched', 0
     )
 
+    # --remove deletes the orphan rules
+    read_only = False
+
     def execute(self, *keys, **options):
         results = super().execute(*keys, **options)
 
@@ -25,6 +25,7 @@ import time
 from copy import deepcopy
 import base64
 
+from ldap.controls.libldap import MatchedValuesControl
 import six
 
 from ipalib import api, crud, errors
@@ -550,6 +551,8 @@ class LDAPObject(Object):
     rdn_attribute = ''
     uuid_attribute = ''
     attribute_members = {}
+    # number of entries per search in get_indirect_members_batch
+    indirect_members_chunk = 100
     allow_rename = False
     password_attributes = []
     # Can bind as this entry (has userPassword or krbPrincipalKey)
@@ -689,19 +692,16 @@ class LDAPObject(Object):
         mo_filter = self.backend.make_filter({'memberof': group_entry.dn})
         filter = self.backend.combine_filters(
             ('(member=*)', mo_filter), self.backend.MATCH_ALL)
-        try:
-            result = self.backend.get_entries(
-                self.api.env.basedn,
-                filter=filter,
-                attrs_list=['member'],
-                size_limit=-1, # paged search will get everything anyway
-                paged_search=True)
-        except errors.NotFound:
-            result = []
+        result = self.backend.iter_entries(
+            filter,
+            ['member'],
+            self.api.env.basedn,
+            size_limit=-1)  # paged search will get everything anyway
 
         indirect = set()
         for entry in result:
             indirect.update(entry.raw.get('member', []))
+        self.backend.handle_truncated_result(result.truncated)
         indirect.difference_update(group_entry.raw.get('member', []))
 
         if indirect:
@@ -712,15 +712,11 @@ class LDAPObject(Object):
         dn = entry.dn
         filter = self.backend.make_filter(
             {'member': dn, 'memberuser': dn, 'memberhost': dn})
-        try:
-            result = self.backend.get_entries(
-                self.api.env.basedn,
-                filter=filter,
-                attrs_list=[''],
-                size_limit=-1,  # paged search will get everything anyway
-                paged_search=True)
-        except errors.NotFound:
-            result = []
+        result = self.backend.iter_entries(
+            filter,
+            [''],
+            self.api.env.basedn,
+            size_limit=-1)  # paged search will get everything anyway
 
         direct = set()
         indirect = set(entry.raw.get('memberof', []))
@@ -729,11 +725,92 @@ class LDAPObject(Object):
             if dn in indirect:
                 indirect.remove(dn)
                 direct.add(dn)
+        self.backend.handle_truncated_result(result.truncated)
 
         entry.raw['memberof'] = list(direct)
         if indirect:
             entry.raw['memberofindirect'] = list(indirect)
 
+    def get_indirect_members_batch(self, entries, attrs_list):
+        """
+        Like get_indirect_members, but for a whole list of entries
+
+        Instead of one search per entry, the indirect membership of all
+        the entries is resolved with one search per
+        ``indirect_members_chunk`` entries. The result is the same as
+        calling get_indirect_members for each entry.
+        """
+        chunk_size = self.indirect_members_chunk
+        for i in range(0, len(entries), chunk_size):
+            chunk = entries[i:i + chunk_size]
+            if 'memberindirect' in attrs_list:
+                self._get_memberindirect_batch(chunk)
+            if 'memberofindirect' in attrs_list:
+                self._get_memberofindirect_batch(chunk)
+
+    def _get_memberindirect_batch(self, group_entries):
+        groups = {entry.dn: set() for entry in group_entries}
+
+        mo_filter = self.backend.make_filter({'memberof': list(groups)})
+        filter = self.backend.combine_filters(
+            ('(member=*)', mo_filter), self.backend.MATCH_ALL)
+        result = self.backend.iter_entries(
+            filter,
+            ['member', 'memberof'],
+            self.api.env.basedn,
+            size_limit=-1)  # paged search will get everything anyway
+
+        for entry in result:
+            members = entry.raw.get('member', [])
+            for memberof in entry.raw.get('memberof', []):
+                indirect = groups.get(DN(memberof.decode('utf-8')))
+                if indirect is not None:
+                    indirect.update(members)
+        self.backend.handle_truncated_result(result.truncated)
+
+        for group_entry in group_entries:
+            indirect = groups[group_entry.dn]
+            indirect.difference_update(group_entry.raw.get('member', []))
+            if indirect:
+                group_entry.raw['memberindirect'] = list(indirect)
+
+    def _get_memberofindirect_batch(self, entries):
+        member_attrs = ('member', 'memberuser', 'memberhost')
+        groups = {entry.dn: set() for entry in entries}
+
+        dns = list(groups)
+        filter = self.backend.make_filter(
+            {attr: dns for attr in member_attrs})
+        # return only the member values of the chunk, not the whole member
+        # lists of large groups, servers which don't support the control
+        # return all values
+        values_filter = '(%s)' % ''.join(
+            self.backend.make_filter_from_attr(attr, dn)
+            for attr in member_attrs for dn in dns)
+        result = self.backend.iter_entries(
+            filter,
+            list(member_attrs),
+            self.api.env.basedn,
+            size_limit=-1,  # paged search will get everything anyway
+            server_controls=[MatchedValuesControl(False, values_filter)])
+
+        for group_entry in result:
+            group_dn = str(group_entry.dn).encode('utf-8')
+            for attr in member_attrs:
+                for value in group_entry.raw.get(attr, []):
+                    direct = groups.get(DN(value.decode('utf-8')))
+                    if direct is not None:
+                        direct.add(group_dn)
+        self.backend.handle_truncated_result(result.truncated)
+
+        for entry in entries:
+            memberof = set(entry.raw.get('memberof', []))
+            direct = groups[entry.dn]
+            entry.raw['memberof'] = list(memberof & direct)
+            indirect = memberof - direct
+            if indirect:
+                entry.raw['memberofindirect'] = list(indirect)
+
     def get_password_attributes(self, ldap, dn, entry_attrs):
         """
         Search on the entry to determine if it has a password or
@@ -1654,6 +1731,33 @@ class LDAPModMember(LDAPQuery):
                         failed[attr][ldap_obj_name].append((name, unicode(e)))
         return (dns, failed)
 
+    def _collect_member_dns(self, objs):
+        """
+        Flatten member DNs of one member attribute for a bulk update.
+
+        Returns the list of member DNs and a dict mapping each DN to the
+        name of its LDAP object.
+        """
+        m_dns = []
+        obj_names = {}
+        for ldap_obj_name, dns in objs.items():
+            for m_dn in dns:
+                assert isinstance(m_dn, DN)
+                if not m_dn:
+                    continue
+                m_dns.append(m_dn)
+                obj_names[m_dn] = ldap_obj_name
+        return m_dns, obj_names
+
+    def _add_member_failures(self, failed, errs, obj_names):
+        for m_dn, e in errs:
+            ldap_obj_name = obj_names[m_dn]
+            ldap_obj = self.api.Object[ldap_obj_name]
+            failed[ldap_obj_name].append((
+                ldap_obj.get_primary_key_from_dn(m_dn),
+                unicode(e),)
+            )
+
 
 class LDAPAddMember(LDAPModMember):
     """
@@ -1691,21 +1795,11 @@ class LDAPAddMember(LDAPModMember):
 
         completed = 0
         for (attr, objs) in member_dns.items():
-            for ldap_obj_name in objs:
-                for m_dn in member_dns[attr][ldap_obj_name]:
-                    assert isinstance(m_dn, DN)
-                    if not m_dn:
-                        continue
-                    try:
-                        ldap.add_entry_to_group(m_dn, dn, attr, allow_same=self.allow_same)
-                    except errors.PublicError as e:
-                        ldap_obj = self.api.Object[ldap_obj_name]
-                        failed[attr][ldap_obj_name].append((
-                            ldap_obj.get_primary_key_from_dn(m_dn),
-                            unicode(e),)
-                        )
-                    else:
-                        completed += 1
+            m_dns, obj_names = self._collect_member_dns(objs)
+            errs = ldap.add_entries_to_group(
+                m_dns, dn, attr, allow_same=self.allow_same)
+            self._add_member_failures(failed[attr], errs, obj_names)
+            completed += len(m_dns) - len(errs)
 
         if options.get('all', False):
             attrs_list = ['*'] + self.obj.default_attributes
@@ -1789,21 +1883,10 @@ class LDAPRemoveMember(LDAPModMember):
 
         completed = 0
         for (attr, objs) in member_dns.items():
-            for ldap_obj_name, m_dns in objs.items():
-                for m_dn in m_dns:
-                    assert isinstance(m_dn, DN)
-                    if not m_dn:
-                        continue
-                    try:
-                        ldap.remove_entry_from_group(m_dn, dn, attr)
-                    except errors.PublicError as e:
-                        ldap_obj = self.api.Object[ldap_obj_name]
-                        failed[attr][ldap_obj_name].append((
-                            ldap_obj.get_primary_key_from_dn(m_dn),
-                            unicode(e),)
-                        )
-                    else:
-                        completed += 1
+            m_dns, obj_names = self._collect_member_dns(objs)
+            errs = ldap.remove_entries_from_group(m_dns, dn, attr)
+            self._add_member_failures(failed[attr], errs, obj_names)
+            completed += len(m_dns) - len(errs)
 
         if options.get('all', False):
             attrs_list = ['*'] + self.obj.default_attributes
@@ -2080,8 +2163,8 @@ class LDAPSearch(BaseLDAPCommand, crud.Search):
                 entries.sort(key=sort_key)
 
         if not options.get('raw', False):
+            self.obj.get_indirect_members_batch(entries, attrs_list)
             for entry in entries:
-                self.obj.get_indirect_members(entry, attrs_list)
                 self.obj.convert_attribute_members(entry, *args, **options)
 
         for (i, e) in enumerate(entries):
@@ -19,16 +19,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import six
 
 from ipalib import api, errors
 from ipalib import Command
 from ipalib.frontend import Local
-from ipalib.parameters import Str, Dict
+from ipalib.parameters import Str, Dict, Flag
 from ipalib.output import Output
 from ipalib.text import _
-from ipalib.request import context
+from ipalib.request import context, destroy_context
 from ipalib.plugable import Registry
 from ipapython.version import API_VERSION
 
@@ -57,6 +59,10 @@ The format of the response is nested the same way.  At the top you will see
 
 And then a nested response for each IPA command method sent in the request
 
+With the "parallel" option, consecutive read-only methods (show, find and
+status commands) are executed concurrently, each with its own LDAP
+connection. The results are reported in the order of the request.
+
 """)
 
 if six.PY3:
@@ -66,6 +72,9 @@ logger = logging.getLogger(__name__)
 
 register = Registry()
 
+# Maximum number of read-only nested methods executed at the same time
+PARALLEL_MAX_WORKERS = 8
+
 @register()
 class batch(Command):
     __doc__ = _('Make multiple ipa calls via one remote procedure call')
@@ -88,74 +97,169 @@ class batch(Command):
         ),
     )
 
+    takes_options = (
+        Flag('parallel',
+            doc=_('Execute read-only methods (show, find, status) '
+                  'concurrently'),
+        ),
+    )
+
     has_output = (
         Output('count', int, doc=''),
         Output('results', (list, tuple), doc='')
     )
 
-    def execute(self, methods=None, **options):
-        results = []
-        for arg in (methods or []):
-            params = dict()
-            name = None
+    def _get_method(self, arg):
+        """
+        Return the command called by nested method *arg* or ``None`` if the
+        method is invalid.
+        """
+        try:
+            name = arg['method']
+            command = self.api.Command[name]
+        except (KeyError, TypeError):
+            return None
+        if isinstance(command, Local):
+            return None
+        return command
+
+    def _execute_method(self, arg, version):
+        params = dict()
+        name = None
+        try:
+            if 'method' not in arg:
+                raise errors.RequirementError(name='method')
+            if 'params' not in arg:
+                raise errors.RequirementError(name='params')
+            name = arg['method']
+            if (name not in self.api.Command or
+                    isinstance(self.api.Command[name], Local)):
+                raise errors.CommandError(name=name)
+
+            # If params are not formated as a tuple(list, dict)
+            # the following lines will raise an exception
+            # that triggers an internal server error
+            # Raise a ConversionError instead to report the issue
+            # to the client
             try:
-                if 'method' not in arg:
-                    raise errors.RequirementError(name='method')
-                if 'params' not in arg:
-                    raise errors.RequirementError(name='params')
-                name = arg['method']
-                if (name not in self.api.Command or
-                        isinstance(self.api.Command[name], Local)):
-                    raise errors.CommandError(name=name)
-
-                # If params are not formated as a tuple(list, dict)
-                # the following lines will raise an exception
-                # that triggers an internal server error
-                # Raise a ConversionError instead to report the issue
-                # to the client
-                try:
-                    a, kw = arg['params']
-                    newkw = dict((str(k), v) for k, v in kw.items())
-                    params = api.Command[name].args_options_2_params(
-                        *a, **newkw)
-                except (AttributeError, ValueError, TypeError):
-                    raise errors.ConversionError(
-                        name='params',
-                        error=_(u'must contain a tuple (list, dict)'))
-                newkw.setdefault('version', options['version'])
-
-                result = api.Command[name](*a, **newkw)
+                a, kw = arg['params']
+                newkw = dict((str(k), v) for k, v in kw.items())
+                params = api.Command[name].args_options_2_params(
+                    *a, **newkw)
+            except (AttributeError, ValueError, TypeError):
+                raise errors.ConversionError(
+                    name='params',
+                    error=_(u'must contain a tuple (list, dict)'))
+            newkw.setdefault('version', version)
+
+            result = api.Command[name](*a, **newkw)
+            logger.info(
+                '%s: batch: %s(%s): SUCCESS',
+                getattr(context, 'principal', 'UNKNOWN'),
+                name,
+                ', '.join(api.Command[name]._repr_iter(**params))
+            )
+            result['error']=None
+        except Exception as e:
+            if isinstance(e, errors.RequirementError) or \
+                isinstance(e, errors.CommandError):
+                logger.info(
+                    '%s: batch: %s',
+                    context.principal,  # pylint: disable=no-member
+                    e.__class__.__name__
+                )
+            else:
                 logger.info(
-                    '%s: batch: %s(%s): SUCCESS',
-                    getattr(context, 'principal', 'UNKNOWN'),
-                    name,
-                    ', '.join(api.Command[name]._repr_iter(**params))
+                    '%s: batch: %s(%s): %s',
+                    context.principal, name,  # pylint: disable=no-member
+                    ', '.join(api.Command[name]._repr_iter(**params)),
+                    e.__class__.__name__
                 )
-                result['error']=None
+            result = self._error_result(e)
+        return result
+
+    def _error_result(self, e):
+        if isinstance(e, errors.PublicError):
+            reported_error = e
+        else:
+            reported_error = errors.InternalError()
+        return dict(
+            error=reported_error.strerror,
+            error_code=reported_error.errno,
+            error_name=unicode(type(reported_error).__name__),
+            error_kw=reported_error.kw,
+        )
+
+    def _execute_in_thread(self, state, arg, version):
+        """
+        Execute nested method *arg* in a worker thread.
+
+        The thread gets its own request context and LDAP connection bound
+        with the credentials of the calling request.
+        """
+        for attr, value in state.items():
+            setattr(context, attr, value)
+        try:
+            try:
+                self.api.Backend.ldap2.connect(
+                    ccache=state.get('ccache_name'),
+                    size_limit=None, time_limit=None)
             except Exception as e:
-                if isinstance(e, errors.RequirementError) or \
-                    isinstance(e, errors.CommandError):
-                    logger.info(
-                        '%s: batch: %s',
-                        context.principal,  # pylint: disable=no-member
-                        e.__class__.__name__
-                    )
-                else:
-                    logger.info(
-                        '%s: batch: %s(%s): %s',
-                        context.principal, name,  # pylint: disable=no-member
-                        ', '.join(api.Command[name]._repr_iter(**params)),
-                        e.__class__.__name__
-                    )
-                if isinstance(e, errors.PublicError):
-                    reported_error = e
-                else:
-                    reported_error = errors.InternalError()
-                result = dict(
-                    error=reported_error.strerror,
-                    error_code=reported_error.errno,
-                    error_name=unicode(type(reported_error).__name__),
-                    error_kw=reported_error.kw,
+                logger.info(
+                    '%s: batch: %s: %s',
+                    state.get('principal'), arg.get('method'),
+                    e.__class__.__name__
                 )
-            results.append(result)
+                return self._error_result(e)
+            return self._execute_method(arg, version)
+        finally:
+            destroy_context()
+
+    def _execute_parallel(self, methods, version):
+        """
+        Execute runs of consecutive read-only methods concurrently.
+
+        Methods which may modify data are executed one by one in the request
+        thread, so the results of reads are not affected by the ordering.
+        """
+        state = dict(
+            (attr, getattr(context, attr))
+            for attr in ('principal', 'ccache_name', 'client_ip', 'languages')
+            if hasattr(context, attr)
+        )
+        if 'ccache_name' not in state:
+            if self.api.env.context == 'server':
+                # KRB5CCNAME is shared by the request threads of the WSGI
+                # worker, it is not necessarily the ccache of this request
+                return [self._execute_method(arg, version) for arg in methods]
+            state['ccache_name'] = os.environ.get('KRB5CCNAME')
+
+        results = [None] * len(methods)
+        max_workers = min(PARALLEL_MAX_WORKERS, len(methods))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            for i, arg in enumerate(methods):
+                command = self._get_method(arg)
+                if command is not None and command.read_only:
+                    pending[i] = executor.submit(
+                        self._execute_in_thread, state, arg, version)
+                    continue
+                # wait for the preceding reads before a write
+                for j, future in pending.items():
+                    results[j] = future.result()
+                pending = {}
+                results[i] = self._execute_method(arg, version)
+            for j, future in pending.items():
+                results[j] = future.result()
+        return results
+
+    def execute(self, methods=None, **options):
+        methods = methods or []
+        version = options['version']
+        if options.get('parallel') and len(methods) > 1:
+            results = self._execute_parallel(methods, version)
+        else:
+            results = [
+                self._execute_method(arg, version) for arg in methods
+            ]
         return dict(count=len(results) , results=results)
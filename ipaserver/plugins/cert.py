@@ -38,7 +38,7 @@ from ipalib.constants import IPA_CA_CN
 from ipalib.crud import Create, PKQuery, Retrieve, Search
 from ipalib.frontend import Method, Object
 from ipalib.parameters import (
-    Bytes, Certificate, CertificateSigningRequest, DateTime, DNParam,
+    Bytes, Certificate, CertificateSigningRequest, DateTime, Dict, DNParam,
     DNSNameParam, Principal
 )
 from ipalib.plugable import Registry
@@ -50,6 +50,7 @@ from ipalib.request import context
 from ipalib import output
 from ipapython import kerberos
 from ipapython.dn import DN
+from ipaserver.certexpiry import CERT_FILTER
 from ipaserver.plugins.service import normalize_principal, validate_realm
 
 try:
@@ -171,16 +172,27 @@ def _acl_make_request(principal_type, principal, ca_id, profile_id):
     elif principal_type == 'service':
         req.user.name = unicode(principal)
     groups = []
+    graph = api.Backend.ldap2.get_membership_graph()
     if principal_type == 'user':
-        user_obj = api.Command.user_show(
-            str(principal.username))['result']
-        groups = user_obj.get('memberof_group', [])
-        groups += user_obj.get('memberofindirect_group', [])
+        if graph is not None:
+            groups = graph.get_group_names(
+                api.Object.user.get_dn(principal.username),
+                DN(api.env.container_group, api.env.basedn))
+        else:
+            user_obj = api.Command.user_show(
+                str(principal.username))['result']
+            groups = user_obj.get('memberof_group', [])
+            groups += user_obj.get('memberofindirect_group', [])
     elif principal_type == 'host':
-        host_obj = api.Command.host_show(
-            str(principal.hostname))['result']
-        groups = host_obj.get('memberof_hostgroup', [])
-        groups += host_obj.get('memberofindirect_hostgroup', [])
+        if graph is not None:
+            groups = graph.get_group_names(
+                api.Object.host.get_dn(principal.hostname),
+                DN(api.env.container_hostgroup, api.env.basedn))
+        else:
+            host_obj = api.Command.host_show(
+                str(principal.hostname))['result']
+            groups = host_obj.get('memberof_hostgroup', [])
+            groups += host_obj.get('memberofindirect_hostgroup', [])
     req.user.groups = sorted(set(groups))
     return req
 
@@ -231,6 +243,70 @@ def _acl_make_rule(principal_type, obj):
     return rule
 
 
+class _ACLIndex:
+    """Enabled CA ACL rules of one principal type indexed by CA and profile
+
+    Names are indexed case-insensitively; the selected rules are a superset
+    of the rules which can match and are evaluated by pyhbac as usual.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._by_ca = collections.defaultdict(set)
+        self._by_profile = collections.defaultdict(set)
+        self._all_cas = set()
+        self._all_profiles = set()
+        self._selected = {}
+
+        for i, rule in enumerate(rules):
+            if pyhbac.HBAC_CATEGORY_ALL in rule.targethosts.category:
+                self._all_cas.add(i)
+            for ca_id in rule.targethosts.names:
+                self._by_ca[ca_id.lower()].add(i)
+            if pyhbac.HBAC_CATEGORY_ALL in rule.services.category:
+                self._all_profiles.add(i)
+            for profile_id in rule.services.names:
+                self._by_profile[profile_id.lower()].add(i)
+
+    def select(self, ca_id, profile_id):
+        """Return the rules which apply to the given CA and profile"""
+        key = (ca_id.lower(), profile_id.lower())
+        selected = self._selected.get(key)
+        if selected is None:
+            cas = self._all_cas | self._by_ca.get(key[0], set())
+            profiles = (self._all_profiles |
+                        self._by_profile.get(key[1], set()))
+            selected = [self.rules[i] for i in sorted(cas & profiles)]
+            self._selected[key] = selected
+        return selected
+
+
+# principal type -> (signature of the CA ACL entries, _ACLIndex)
+_acl_cache = {}
+
+
+def _acl_get_index(principal_type):
+    """Return the CA ACL rules for the principal type
+
+    The converted rules are cached per WSGI worker until a CA ACL is added,
+    modified or removed.
+    """
+    signature = api.Backend.ldap2.get_entries_signature(
+        '(objectclass=ipacaacl)',
+        DN(api.env.container_caacl, api.env.basedn))
+    cached = _acl_cache.get(principal_type)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    acls = api.Command.caacl_find(no_members=False)['result']
+    index = _ACLIndex([
+        _acl_make_rule(principal_type, obj) for obj in acls
+        if obj['ipaenabledflag'][0]
+    ])
+    _acl_cache[principal_type] = (signature, index)
+    return index
+
+
 def acl_evaluate(principal, ca_id, profile_id):
     if principal.is_user:
         principal_type = 'user'
@@ -238,9 +314,10 @@ def acl_evaluate(principal, ca_id, profile_id):
         principal_type = 'host'
     else:
         principal_type = 'service'
+    rules = _acl_get_index(principal_type).select(ca_id, profile_id)
+    if not rules:
+        return False
     req = _acl_make_request(principal_type, principal, ca_id, profile_id)
-    acls = api.Command.caacl_find(no_members=False)['result']
-    rules = [_acl_make_rule(principal_type, obj) for obj in acls]
     return req.evaluate(rules) == pyhbac.HBAC_EVAL_ALLOW
 
 
@@ -492,10 +569,7 @@ class BaseCertObject(Object):
                 obj['sha256_fingerprint'] = x509.to_hex_with_colons(
                     cert.fingerprint(hashes.SHA256()))
 
-            general_names = x509.process_othernames(
-                    cert.san_general_names)
-
-            for gn in general_names:
+            for gn in cert.san_processed_general_names:
                 try:
                     self._add_san_attribute(obj, full, gn)
                 except Exception:
@@ -598,62 +672,46 @@ _chain_flag = Flag(
 )
 
 
-@register()
-class cert_request(Create, BaseCertMethod, VirtualCommand):
-    __doc__ = _('Submit a certificate signing request.')
-
-    obj_name = 'certreq'
-    attr_name = 'request'
-
-    takes_args = (
-        CertificateSigningRequest(
-            'csr',
-            label=_('CSR'),
-            cli_name='csr_file',
-        ),
-    )
-    operation="request certificate"
-
-    takes_options = (
-        Principal(
-            'principal',
-            validate_realm,
-            label=_('Principal'),
-            doc=_('Principal for this certificate (e.g. HTTP/test.example.com)'),
-            normalizer=normalize_principal
-        ),
-        Flag(
-            'add',
-            doc=_(
-                "automatically add the principal if it doesn't exist "
-                "(service principals only)"),
-        ),
-        _chain_flag,
-    )
+class BaseCertRequest(VirtualCommand):
+    """
+    Base class of the commands submitting certificate signing requests.
+    """
+    operation = "request certificate"
 
-    def get_args(self):
-        # FIXME: the 'no_create' flag is ignored for positional arguments
-        for arg in super(cert_request, self).get_args():
-            if arg.name == 'request_id':
-                continue
-            yield arg
+    def _check_access_once(self, access, operation=None):
+        """
+        ``check_access`` with the outcome remembered in the dict ``access``
 
-    def execute(self, csr, all=False, raw=False, chain=False, **kw):
-        ca_enabled_check(self.api)
+        The bind principal is the same for all CSRs of one command, so
+        the virtual operations have to be checked only once.
+        """
+        if operation not in access:
+            try:
+                self.check_access(operation)
+            except errors.ACIError as e:
+                access[operation] = e
+            else:
+                access[operation] = None
+        if access[operation] is not None:
+            raise access[operation]
 
+    def _check_request(self, csr, principal_arg, add, ca, profile_id, access):
+        """
+        Check that the bind principal may request the certificate
+
+        Validates the subject and the subject alt names of ``csr`` against
+        the subject principal and evaluates the CA ACLs.
+
+        :param csr: the certificate signing request
+        :param principal_arg: the subject ``kerberos.Principal``
+        :param add: whether to add a missing service principal
+        :param ca: name of the CA to submit the request to
+        :param profile_id: the certificate profile to use
+        :param access: dict for ``_check_access_once``
+        :return: the canonical subject ``kerberos.Principal``
+        """
         ldap = self.api.Backend.ldap2
         realm = unicode(self.api.env.realm)
-        add = kw.get('add')
-        request_type = kw.get('request_type')
-        profile_id = kw.get('profile_id', self.Backend.ra.DEFAULT_PROFILE)
-
-        # Check that requested authority exists (done before CA ACL
-        # enforcement so that user gets better error message if
-        # referencing nonexistant CA) and look up authority ID.
-        #
-        ca = kw['cacn']
-        ca_obj = api.Command.ca_show(ca, all=all, chain=chain)['result']
-        ca_id = ca_obj['ipacaid'][0]
 
         """
         Access control is partially handled by the ACI titled
@@ -665,8 +723,6 @@ class cert_request(Create, BaseCertMethod, VirtualCommand):
         Binding with a user principal one needs to be in the request_certs
         taskgroup (directly or indirectly via role membership).
         """
-        principal_arg = kw.get('principal')
-
         if principal_to_principal_type(principal_arg) == KRBTGT:
             principal_obj = None
             principal = principal_arg
@@ -699,10 +755,11 @@ class cert_request(Create, BaseCertMethod, VirtualCommand):
         if (bind_principal_string != principal_string and
                 bind_principal_type != HOST):
             # Can the bound principal request certs for another principal?
-            self.check_access()
+            self._check_access_once(access)
 
         try:
-            self.check_access("request certificate ignore caacl")
+            self._check_access_once(
+                access, "request certificate ignore caacl")
             bypass_caacl = True
         except errors.ACIError:
             bypass_caacl = False
@@ -866,65 +923,42 @@ class cert_request(Create, BaseCertMethod, VirtualCommand):
                     info=_("Subject alt name type %s is forbidden")
                     % type(gn).__name__)
 
-        # Request the certificate
-        try:
-            # re-serialise to PEM, in case the user-supplied data has
-            # extraneous material that will cause Dogtag to freak out
-            # keep it as string not bytes, it is required later
-            csr_pem = csr.public_bytes(
-                serialization.Encoding.PEM).decode('utf-8')
-            result = self.Backend.ra.request_certificate(
-                csr_pem, profile_id, ca_id, request_type=request_type)
-        except errors.HTTPRequestError as e:
-            if e.status == 409:  # pylint: disable=no-member
-                raise errors.CertificateOperationError(
-                    error=_("CA '%s' is disabled") % ca)
-            else:
-                raise e
+        return principal
 
-        if not raw:
-            try:
-                self.obj._parse(result, all)
-            except ValueError as e:
-                self.add_message(
-                    messages.CertificateInvalid(
-                        subject=principal,
-                        reason=e,
-                    )
-                )
-            result['request_id'] = int(result['request_id'])
-            result['cacn'] = ca_obj['cn'][0]
+    def _submit_error(self, e, ca):
+        """
+        Translate an error of ``ra.request_certificate``
+        """
+        if (isinstance(e, errors.HTTPRequestError) and
+                e.status == 409):  # pylint: disable=no-member
+            return errors.CertificateOperationError(
+                error=_("CA '%s' is disabled") % ca)
+        return e
 
-        # Success? Then add it to the principal's entry
-        # (unless the profile tells us not to)
-        profile = api.Command['certprofile_show'](profile_id)
-        store = profile['result']['ipacertprofilestoreissued'][0] == 'TRUE'
-        if store and 'certificate' in result:
-            cert = result.get('certificate')
-            kwargs = dict(addattr=u'usercertificate={}'.format(cert))
-            # note: we call different commands for the different
-            # principal types because handling of 'userCertificate'
-            # vs. 'userCertificate;binary' varies by plugin.
-            if principal_type == SERVICE:
-                api.Command['service_mod'](principal_string, **kwargs)
-            elif principal_type == HOST:
-                api.Command['host_mod'](principal.hostname, **kwargs)
-            elif principal_type == USER:
-                api.Command['user_mod'](principal.username, **kwargs)
-            elif principal_type == KRBTGT:
-                logger.error("Profiles used to store cert should't be "
-                             "used for krbtgt certificates")
+    def _profile_stores_issued(self, profile_id):
+        profile = self.api.Command['certprofile_show'](profile_id)
+        return profile['result']['ipacertprofilestoreissued'][0] == 'TRUE'
 
-        if 'certificate_chain' in ca_obj:
-            cert = x509.load_der_x509_certificate(
-                base64.b64decode(result['certificate']))
-            cert = cert.public_bytes(serialization.Encoding.DER)
-            result['certificate_chain'] = [cert] + ca_obj['certificate_chain']
-
-        return dict(
-            result=result,
-            value=pkey_to_value(int(result['request_id']), kw),
-        )
+    def _store_certificates(self, principal, certs):
+        """
+        Add the base64-encoded ``certs`` to the entry of ``principal``
+        with a single modification.
+        """
+        principal_type = principal_to_principal_type(principal)
+        kwargs = dict(
+            addattr=[u'usercertificate={}'.format(cert) for cert in certs])
+        # note: we call different commands for the different
+        # principal types because handling of 'userCertificate'
+        # vs. 'userCertificate;binary' varies by plugin.
+        if principal_type == SERVICE:
+            self.api.Command['service_mod'](unicode(principal), **kwargs)
+        elif principal_type == HOST:
+            self.api.Command['host_mod'](principal.hostname, **kwargs)
+        elif principal_type == USER:
+            self.api.Command['user_mod'](principal.username, **kwargs)
+        elif principal_type == KRBTGT:
+            logger.error("Profiles used to store cert should't be "
+                         "used for krbtgt certificates")
 
     def lookup_principal(self, principal):
         """
@@ -972,6 +1006,246 @@ class cert_request(Create, BaseCertMethod, VirtualCommand):
                     reason=_("The principal for this request doesn't exist."))
 
 
+@register()
+class cert_request(Create, BaseCertMethod, BaseCertRequest):
+    __doc__ = _('Submit a certificate signing request.')
+
+    obj_name = 'certreq'
+    attr_name = 'request'
+
+    takes_args = (
+        CertificateSigningRequest(
+            'csr',
+            label=_('CSR'),
+            cli_name='csr_file',
+        ),
+    )
+    takes_options = (
+        Principal(
+            'principal',
+            validate_realm,
+            label=_('Principal'),
+            doc=_('Principal for this certificate (e.g. HTTP/test.example.com)'),
+            normalizer=normalize_principal
+        ),
+        Flag(
+            'add',
+            doc=_(
+                "automatically add the principal if it doesn't exist "
+                "(service principals only)"),
+        ),
+        _chain_flag,
+    )
+
+    def get_args(self):
+        # FIXME: the 'no_create' flag is ignored for positional arguments
+        for arg in super(cert_request, self).get_args():
+            if arg.name == 'request_id':
+                continue
+            yield arg
+
+    def execute(self, csr, all=False, raw=False, chain=False, **kw):
+        ca_enabled_check(self.api)
+
+        request_type = kw.get('request_type')
+        profile_id = kw.get('profile_id', self.Backend.ra.DEFAULT_PROFILE)
+
+        # Check that requested authority exists (done before CA ACL
+        # enforcement so that user gets better error message if
+        # referencing nonexistant CA) and look up authority ID.
+        #
+        ca = kw['cacn']
+        ca_obj = api.Command.ca_show(ca, all=all, chain=chain)['result']
+        ca_id = ca_obj['ipacaid'][0]
+
+        principal = self._check_request(
+            csr, kw.get('principal'), kw.get('add'), ca, profile_id, {})
+
+        # Request the certificate
+        try:
+            # re-serialise to PEM, in case the user-supplied data has
+            # extraneous material that will cause Dogtag to freak out
+            # keep it as string not bytes, it is required later
+            csr_pem = csr.public_bytes(
+                serialization.Encoding.PEM).decode('utf-8')
+            result = self.Backend.ra.request_certificate(
+                csr_pem, profile_id, ca_id, request_type=request_type)
+        except errors.HTTPRequestError as e:
+            raise self._submit_error(e, ca)
+
+        if not raw:
+            try:
+                self.obj._parse(result, all)
+            except ValueError as e:
+                self.add_message(
+                    messages.CertificateInvalid(
+                        subject=principal,
+                        reason=e,
+                    )
+                )
+            result['request_id'] = int(result['request_id'])
+            result['cacn'] = ca_obj['cn'][0]
+
+        # Success? Then add it to the principal's entry
+        # (unless the profile tells us not to)
+        if 'certificate' in result and self._profile_stores_issued(
+                profile_id):
+            self._store_certificates(principal, [result['certificate']])
+
+        if 'certificate_chain' in ca_obj:
+            cert = x509.load_der_x509_certificate(
+                base64.b64decode(result['certificate']))
+            cert = cert.public_bytes(serialization.Encoding.DER)
+            result['certificate_chain'] = [cert] + ca_obj['certificate_chain']
+
+        return dict(
+            result=result,
+            value=pkey_to_value(int(result['request_id']), kw),
+        )
+
+
+@register()
+class cert_request_batch(BaseCertRequest):
+    __doc__ = _("""
+Submit many certificate signing requests at once.
+
+Every request is a dict with the keys "csr" and "principal" and
+optionally "profile_id", "cacn" and "add", with the same meaning as the
+argument and the options of cert-request.
+
+The requests are validated one by one, sharing the lookups of CAs and
+profiles and the access checks of the bind principal. The CSRs that pass
+are then submitted to the CA concurrently and the issued certificates
+are added to the principals with one modification per principal.
+
+A request which fails does not affect the other requests; its result
+contains the error instead of the certificate.
+""")
+    NO_CLI = True
+
+    takes_args = (
+        Dict('requests+',
+            doc=_('Certificate requests'),
+        ),
+    )
+
+    has_output = (
+        output.Output('count', int, doc=_('Number of requests')),
+        output.Output('issued', int, doc=_('Number of issued certificates')),
+        output.Output('results', (list, tuple), doc=_('Per-request results')),
+    )
+
+    def _get_request(self, request):
+        """
+        Convert a request dict to the parameters of ``cert_request``
+        """
+        params = self.api.Command.cert_request.params
+        values = []
+        for name, default in (('csr', None),
+                              ('principal', None),
+                              ('cacn', IPA_CA_CN),
+                              ('profile_id', self.Backend.ra.DEFAULT_PROFILE)):
+            value = params[name](request.get(name, default))
+            params[name].validate(value)
+            values.append(value)
+        return values + [bool(request.get('add', False))]
+
+    def _error_result(self, e):
+        if isinstance(e, errors.PublicError):
+            reported_error = e
+        else:
+            logger.exception('cert_request_batch: %s', e)
+            reported_error = errors.InternalError()
+        return dict(
+            error=reported_error.strerror,
+            error_code=reported_error.errno,
+            error_name=unicode(type(reported_error).__name__),
+            error_kw=reported_error.kw,
+        )
+
+    def _fail_issued(self, result, e):
+        """
+        Turn the result of an issued certificate into an error result
+
+        The request ID and the serial number are kept so that the
+        certificate can still be found in the CA.
+        """
+        result.pop('certificate', None)
+        result.update(self._error_result(e))
+
+    def execute(self, requests, **options):
+        ca_enabled_check(self.api)
+
+        results = [None] * len(requests)
+        cas = {}
+        access = {}
+        # (index, principal, ca_obj, profile_id, csr PEM) of valid requests
+        valid = []
+
+        for i, request in enumerate(requests):
+            try:
+                csr, principal, ca, profile_id, add = self._get_request(
+                    request)
+                if ca not in cas:
+                    cas[ca] = self.api.Command.ca_show(ca)['result']
+                principal = self._check_request(
+                    csr, principal, add, ca, profile_id, access)
+            except Exception as e:
+                results[i] = self._error_result(e)
+                continue
+            csr_pem = csr.public_bytes(
+                serialization.Encoding.PEM).decode('utf-8')
+            valid.append((i, principal, cas[ca], profile_id, csr_pem))
+
+        responses = self.Backend.ra.request_certificates(
+            (csr_pem, profile_id, ca_obj['ipacaid'][0])
+            for _i, _principal, ca_obj, profile_id, csr_pem in valid
+        )
+
+        stores = {}
+        # principal -> [(index, certificate)], in the order of the requests
+        certs = collections.OrderedDict()
+        for (i, principal, ca_obj, profile_id, _csr), response in zip(
+                valid, responses):
+            if isinstance(response, Exception):
+                results[i] = self._error_result(
+                    self._submit_error(response, ca_obj['cn'][0]))
+                continue
+            results[i] = response
+            response.update(
+                principal=unicode(principal),
+                cacn=ca_obj['cn'][0],
+                request_id=int(response['request_id']),
+                error=None,
+            )
+            if 'certificate' not in response:
+                continue
+            try:
+                if profile_id not in stores:
+                    stores[profile_id] = self._profile_stores_issued(
+                        profile_id)
+            except Exception as e:
+                self._fail_issued(response, e)
+                continue
+            if stores[profile_id]:
+                certs.setdefault(principal, []).append(
+                    (i, response['certificate']))
+
+        for principal, issued in certs.items():
+            try:
+                self._store_certificates(
+                    principal, [cert for _i, cert in issued])
+            except Exception as e:
+                for i, _cert in issued:
+                    self._fail_issued(results[i], e)
+
+        return dict(
+            count=len(results),
+            issued=sum(1 for result in results if 'certificate' in result),
+            results=results,
+        )
+
+
 def _emails_are_valid(csr_emails, principal_emails):
     """
     Checks if any email address from certificate request does not
@@ -1551,24 +1825,13 @@ class cert_find(Search, CertMethod):
         filters.append(filter)
 
         filter = ldap.combine_filters(filters, ldap.MATCH_ALL)
-        try:
-            entries, truncated = ldap.find_entries(
-                base_dn=self.api.env.basedn,
-                filter=filter,
-                attrs_list=['usercertificate'],
-                time_limit=0,
-                size_limit=0,
-            )
-        except errors.EmptyResult:
-            entries = []
-            truncated = False
-        else:
-            try:
-                ldap.handle_truncated_result(truncated)
-            except errors.LimitsExceeded as e:
-                self.add_message(messages.SearchResultTruncated(reason=e))
-
-            truncated = bool(truncated)
+        entries = ldap.iter_entries(
+            base_dn=self.api.env.basedn,
+            filter=filter,
+            attrs_list=['usercertificate'],
+            time_limit=0,
+            size_limit=0,
+        )
 
         ca_enabled = getattr(context, 'ca_enabled')
         for entry in entries:
@@ -1597,6 +1860,13 @@ class cert_find(Search, CertMethod):
                         if entry.dn not in owners:
                             owners.append(entry.dn)
 
+        truncated = entries.truncated
+        try:
+            ldap.handle_truncated_result(truncated)
+        except errors.LimitsExceeded as e:
+            self.add_message(messages.SearchResultTruncated(reason=e))
+        truncated = bool(truncated)
+
         return result, truncated, complete
 
     def execute(self, criteria=None, all=False, raw=False, pkey_only=False,
@@ -1658,23 +1928,38 @@ class cert_find(Search, CertMethod):
             truncated = truncated or sub_truncated
             complete = complete or sub_complete
 
+        # truncate before retrieving the details of the certificates
+        if (len(result) > sizelimit > 0):
+            if not truncated:
+                self.add_message(messages.SearchResultTruncated(
+                        reason=errors.SizeLimitExceeded()))
+            for key in list(result)[sizelimit:]:
+                del result[key]
+            truncated = True
+
         if not pkey_only:
             ca_objs = {}
-            if ca_enabled:
-                ra = self.api.Backend.ra
+            certs = {}
+            if all:
+                keys = [key for key, obj in six.iteritems(result)
+                        if 'cacn' in obj]
+                for key in keys:
+                    cacn = result[key]['cacn']
+                    if cacn not in ca_objs:
+                        ca_objs[cacn] = (
+                            self.api.Command.ca_show(cacn, all=True)['result'])
+                if keys:
+                    certs = dict(zip(
+                        keys,
+                        self.api.Backend.ra.get_certificates(
+                            str(serial_number)
+                            for _issuer, serial_number in keys)))
 
             for key, obj in six.iteritems(result):
-                if all and 'cacn' in obj:
-                    _issuer, serial_number = key
-                    cacn = obj['cacn']
+                if key in certs:
+                    ca_obj = ca_objs[obj['cacn']]
 
-                    try:
-                        ca_obj = ca_objs[cacn]
-                    except KeyError:
-                        ca_obj = ca_objs[cacn] = (
-                            self.api.Command.ca_show(cacn, all=True)['result'])
-
-                    obj.update(ra.get_certificate(str(serial_number)))
+                    obj.update(certs[key])
                     if not raw:
                         obj['certificate'] = (
                             obj['certificate'].replace('\r\n', ''))
@@ -1695,12 +1980,6 @@ class cert_find(Search, CertMethod):
                     self.obj._fill_owners(obj)
 
         result = list(six.itervalues(result))
-        if (len(result) > sizelimit > 0):
-            if not truncated:
-                self.add_message(messages.SearchResultTruncated(
-                        reason=errors.SizeLimitExceeded()))
-            result = result[:sizelimit]
-            truncated = True
 
         ret = dict(
             result=result
@@ -1710,6 +1989,119 @@ class cert_find(Search, CertMethod):
         return ret
 
 
+@register()
+class cert_expiry_report(Command):
+    __doc__ = _("""
+Find the certificates stored in IPA entries which expire soon.
+
+The certificates are looked up in an index of the expiration dates of
+all certificates of users, hosts and services which every server process
+keeps in memory, so that the report does not need to search and parse
+all certificates again. The index picks up changes in the directory
+after at most cert_expiry_poll_interval seconds, see default.conf(5).
+
+Only the certificates of entries whose certificates the requester may
+read are reported.
+""")
+
+    takes_options = (
+        Int('days',
+            label=_('Days'),
+            doc=_('Report certificates expiring within this many days'),
+            default=30,
+            autofill=True,
+            minvalue=0,
+        ),
+        Flag('expired',
+            doc=_('Also report certificates which have already expired'),
+        ),
+        DNParam('issuer?',
+            label=_('Issuer'),
+            doc=_('Only report certificates issued by this DN'),
+        ),
+        Int('sizelimit?',
+            label=_("Size Limit"),
+            doc=_("Maximum number of entries returned (0 is unlimited)"),
+            minvalue=0,
+        ),
+    )
+
+    has_output = output.standard_list_of_entries
+
+    has_output_params = (
+        Str('valid_not_after', label=_('Not After')),
+        DNParam('issuer', label=_('Issuer')),
+        Int('serial_number', label=_('Serial number')),
+        Str('serial_number_hex', label=_('Serial number (hex)')),
+        DNParam('owner*', label=_('Owner')),
+    )
+
+    msg_summary = ngettext(
+        '%(count)d certificate matched', '%(count)d certificates matched', 0
+    )
+
+    def _readable_rows(self, ldap, rows):
+        """
+        Filter the index rows by the read permissions of the requester
+
+        The owners are checked in chunks, so that only the rows up to the
+        size limit need to be checked.
+        """
+        chunk_size = ldap.EXISTENCE_CHECK_CHUNK
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            readable = ldap.get_existing_dns(
+                {owner for _na, _i, _sn, owner in chunk},
+                filter=CERT_FILTER)
+            for row in chunk:
+                if row[3] in readable:
+                    yield row
+
+    def execute(self, days, expired=False, issuer=None, **options):
+        ldap = self.api.Backend.ldap2
+        sizelimit = options.get('sizelimit')
+        if sizelimit is None:
+            sizelimit = ldap.size_limit
+
+        now = datetime.datetime.utcnow()
+        rows = ldap.get_cert_expiry_index().find(
+            start=None if expired else now,
+            end=now + datetime.timedelta(days=days),
+            issuer=issuer,
+        )
+
+        # rows of the same certificate with different owners are adjacent
+        result = []
+        truncated = False
+        last = None
+        for not_after, cert_issuer, serial_number, owner in (
+                self._readable_rows(ldap, rows)):
+            if (not_after, cert_issuer, serial_number) == last:
+                result[-1]['owner'].append(owner)
+                continue
+            if sizelimit and len(result) >= sizelimit:
+                truncated = True
+                break
+            last = (not_after, cert_issuer, serial_number)
+            result.append(dict(
+                valid_not_after=x509.format_datetime(not_after),
+                issuer=cert_issuer,
+                serial_number=serial_number,
+                serial_number_hex=u'0x%X' % serial_number,
+                owner=[owner],
+            ))
+
+        if truncated:
+            self.add_message(messages.SearchResultTruncated(
+                reason=errors.SizeLimitExceeded()))
+
+        return dict(
+            result=result,
+            count=len(result),
+            truncated=truncated,
+        )
+
+
 @register()
 class ca_is_enabled(Command):
     __doc__ = _('Checks if any of the servers has the CA service enabled.')
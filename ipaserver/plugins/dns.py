@@ -20,11 +20,14 @@
 
 from __future__ import absolute_import
 
+import collections
+import json
 import logging
 
 import netaddr
 import time
 import re
+import types
 import binascii
 import encodings.idna
 
@@ -81,6 +84,7 @@ from ipapython.dn import DN
 from ipapython.ipautil import CheckedIPAddress
 from ipapython.dnsutil import check_zone_overlap
 from ipapython.dnsutil import DNSName
+from ipapython.dnsutil import iter_zone_file
 from ipapython.dnsutil import related_to_auto_empty_zone
 from ipaserver.dns_data_management import (
     IPASystemRecords,
@@ -223,6 +227,12 @@ EXAMPLES:
    Delete A record '192.0.2.3'? Yes/No (default No): y
      Record name: www
      A record: 192.0.2.2               (A record 192.0.2.3 has been deleted)
+""") + _("""
+ Import resource records from a zone file into zone example.com:
+   ipa dnszone-import example.com --file=example.com.zone
+""") + _("""
+ Export all resource records of zone example.com to a zone file:
+   ipa dnszone-export example.com --out=example.com.zone
 """) + _("""
  Show zone example.com:
    ipa dnszone-show example.com
@@ -3002,6 +3012,361 @@ class dnszone_remove_permission(DNSZoneBase_remove_permission):
     __doc__ = _('Remove a permission for per-zone access delegation.')
 
 
+@register()
+class dnszone_import(LDAPQuery):
+    __doc__ = _('Import resource records from a zone file.')
+
+    takes_options = (
+        Str('zonefile',
+            label=_('Zone file'),
+            doc=_('Resource records in RFC 1035 master file format'),
+            noextrawhitespace=False,
+        ),
+    )
+
+    has_output = (
+        output.summary,
+        output.Output('result', dict, _('Import statistics')),
+        output.Output('failed', (list, tuple),
+                      _('Records which could not be imported')),
+        output.PrimaryKey('value'),
+    )
+
+    msg_summary = _('Imported %(imported)d of %(records)d records '
+                    'into DNS zone "%(value)s"')
+
+    # number of owner names looked up by a single LDAP search
+    lookup_size = 100
+
+    def _failure(self, record, error):
+        return dict(
+            line=record.line,
+            name=unicode(record.name) if record.name is not None else None,
+            type=record.rdtype,
+            error=unicode(error),
+        )
+
+    def _iter_groups(self, zonefile, zone, stats, failed):
+        """
+        Parse and validate the records of a zone file
+
+        Yields (relative owner name, records, TTL) as soon as the records
+        of a name are complete, i.e. when the parser reaches a record of
+        another name. records is a list of (record, attribute, value)
+        tuples. A name whose records are spread over the zone file is
+        yielded once for every run of its records.
+        """
+        record_obj = self.api.Object.dnsrecord
+        name = None
+        records = []
+        ttl = None
+
+        for record in iter_zone_file(zonefile, zone):
+            stats['records'] += 1
+            if record.error is not None:
+                failed.append(self._failure(record, record.error))
+                continue
+            if (record.rdtype == 'SOA' or
+                    (record.rdtype == 'NS' and record.name == zone)):
+                # the zone apex is managed by IPA
+                stats['skipped'] += 1
+                continue
+            if not record.name.is_subdomain(zone):
+                failed.append(self._failure(
+                    record, _('out-of-zone data: record name must be '
+                              'a subdomain of the zone')))
+                continue
+
+            attr = record_name_format % record.rdtype.lower()
+            param = record_obj.params.get(attr)
+            if not isinstance(param, DNSRecord) or not param.supported:
+                failed.append(self._failure(
+                    record, _('unsupported record type')))
+                continue
+            try:
+                value = param(record.value)
+                param.validate(value)
+            except errors.ValidationError as e:
+                failed.append(self._failure(record, e))
+                continue
+
+            record_name = record.name.relativize(zone)
+            if record_name != name:
+                if records:
+                    yield name, records, ttl
+                name = record_name
+                records = []
+                ttl = None
+            records.append((record, attr, value[0]))
+            if record.ttl is not None and (ttl is None or record.ttl < ttl):
+                ttl = record.ttl
+
+        if records:
+            yield name, records, ttl
+
+    def _iter_chunks(self, groups):
+        """
+        Collect the groups of ``lookup_size`` names
+
+        Yields ordered dicts of relative owner name -> (records, TTL). The
+        records of a name which is yielded several times by ``groups``
+        within a chunk are merged.
+        """
+        chunk = collections.OrderedDict()
+        for name, records, ttl in groups:
+            if name in chunk:
+                old_records, old_ttl = chunk[name]
+                records = old_records + records
+                if old_ttl is not None and (ttl is None or old_ttl < ttl):
+                    ttl = old_ttl
+            elif len(chunk) >= self.lookup_size:
+                yield chunk
+                chunk = collections.OrderedDict()
+            chunk[name] = (records, ttl)
+        if chunk:
+            yield chunk
+
+    def _get_entries(self, zone_dn, names):
+        """
+        Return a dict of DN -> existing entry for the owner names
+        """
+        ldap = self.obj.backend
+        entries = {}
+        relative_names = []
+        for name in names:
+            if name.is_empty():
+                entry = ldap.get_entry(zone_dn, _record_attributes)
+                entries[entry.dn] = entry
+            else:
+                relative_names.append(name.ToASCII())
+
+        if relative_names:
+            filter = ldap.make_filter_from_attr(
+                'idnsname', relative_names, ldap.MATCH_ANY)
+            try:
+                result = ldap.get_entries(
+                    zone_dn, ldap.SCOPE_ONELEVEL, filter,
+                    ['idnsname'] + _record_attributes)
+            except errors.NotFound:
+                result = []
+            for entry in result:
+                entries[entry.dn] = entry
+        return entries
+
+    def _import_name(self, keys, dn, records, ttl, entry):
+        """
+        Add the records of a single owner name to its entry
+
+        Returns True if a new entry was created.
+        """
+        ldap = self.obj.backend
+        record_obj = self.api.Object.dnsrecord
+        name = keys[-1]
+
+        entry_attrs = {}
+        for _record, attr, value in records:
+            values = entry_attrs.setdefault(attr, [])
+            if value not in values:
+                values.append(value)
+
+        record_obj.run_precallback_validators(
+            dn, dict(entry_attrs, idnsname=[name]), *keys, force=True)
+
+        if entry is not None:
+            for attr, values in entry_attrs.items():
+                old_values = entry.get(attr, [])
+                entry_attrs[attr] = old_values + [
+                    v for v in values if v not in old_values]
+        rrattrs = record_obj.updated_rrattrs(entry, entry_attrs)
+        record_obj.check_record_type_dependencies(keys, rrattrs)
+        record_obj.check_record_type_collisions(keys, rrattrs)
+
+        if entry is None:
+            entry = ldap.make_entry(
+                dn,
+                objectclass=record_obj.object_class,
+                idnsname=[name],
+                **entry_attrs)
+            if ttl is not None:
+                entry['dnsttl'] = [ttl]
+            ldap.add_entry(entry)
+            return True
+
+        entry.update(entry_attrs)
+        try:
+            ldap.update_entry(entry)
+        except errors.EmptyModlist:
+            pass
+        return False
+
+    def execute(self, *keys, **options):
+        zone = keys[-1]
+        start = time.time()
+        zone_dn = self.api.Object.dnsrecord.check_zone(zone)
+
+        stats = dict(records=0, names=0, added=0, updated=0, imported=0,
+                     skipped=0)
+        failed = []
+        groups = self._iter_groups(options['zonefile'], zone, stats, failed)
+
+        # the records are written while the zone file is parsed. Existing
+        # entries are looked up for many names at once, new entries are
+        # added and existing ones modified one name at a time.
+        for chunk in self._iter_chunks(groups):
+            stats['names'] += len(chunk)
+            entries = self._get_entries(zone_dn, chunk)
+            for name, (records, ttl) in chunk.items():
+                dn = DN(('idnsname', name.ToASCII()), zone_dn)
+                if name.is_empty():
+                    dn = zone_dn
+                try:
+                    if self._import_name((zone, name), dn, records, ttl,
+                                         entries.get(dn)):
+                        stats['added'] += 1
+                    else:
+                        stats['updated'] += 1
+                except errors.PublicError as e:
+                    failed.extend(self._failure(record, e)
+                                  for record, _attr, _value in records)
+                else:
+                    stats['imported'] += len(records)
+
+        seconds = time.time() - start
+        stats['failed'] = len(failed)
+        stats['seconds'] = round(seconds, 3)
+        stats['records_per_second'] = int(stats['records'] / seconds
+                                          if seconds else stats['records'])
+
+        value = pkey_to_value(zone, options)
+        return dict(
+            result=stats,
+            failed=failed,
+            value=value,
+            summary=unicode(self.msg_summary % dict(stats, value=value)),
+        )
+
+
+@register()
+class dnszone_export(LDAPQuery):
+    __doc__ = _('Export the resource records of a DNS zone.')
+
+    takes_options = (
+        StrEnum('format?',
+            label=_('Format'),
+            doc=_('Output format: "zone" for a zone file, "jsonl" for one '
+                  'JSON object per record'),
+            values=(u'zone', u'jsonl'),
+            default=u'zone',
+            autofill=True,
+        ),
+        Str('out?',
+            doc=_('Write the zone data to file'),
+        ),
+    )
+
+    has_output = (
+        output.summary,
+        output.Output('result', (list, tuple, types.GeneratorType),
+                      _('Zone data, one line per item')),
+        output.PrimaryKey('value'),
+    )
+
+    msg_summary = _('%(count)d records of DNS zone "%(value)s" exported')
+
+    soa_attributes = [
+        'idnssoamname', 'idnssoarname', 'idnssoaserial', 'idnssoarefresh',
+        'idnssoaretry', 'idnssoaexpire', 'idnssoaminimum',
+    ]
+
+    def _get_ttl(self, entry, attr):
+        ttl = entry.single_value.get(attr)
+        if ttl is not None:
+            ttl = int(ttl)
+        return ttl
+
+    def _entry_records(self, name, entry):
+        """
+        Yield (name, TTL, type, data) for the records of an entry
+
+        Record data are exported as stored in LDAP, without IDN conversion.
+        """
+        ttl = self._get_ttl(entry, 'dnsttl')
+        for attr in _record_attributes:
+            rrtype = get_record_rrtype(attr)
+            for value in entry.get(attr, []):
+                yield name, ttl, rrtype, value
+
+    def _iter_records(self, zone_entry):
+        """
+        Yield (name, TTL, type, data) for all records of a zone
+
+        The zone apex comes first with its SOA record. The other names are
+        read with a paged search, one page of entries at a time, so the
+        export is not subject to the search size limit.
+        """
+        ldap = self.obj.backend
+
+        soa = u' '.join(
+            unicode(zone_entry.single_value[attr])
+            for attr in self.soa_attributes)
+        yield u'@', self._get_ttl(zone_entry, 'dnsttl'), u'SOA', soa
+        for record in self._entry_records(u'@', zone_entry):
+            yield record
+
+        result = ldap.iter_entries(
+            '(objectclass=idnsrecord)',
+            ['idnsname', 'dnsttl'] + _record_attributes,
+            zone_entry.dn,
+            scope=ldap.SCOPE_ONELEVEL, time_limit=0, size_limit=-1)
+        with result:
+            for entry in result:
+                name = entry.single_value['idnsname'].ToASCII()
+                for record in self._entry_records(name, entry):
+                    yield record
+        ldap.handle_truncated_result(result.truncated)
+
+    def _format_zone(self, name, ttl, rrtype, data):
+        if ttl is None:
+            return u'%s IN %s %s' % (name, rrtype, data)
+        return u'%s %d IN %s %s' % (name, ttl, rrtype, data)
+
+    def _format_jsonl(self, name, ttl, rrtype, data):
+        return unicode(json.dumps(
+            dict(name=name, ttl=ttl, type=rrtype, data=data),
+            sort_keys=True))
+
+    def _iter_lines(self, zone, zone_entry, format):
+        """
+        Yield the lines of the export of a zone, without line terminators
+        """
+        if format == u'zone':
+            yield u'$ORIGIN %s' % zone.ToASCII()
+            default_ttl = self._get_ttl(zone_entry, 'dnsdefaultttl')
+            if default_ttl is not None:
+                yield u'$TTL %d' % default_ttl
+
+        formatter = getattr(self, '_format_%s' % format)
+        for record in self._iter_records(zone_entry):
+            yield formatter(*record)
+
+    def execute(self, *keys, **options):
+        ldap = self.obj.backend
+        zone = keys[-1]
+        zone_dn = self.api.Object.dnsrecord.check_zone(zone)
+        zone_entry = ldap.get_entry(
+            zone_dn,
+            ['dnsttl', 'dnsdefaultttl'] + self.soa_attributes +
+            _record_attributes)
+
+        # the lines are generated while the response is sent, the server
+        # does not hold the whole zone data
+        return dict(
+            result=self._iter_lines(zone, zone_entry, options['format']),
+            value=pkey_to_value(zone, options),
+            summary=None,
+        )
+
+
 @register()
 class dnsrecord(LDAPObject):
     """
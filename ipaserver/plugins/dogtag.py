@@ -247,7 +247,9 @@ import logging
 
 from lxml import etree
 import time
+import threading
 import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 import six
 
@@ -1254,10 +1256,23 @@ class RestClient(Backend):
             self.client_keyfile = paths.RA_AGENT_KEY
         super(RestClient, self).__init__(api)
 
+        # keep-alive connections to the CA are only reused inside of the
+        # long running WSGI workers
+        if api.env.context == 'server':
+            pool_size = int(api.env.ra_pool_size)
+        else:
+            pool_size = 0
+        self._pool = dogtag.HTTPConnectionPool(max_size=pool_size)
+
         self._ca_host = None
-        # session cookie
         self.override_port = None
-        self.cookie = None
+        # session cookie of the thread, the backend is shared by the threads
+        # of the parallel batch command
+        self._session = threading.local()
+
+    @property
+    def cookie(self):
+        return getattr(self._session, 'cookie', None)
 
     @property
     def ca_host(self):
@@ -1270,16 +1285,19 @@ class RestClient(Backend):
             return self._ca_host
 
         ldap2 = self.api.Backend.ldap2
+        ca_host = None
         if host_has_service(api.env.ca_host, ldap2, "CA"):
-            object.__setattr__(self, '_ca_host', api.env.ca_host)
+            ca_host = api.env.ca_host
         elif api.env.host != api.env.ca_host:
             if host_has_service(api.env.host, ldap2, "CA"):
-                object.__setattr__(self, '_ca_host', api.env.host)
+                ca_host = api.env.host
         else:
-            object.__setattr__(self, '_ca_host', select_any_master(ldap2))
-        if self._ca_host is None:
-            object.__setattr__(self, '_ca_host', api.env.ca_host)
-        return self._ca_host
+            ca_host = select_any_master(ldap2)
+        if ca_host is None:
+            ca_host = api.env.ca_host
+        # another thread may refresh the cached value meanwhile
+        object.__setattr__(self, '_ca_host', ca_host)
+        return ca_host
 
     def __enter__(self):
         """Log into the REST API"""
@@ -1295,14 +1313,19 @@ class RestClient(Backend):
             cafile=self.ca_cert,
             client_certfile=self.client_certfile,
             client_keyfile=self.client_keyfile,
-            method='GET'
+            method='GET',
+            pool=self._pool,
         )
         cookies = ipapython.cookie.Cookie.parse(resp_headers.get('set-cookie', ''))
         if status != 200 or len(cookies) == 0:
             raise errors.RemoteRetrieveError(reason=_('Failed to authenticate to CA REST API'))
-        object.__setattr__(self, 'cookie', str(cookies[0]))
+        self._session.cookie = str(cookies[0])
         return self
 
+    def get_pool_stats(self):
+        """Return counters of the keep-alive connection pool to the CA."""
+        return self._pool.stats()
+
     def __exit__(self, exc_type, exc_value, traceback):
         """Log out of the REST API"""
         dogtag.https_request(
@@ -1311,9 +1334,10 @@ class RestClient(Backend):
             cafile=self.ca_cert,
             client_certfile=self.client_certfile,
             client_keyfile=self.client_keyfile,
-            method='GET'
+            method='GET',
+            pool=self._pool,
         )
-        object.__setattr__(self, 'cookie', None)
+        self._session.cookie = None
 
     def _ssldo(self, method, path, headers=None, body=None, use_session=True):
         """
@@ -1355,7 +1379,8 @@ class RestClient(Backend):
             cafile=self.ca_cert,
             client_certfile=self.client_certfile,
             client_keyfile=self.client_keyfile,
-            method=method, headers=headers, body=body
+            method=method, headers=headers, body=body,
+            pool=self._pool,
         )
         if status < 200 or status >= 300:
             explanation = self._parse_dogtag_error(resp_body) or ''
@@ -1420,6 +1445,7 @@ class ra(rabase.rabase, RestClient):
             cafile=self.ca_cert,
             client_certfile=self.client_certfile,
             client_keyfile=self.client_keyfile,
+            pool=self._pool,
             **kw)
 
     def get_parse_result_xml(self, xml_text, parse_func):
@@ -1603,6 +1629,57 @@ class ra(rabase.rabase, RestClient):
 
         return cmd_result
 
+    def get_certificates(self, serial_numbers):
+        """
+        Retrieve several existing certificates.
+
+        :param serial_numbers: Certificate serial numbers, see
+                               ``get_certificate``.
+
+        The certificates are retrieved concurrently by as many threads as
+        there are pooled connections to the CA (``ra_pool_size``). Returns
+        a list of ``get_certificate`` results in the order of
+        ``serial_numbers``; the first failure is raised.
+        """
+        serial_numbers = list(serial_numbers)
+        max_workers = min(self._pool.max_size, len(serial_numbers))
+        if max_workers <= 1:
+            return [self.get_certificate(sn) for sn in serial_numbers]
+
+        # the CA host is looked up in LDAP, which is only connected in the
+        # request thread
+        _ca_host = self.ca_host
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.get_certificate, serial_numbers))
+
+    def request_certificates(self, requests):
+        """
+        Submit several certificate signing requests.
+
+        :param requests: iterable of ``(csr, profile_id, ca_id)`` tuples,
+                         see ``request_certificate``.
+
+        The requests are submitted concurrently by as many threads as there
+        are pooled connections to the CA (``ra_pool_size``). Returns a list
+        with either the ``request_certificate`` result or the exception it
+        raised for every request, in the order of ``requests``.
+        """
+        def request(args):
+            try:
+                return self.request_certificate(*args)
+            except Exception as e:
+                return e
+
+        requests = list(requests)
+        max_workers = min(self._pool.max_size, len(requests))
+        if max_workers <= 1:
+            return [request(args) for args in requests]
+
+        # the CA host is looked up in LDAP, which is only connected in the
+        # request thread
+        _ca_host = self.ca_host
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(request, requests))
 
     def request_certificate(
             self, csr, profile_id, ca_id, request_type='pkcs10'):
@@ -1921,7 +1998,8 @@ class ra(rabase.rabase, RestClient):
             headers={'Accept-Encoding': 'gzip, deflate',
                      'User-Agent': 'IPA',
                      'Content-Type': 'application/xml'},
-            body=payload
+            body=payload,
+            pool=self._pool,
         )
 
         if status != 200:
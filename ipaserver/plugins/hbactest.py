@@ -17,11 +17,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import itertools
 import logging
+import threading
 
 from ipalib import api, errors, output, util
 from ipalib import Command, Str, Flag, Int
-from ipalib import _
+from ipalib import _, ngettext
+from ipalib.request import context
 from ipapython.dn import DN
 from ipalib.plugable import Registry
 if api.env.in_server and api.env.context in ['lite', 'server']:
@@ -146,6 +150,31 @@ EXAMPLES:
       Matched rules: allow_all
 
 
+TESTING MANY ACCESS REQUESTS
+
+hbactest-bulk tests every combination of the given users, target hosts and
+services in one call. Each user, host and service is looked up only once and
+the result lists the outcome of every access request:
+
+    $ ipa hbactest-bulk --user=a1a --user=b2b --host=bar --service=sshd \\
+          --nodetail
+    ------------------------------
+    1 of 2 access requests granted
+    ------------------------------
+      User name: a1a
+      Target host: bar.example.com
+      Service: sshd
+      Access granted: True
+
+      User name: b2b
+      Target host: bar.example.com
+      Service: sshd
+      Access granted: False
+    ----------------------------------
+    Number of access requests tested 2
+    ----------------------------------
+
+
 HBACTEST AND TRUSTED DOMAINS
 
 When an external trusted domain is configured in IPA, HBAC rules are also applied
@@ -219,6 +248,15 @@ logger = logging.getLogger(__name__)
 
 register = Registry()
 
+# principal -> ((number of rules, highest entryUSN), [(rule, pyhbac rule)]),
+# least recently used first. The rules are read with the permissions of the
+# principal, so they are not shared between principals.
+_rule_cache = collections.OrderedDict()
+_rule_cache_lock = threading.Lock()
+# maximum number of principals whose rules are cached
+RULE_CACHE_SIZE = 32
+
+
 def _convert_to_ipa_rule(rule):
     # convert a dict with a rule to an pyhbac rule
     ipa_rule = pyhbac.HbacRule(rule['cn'][0])
@@ -317,11 +355,49 @@ class hbactest(Command):
             return u'%s.%s' % (host, self.env.domain)
         return host
 
-    def execute(self, *args, **options):
-        # First receive all needed information:
-        # 1. HBAC rules (whether enabled or disabled)
-        # 2. Required options are (user, target host, service)
-        # 3. Options: rules to test (--rules, --enabled, --disabled), request for detail output
+    def _find_rules(self, sizelimit):
+        """
+        Return a list of (rule, converted pyhbac rule) of all HBAC rules
+
+        Converted rules are cached per WSGI worker and principal until a
+        HBAC rule is added, modified or removed, which includes changes of
+        the rule members, e.g. when a member group gets renamed. All rules
+        are cached, sizelimit is applied to the cached list. The cached
+        pyhbac rules must not be modified.
+        """
+        ldap = self.api.Backend.ldap2
+        if sizelimit is None:
+            sizelimit = ldap.size_limit
+        principal = getattr(context, 'principal', None)
+        signature = ldap.get_entries_signature(
+            '(objectclass=ipahbacrule)',
+            DN(self.api.env.container_hbac, self.api.env.basedn))
+
+        rules = None
+        with _rule_cache_lock:
+            cached = _rule_cache.get(principal)
+            if cached is not None and cached[0] == signature:
+                _rule_cache.move_to_end(principal)
+                rules = cached[1]
+
+        if rules is None:
+            hbacset = self.api.Command.hbacrule_find(
+                sizelimit=0, no_members=False)['result']
+            rules = [(rule, _convert_to_ipa_rule(rule)) for rule in hbacset]
+            with _rule_cache_lock:
+                _rule_cache[principal] = (signature, rules)
+                _rule_cache.move_to_end(principal)
+                while len(_rule_cache) > RULE_CACHE_SIZE:
+                    _rule_cache.popitem(last=False)
+
+        if sizelimit:
+            rules = rules[:sizelimit]
+        return rules
+
+    def _get_rules(self, options):
+        """
+        Return the rules to test and the list of unresolved --rules
+        """
         rules = []
 
         # Use all enabled IPA rules by default
@@ -351,12 +427,12 @@ class hbactest(Command):
 
         hbacset = []
         if len(testrules) == 0:
-            hbacset = self.api.Command.hbacrule_find(
-                sizelimit=sizelimit, no_members=False)['result']
+            hbacset = self._find_rules(sizelimit)
         else:
             for rule in testrules:
                 try:
-                    hbacset.append(self.api.Command.hbacrule_show(rule)['result'])
+                    rule = self.api.Command.hbacrule_show(rule)['result']
+                    hbacset.append((rule, _convert_to_ipa_rule(rule)))
                 except Exception:
                     pass
 
@@ -364,8 +440,7 @@ class hbactest(Command):
         # --enabled will import all enabled rules (default)
         # --disabled will import all disabled rules
         # --rules will implicitly add the rules from a rule list
-        for rule in hbacset:
-            ipa_rule = _convert_to_ipa_rule(rule)
+        for rule, ipa_rule in hbacset:
             if ipa_rule.name in testrules:
                 ipa_rule.enabled = True
                 rules.append(ipa_rule)
@@ -375,102 +450,133 @@ class hbactest(Command):
                 rules.append(ipa_rule)
             elif all_disabled and not ipa_rule.enabled:
                 # Option --disabled forces to include all disabled IPA rules into test
+                # (convert the rule again, cached rules must not be modified)
+                ipa_rule = _convert_to_ipa_rule(rule)
                 ipa_rule.enabled = True
                 rules.append(ipa_rule)
 
-        # Check if there are unresolved rules left
-        if len(testrules) > 0:
-            # Error, unresolved rules are left in --rules
-            return {'summary' : unicode(_(u'Unresolved rules in --rules')),
-                    'error': testrules, 'matched': None, 'notmatched': None,
-                    'warning' : None, 'value' : False}
+        return rules, testrules
 
-        # Rules are converted to pyhbac format, build request and then test it
-        request = pyhbac.HbacRequest()
+    def _resolve_user(self, user, graph):
+        """
+        Return the name and the groups of the user in the HBAC request
+        """
+        name = None
+        groups = []
 
-        if options['user'] != u'all':
-            # check first if this is not a trusted domain user
-            if _dcerpc_bindings_installed:
-                is_valid_sid = ipaserver.dcerpc.is_sid_valid(options['user'])
+        # check first if this is not a trusted domain user
+        if _dcerpc_bindings_installed:
+            is_valid_sid = ipaserver.dcerpc.is_sid_valid(user)
+        else:
+            is_valid_sid = False
+        components = util.normalize_name(user)
+        if is_valid_sid or 'domain' in components or 'flatname' in components:
+            # this is a trusted domain user
+            if not _dcerpc_bindings_installed:
+                raise errors.NotFound(reason=_(
+                    'Cannot perform external member validation without '
+                    'Samba 4 support installed. Make sure you have installed '
+                    'server-trust-ad sub-package of IPA on the server'))
+            domain_validator = ipaserver.dcerpc.DomainValidator(self.api)
+            if not domain_validator.is_configured():
+                raise errors.NotFound(reason=_(
+                    'Cannot search in trusted domains without own domain configured. '
+                    'Make sure you have run ipa-adtrust-install on the IPA server first'))
+            user_sid, group_sids = domain_validator.get_trusted_domain_user_and_groups(user)
+            name = user_sid
+
+            # Now search for all external groups that have this user or
+            # any of its groups in its external members. Found entires
+            # memberOf links will be then used to gather all groups where
+            # this group is assigned, including the nested ones
+            filter_sids = "(&(objectclass=ipaexternalgroup)(|(ipaExternalMember=%s)))" \
+                    % ")(ipaExternalMember=".join(group_sids + [user_sid])
+
+            ldap = self.api.Backend.ldap2
+            group_container = DN(api.env.container_group, api.env.basedn)
+            try:
+                entries, _truncated = ldap.find_entries(
+                    filter_sids, ['memberof'], group_container)
+            except errors.NotFound:
+                pass
             else:
-                is_valid_sid = False
-            components = util.normalize_name(options['user'])
-            if is_valid_sid or 'domain' in components or 'flatname' in components:
-                # this is a trusted domain user
-                if not _dcerpc_bindings_installed:
-                    raise errors.NotFound(reason=_(
-                        'Cannot perform external member validation without '
-                        'Samba 4 support installed. Make sure you have installed '
-                        'server-trust-ad sub-package of IPA on the server'))
-                domain_validator = ipaserver.dcerpc.DomainValidator(self.api)
-                if not domain_validator.is_configured():
-                    raise errors.NotFound(reason=_(
-                        'Cannot search in trusted domains without own domain configured. '
-                        'Make sure you have run ipa-adtrust-install on the IPA server first'))
-                user_sid, group_sids = domain_validator.get_trusted_domain_user_and_groups(options['user'])
-                request.user.name = user_sid
-
-                # Now search for all external groups that have this user or
-                # any of its groups in its external members. Found entires
-                # memberOf links will be then used to gather all groups where
-                # this group is assigned, including the nested ones
-                filter_sids = "(&(objectclass=ipaexternalgroup)(|(ipaExternalMember=%s)))" \
-                        % ")(ipaExternalMember=".join(group_sids + [user_sid])
-
-                ldap = self.api.Backend.ldap2
-                group_container = DN(api.env.container_group, api.env.basedn)
-                try:
-                    entries, _truncated = ldap.find_entries(
-                        filter_sids, ['memberof'], group_container)
-                except errors.NotFound:
-                    request.user.groups = []
+                for entry in entries:
+                    memberof_dns = entry.get('memberof', [])
+                    for memberof_dn in memberof_dns:
+                        if memberof_dn.endswith(group_container):
+                            groups.append(memberof_dn[0][0].value)
+        else:
+            # try searching for a local user
+            try:
+                name = user
+                if graph is not None:
+                    groups = graph.get_group_names(
+                        self.api.Object.user.get_dn(user),
+                        DN(api.env.container_group, api.env.basedn))
                 else:
-                    groups = []
-                    for entry in entries:
-                        memberof_dns = entry.get('memberof', [])
-                        for memberof_dn in memberof_dns:
-                            if memberof_dn.endswith(group_container):
-                                groups.append(memberof_dn[0][0].value)
-                    request.user.groups = sorted(set(groups))
-            else:
-                # try searching for a local user
-                try:
-                    request.user.name = options['user']
-                    search_result = self.api.Command.user_show(request.user.name)['result']
+                    search_result = self.api.Command.user_show(user)['result']
                     groups = search_result['memberof_group']
                     if 'memberofindirect_group' in search_result:
                         groups += search_result['memberofindirect_group']
-                    request.user.groups = sorted(set(groups))
-                except Exception:
-                    pass
-
-        if options['service'] != u'all':
-            try:
-                request.service.name = options['service']
-                service_result = self.api.Command.hbacsvc_show(request.service.name)['result']
-                if 'memberof_hbacsvcgroup' in service_result:
-                    request.service.groups = service_result['memberof_hbacsvcgroup']
             except Exception:
                 pass
 
-        if options['targethost'] != u'all':
-            try:
-                request.targethost.name = self.canonicalize(options['targethost'])
-                tgthost_result = self.api.Command.host_show(request.targethost.name)['result']
+        return name, sorted(set(groups))
+
+    def _resolve_service(self, service):
+        """
+        Return the name and the groups of the service in the HBAC request
+        """
+        groups = []
+        try:
+            service_result = self.api.Command.hbacsvc_show(service)['result']
+            if 'memberof_hbacsvcgroup' in service_result:
+                groups = service_result['memberof_hbacsvcgroup']
+        except Exception:
+            pass
+        return service, groups
+
+    def _resolve_targethost(self, targethost, graph):
+        """
+        Return the name and the groups of the target host in the HBAC request
+        """
+        name = self.canonicalize(targethost)
+        groups = []
+        try:
+            if graph is not None:
+                groups = graph.get_group_names(
+                    self.api.Object.host.get_dn(name),
+                    DN(api.env.container_hostgroup, api.env.basedn))
+            else:
+                tgthost_result = self.api.Command.host_show(name)['result']
                 groups = tgthost_result['memberof_hostgroup']
                 if 'memberofindirect_hostgroup' in tgthost_result:
                     groups += tgthost_result['memberofindirect_hostgroup']
-                request.targethost.groups = sorted(set(groups))
-            except Exception:
-                pass
+        except Exception:
+            pass
+        return name, sorted(set(groups))
 
+    def _make_request(self, user, service, targethost):
+        """
+        Build HBAC request from the resolved (name, groups) pairs
+        """
+        request = pyhbac.HbacRequest()
+        for element, value in ((request.user, user),
+                               (request.service, service),
+                               (request.targethost, targethost)):
+            if value is not None:
+                element.name, element.groups = value
+        return request
+
+    def _evaluate(self, request, rules, nodetail):
+        """
+        Return (access granted, matched, not matched, error rules)
+        """
         matched_rules = []
         notmatched_rules = []
         error_rules = []
-        warning_rules = []
 
-        result = {'warning':None, 'matched':None, 'notmatched':None, 'error':None}
-        if not options['nodetail']:
+        if not nodetail:
             # Validate runs rules one-by-one and reports failed ones
             for ipa_rule in rules:
                 try:
@@ -494,8 +600,40 @@ class hbactest(Command):
             res = request.evaluate(rules)
             access_granted = (res == pyhbac.HBAC_EVAL_ALLOW)
 
-        result['summary'] = _('Access granted: %s') % (access_granted)
+        return access_granted, matched_rules, notmatched_rules, error_rules
+
+    def execute(self, *args, **options):
+        # First receive all needed information:
+        # 1. HBAC rules (whether enabled or disabled)
+        # 2. Required options are (user, target host, service)
+        # 3. Options: rules to test (--rules, --enabled, --disabled), request for detail output
+        rules, testrules = self._get_rules(options)
+
+        # Check if there are unresolved rules left
+        if len(testrules) > 0:
+            # Error, unresolved rules are left in --rules
+            return {'summary' : unicode(_(u'Unresolved rules in --rules')),
+                    'error': testrules, 'matched': None, 'notmatched': None,
+                    'warning' : None, 'value' : False}
+
+        # Rules are converted to pyhbac format, build request and then test it
+        graph = self.api.Backend.ldap2.get_membership_graph()
+
+        user = service = targethost = None
+        if options['user'] != u'all':
+            user = self._resolve_user(options['user'], graph)
+        if options['service'] != u'all':
+            service = self._resolve_service(options['service'])
+        if options['targethost'] != u'all':
+            targethost = self._resolve_targethost(options['targethost'], graph)
+        request = self._make_request(user, service, targethost)
 
+        access_granted, matched_rules, notmatched_rules, error_rules = \
+            self._evaluate(request, rules, options['nodetail'])
+        warning_rules = []
+
+        result = {'warning':None, 'matched':None, 'notmatched':None, 'error':None}
+        result['summary'] = _('Access granted: %s') % (access_granted)
 
         if len(matched_rules) > 0:
             result['matched'] = matched_rules
@@ -508,3 +646,97 @@ class hbactest(Command):
 
         result['value'] = access_granted
         return result
+
+
+@register()
+class hbactest_bulk(hbactest):
+    __doc__ = _('Simulate use of Host-based access controls for many '
+                'combinations of users, hosts and services')
+
+    has_output = (
+        output.summary,
+        output.ListOfEntries('result'),
+        output.Output('count', int, _('Number of access requests tested')),
+    )
+
+    has_output_params = (
+        Str('user', label=_('User name')),
+        Str('targethost', label=_('Target host')),
+        Str('service', label=_('Service')),
+        Flag('value', label=_('Access granted')),
+        Str('matched*', label=_('Matched rules')),
+        Str('notmatched*', label=_('Not matched rules')),
+        Str('error*', label=_('Non-existent or invalid rules')),
+    )
+
+    takes_options = (
+        Str('user+',
+            cli_name='user',
+            label=_('User names'),
+        ),
+        Str('targethost+',
+            cli_name='host',
+            label=_('Target hosts'),
+        ),
+        Str('service+',
+            cli_name='service',
+            label=_('Services'),
+        ),
+    ) + tuple(
+        option for option in hbactest.takes_options
+        if option.name in ('rules', 'nodetail', 'enabled', 'disabled',
+                           'sizelimit')
+    )
+
+    def execute(self, *args, **options):
+        rules, testrules = self._get_rules(options)
+        if len(testrules) > 0:
+            raise errors.NotFound(
+                reason=_('Unresolved rules in --rules: %(rules)s') % dict(
+                    rules=', '.join(testrules)))
+
+        # every user, host and service is resolved only once
+        graph = self.api.Backend.ldap2.get_membership_graph()
+        users = [
+            (user, self._resolve_user(user, graph) if user != u'all' else None)
+            for user in options['user']
+        ]
+        services = [
+            (service,
+             self._resolve_service(service) if service != u'all' else None)
+            for service in options['service']
+        ]
+        targethosts = [
+            (host,
+             self._resolve_targethost(host, graph) if host != u'all' else None)
+            for host in options['targethost']
+        ]
+
+        result = []
+        granted = 0
+        for (user, user_value), (host, host_value), (service, service_value) \
+                in itertools.product(users, targethosts, services):
+            request = self._make_request(user_value, service_value, host_value)
+            access_granted, matched_rules, notmatched_rules, error_rules = \
+                self._evaluate(request, rules, options['nodetail'])
+            entry = dict(
+                user=user,
+                targethost=host_value[0] if host_value else host,
+                service=service,
+                value=access_granted,
+            )
+            if matched_rules:
+                entry['matched'] = matched_rules
+            if notmatched_rules:
+                entry['notmatched'] = notmatched_rules
+            if error_rules:
+                entry['error'] = error_rules
+            result.append(entry)
+            granted += access_granted
+
+        summary = ngettext(
+            '%(granted)d of %(count)d access request granted',
+            '%(granted)d of %(count)d access requests granted',
+            len(result)) % dict(granted=granted, count=len(result))
+
+        return dict(result=result, count=len(result), summary=summary)
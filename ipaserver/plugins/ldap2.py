@@ -29,8 +29,11 @@ Backend plugin for LDAP.
 
 from __future__ import absolute_import
 
+import contextlib
 import logging
 import os
+import threading
+import time
 
 import ldap as _ldap
 
@@ -38,11 +41,14 @@ from ipalib import krb_utils
 from ipaplatform.paths import paths
 from ipapython.dn import DN
 from ipapython.ipaldap import (LDAPClient, AUTOBIND_AUTO, AUTOBIND_ENABLED,
-                               AUTOBIND_DISABLED)
+                               AUTOBIND_DISABLED, ldap_operation_duration)
 
 from ipalib import Registry, errors, _
 from ipalib.crud import CrudBackend
 from ipalib.request import context
+from ipaserver.ldap_pool import LDAPConnectionPool, ServiceConnection
+from ipaserver.certexpiry import CertExpiryIndex
+from ipaserver.membership import MembershipGraph
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +56,11 @@ register = Registry()
 
 _missing = object()
 
+# KRB5CCNAME is shared by all threads of the process. GSSAPI binds read the
+# credentials from it, so setting it and binding must not interleave with
+# another thread doing the same.
+_krb5ccname_lock = threading.Lock()
+
 
 @register()
 class ldap2(CrudBackend, LDAPClient):
@@ -57,16 +68,50 @@ class ldap2(CrudBackend, LDAPClient):
     LDAP Backend Take 2.
     """
 
+    # maximum number of values in the filter of one existence check search
+    EXISTENCE_CHECK_CHUNK = 500
+
     def __init__(self, api):
         force_schema_updates = api.env.context in ('installer', 'updates')
+        if api.env.context == 'server':
+            # the home directory of the WSGI user is not writable, share
+            # the parsed schema between the workers in a runtime directory
+            schema_cache_dir = paths.IPA_LDAP_SCHEMA_CACHE_DIR
+        else:
+            schema_cache_dir = None
 
         CrudBackend.__init__(self, api)
         LDAPClient.__init__(self, None,
-                            force_schema_updates=force_schema_updates)
+                            force_schema_updates=force_schema_updates,
+                            schema_cache_dir=schema_cache_dir)
 
         self._time_limit = float(LDAPClient.time_limit)
         self._size_limit = int(LDAPClient.size_limit)
 
+        # bound connections, the membership graph and the certificate
+        # expiration index are only kept inside of the long running WSGI
+        # workers
+        if api.env.context == 'server':
+            pool_size = int(api.env.ldap_pool_size)
+        else:
+            pool_size = 0
+        self._pool = LDAPConnectionPool(
+            max_size=pool_size, ttl=int(api.env.ldap_pool_ttl))
+        if api.env.context == 'server':
+            self._service_conn = ServiceConnection(self._connect_service)
+        else:
+            self._service_conn = None
+        if api.env.context == 'server' and api.env.membership_graph:
+            self._membership = MembershipGraph(
+                poll_interval=int(api.env.membership_poll_interval))
+        else:
+            self._membership = None
+        if api.env.context == 'server':
+            self._cert_expiry = CertExpiryIndex(
+                poll_interval=int(api.env.cert_expiry_poll_interval))
+        else:
+            self._cert_expiry = None
+
     @property
     def ldap_uri(self):
         return self.api.env.ldap_uri
@@ -117,6 +162,108 @@ class ldap2(CrudBackend, LDAPClient):
     def __str__(self):
         return self.ldap_uri
 
+    @contextlib.contextmanager
+    def error_handler(self, arg_desc=None):
+        try:
+            with super(ldap2, self).error_handler(arg_desc):
+                yield
+        except errors.NetworkError:
+            # never hand a broken connection to another request
+            if self.isconnected():
+                self._pool.discard(self.conn)
+            raise
+
+    def get_pool_stats(self):
+        """Return hit/miss counters of the LDAP connection pool."""
+        return self._pool.stats()
+
+    def get_entries_signature(self, filter, base_dn,
+                              scope=_ldap.SCOPE_ONELEVEL):
+        """
+        Return (number of entries, highest entryUSN) of matching entries.
+
+        The signature changes whenever a matching entry is added, modified
+        or removed. It is used to invalidate caches of data derived from a
+        set of entries without reading the entries again.
+        """
+        try:
+            entries, _truncated = self.find_entries(
+                filter, ['entryusn'], base_dn, scope,
+                size_limit=-1, paged_search=True)
+        except errors.EmptyResult:
+            return 0, 0
+        return len(entries), max(
+            int(entry.single_value.get('entryusn', 0)) for entry in entries)
+
+    def _connect_service(self):
+        """
+        Connect and bind with the credentials of the HTTP service.
+
+        The WSGI workers get them from gssproxy through the ccache configured
+        for httpd.
+        """
+        client = LDAPClient(self.ldap_uri, cacert=paths.IPA_CA_CRT)
+        if self.ldap_uri.startswith('ldapi://'):
+            with client.error_handler():
+                client.conn.set_option(
+                    _ldap.OPT_HOST_NAME, self.api.env.host)
+        with _krb5ccname_lock:
+            ccache = os.environ.get('KRB5CCNAME')
+            os.environ['KRB5CCNAME'] = paths.KRB5CC_HTTPD
+            try:
+                client.gssapi_bind()
+            finally:
+                if ccache is None:
+                    os.environ.pop('KRB5CCNAME', None)
+                else:
+                    os.environ['KRB5CCNAME'] = ccache
+        return client
+
+    @contextlib.contextmanager
+    def service_connection(self):
+        """
+        Context manager yielding a connection bound as the IPA server.
+
+        Data which the worker keeps for all requests must be read with it
+        rather than with the connection of the current request, otherwise
+        it would depend on the read permissions of the principal whose
+        request loaded it. Outside of the WSGI workers all requests are made
+        by the same principal and the current connection is used.
+        """
+        if self._service_conn is None:
+            yield self
+        else:
+            with self._service_conn.use() as conn:
+                yield conn
+
+    def get_membership_graph(self):
+        """
+        Return the up to date group membership graph of the worker.
+
+        Returns None when the graph is disabled, callers have to fall back
+        to the memberOf attributes then.
+        """
+        if self._membership is None:
+            return None
+        with self.service_connection() as conn:
+            self._membership.refresh(conn, self.api.env.basedn)
+        return self._membership
+
+    def get_cert_expiry_index(self):
+        """
+        Return the up to date certificate expiration index of the worker.
+
+        Outside of the WSGI workers a new index is built on every call.
+        The index contains the certificates of all entries, regardless of
+        the permissions of the current principal.
+        """
+        index = self._cert_expiry
+        if index is None:
+            index = CertExpiryIndex()
+        with self.service_connection() as conn:
+            index.refresh(conn, self.api.env.basedn)
+        return index
+
     def create_connection(
             self, ccache=None, bind_dn=None, bind_pw='', cacert=None,
             autobind=AUTOBIND_AUTO, serverctrls=None, clientctrls=None,
@@ -139,6 +286,10 @@ class ldap2(CrudBackend, LDAPClient):
                 - _missing - keeps previously configured settings
                              (unlimited set by default in constructor)
 
+        GSSAPI bound connections made with a ccache are taken from and
+        returned to the connection pool of the worker, keyed by the principal
+        and the ccache name.
+
         Extends backend.Connectible.create_connection.
         """
         if bind_dn is None:
@@ -153,6 +304,22 @@ class ldap2(CrudBackend, LDAPClient):
         if size_limit is not _missing:
             object.__setattr__(self, 'size_limit', size_limit)
 
+        ldapi = self.ldap_uri.startswith('ldapi://')
+        use_autobind = (
+            autobind != AUTOBIND_DISABLED and os.getegid() == 0 and ldapi)
+
+        pool_key = None
+        if (self._pool.enabled and ccache is not None and not bind_pw and
+                not use_autobind and not serverctrls and not clientctrls):
+            with _krb5ccname_lock:
+                os.environ['KRB5CCNAME'] = ccache
+            principal = krb_utils.get_principal(ccache_name=ccache)
+            pool_key = (principal, ccache)
+            conn = self._pool.checkout(pool_key)
+            if conn is not None:
+                setattr(context, 'principal', principal)
+                return conn
+
         client = LDAPClient(self.ldap_uri,
                             force_schema_updates=self._force_schema_updates,
                             cacert=cacert)
@@ -169,13 +336,11 @@ class ldap2(CrudBackend, LDAPClient):
                 if maxssf < minssf:
                     conn.set_option(_ldap.OPT_X_SASL_SSF_MAX, minssf)
 
-        ldapi = self.ldap_uri.startswith('ldapi://')
-
         if bind_pw:
             client.simple_bind(bind_dn, bind_pw,
                                server_controls=serverctrls,
                                client_controls=clientctrls)
-        elif autobind != AUTOBIND_DISABLED and os.getegid() == 0 and ldapi:
+        elif use_autobind:
             try:
                 client.external_bind(server_controls=serverctrls,
                                      client_controls=clientctrls)
@@ -188,24 +353,36 @@ class ldap2(CrudBackend, LDAPClient):
             if ldapi:
                 with client.error_handler():
                     conn.set_option(_ldap.OPT_HOST_NAME, self.api.env.host)
-            if ccache is None:
-                os.environ.pop('KRB5CCNAME', None)
-            else:
-                os.environ['KRB5CCNAME'] = ccache
-
-            principal = krb_utils.get_principal(ccache_name=ccache)
-
-            client.gssapi_bind(server_controls=serverctrls,
-                               client_controls=clientctrls)
+            with _krb5ccname_lock:
+                if ccache is None:
+                    os.environ.pop('KRB5CCNAME', None)
+                else:
+                    os.environ['KRB5CCNAME'] = ccache
+                principal = krb_utils.get_principal(ccache_name=ccache)
+                client.gssapi_bind(server_controls=serverctrls,
+                                   client_controls=clientctrls)
             setattr(context, 'principal', principal)
 
+            if pool_key is not None:
+                creds = krb_utils.get_credentials_if_valid(
+                    ccache_name=ccache)
+                if creds is not None:
+                    expires = time.time() + creds.lifetime
+                    self._pool.add(pool_key, conn, expires)
+
         return conn
 
     def destroy_connection(self):
-        """Disconnect from LDAP server."""
+        """Disconnect from LDAP server.
+
+        Pooled connections are handed back to the pool instead.
+        """
         try:
             if self.conn is not None:
-                self.unbind()
+                if self._pool.release(self.conn):
+                    self._flush_schema()
+                else:
+                    self.unbind()
         except errors.PublicError:
             # ignore when trying to unbind multiple times
             pass
@@ -386,6 +563,13 @@ class ldap2(CrudBackend, LDAPClient):
             new_pass = self.encode(new_pass)
             self.conn.passwd_s(str(dn), old_pass, new_pass)
 
+    def _modify_members(self, group_dn, op, member_attr, dns):
+        """Add or delete the values dns of member_attr of group_dn."""
+        modlist = [(op, member_attr, self.encode(dns))]
+        with self.error_handler(), \
+                ldap_operation_duration.time(operation='modify'):
+            self.conn.modify_s(str(group_dn), modlist)
+
     def add_entry_to_group(self, dn, group_dn, member_attr='member', allow_same=False):
         """
         Add entry designaed by dn to group group_dn in the member attribute
@@ -411,14 +595,8 @@ class ldap2(CrudBackend, LDAPClient):
             raise errors.SameGroupError()
 
         # add dn to group entry's `member_attr` attribute
-        modlist = [(_ldap.MOD_ADD, member_attr, [dn])]
-
-        # update group entry
         try:
-            with self.error_handler():
-                modlist = [(a, b, self.encode(c))
-                           for a, b, c in modlist]
-                self.conn.modify_s(str(group_dn), modlist)
+            self._modify_members(group_dn, _ldap.MOD_ADD, member_attr, [dn])
         except errors.DuplicateEntry:
             # TYPE_OR_VALUE_EXISTS
             raise errors.AlreadyGroupMember()
@@ -434,17 +612,158 @@ class ldap2(CrudBackend, LDAPClient):
             dn, group_dn, member_attr)
 
         # remove dn from group entry's `member_attr` attribute
-        modlist = [(_ldap.MOD_DELETE, member_attr, [dn])]
-
-        # update group entry
         try:
-            with self.error_handler():
-                modlist = [(a, b, self.encode(c))
-                           for a, b, c in modlist]
-                self.conn.modify_s(str(group_dn), modlist)
+            self._modify_members(
+                group_dn, _ldap.MOD_DELETE, member_attr, [dn])
         except errors.MidairCollision:
             raise errors.NotGroupMember()
 
+    def get_existing_dns(self, dns, filter=None):
+        """
+        Check the existence of entries designated by dns in bulk.
+
+        Entries are looked up with one one-level search with an OR filter per
+        parent entry and RDN attribute (in chunks of
+        ``EXISTENCE_CHECK_CHUNK`` values). If ``filter`` is given, only
+        entries which also match it are found.
+
+        Returns a dict mapping the DNs of existing entries to their DNs as
+        stored on the server. Entries which were not found are not present
+        in the dict.
+        """
+        existing = {}
+        containers = {}
+        for dn in dns:
+            assert isinstance(dn, DN)
+            rdn = dn[0] if dn else None
+            if rdn is None or len(rdn) != 1:
+                # multi-valued RDNs can't be matched by a single attribute
+                try:
+                    if filter is None:
+                        existing[dn] = self.get_entry(dn, ['']).dn
+                    else:
+                        existing[dn] = self.get_entries(
+                            dn, self.SCOPE_BASE, filter, [''])[0].dn
+                except errors.NotFound:
+                    pass
+                continue
+            key = (dn[1:], rdn.attr.lower())
+            containers.setdefault(key, set()).add(rdn.value)
+
+        for (parent_dn, attr), values in containers.items():
+            values = sorted(values)
+            for i in range(0, len(values), self.EXISTENCE_CHECK_CHUNK):
+                chunk = values[i:i + self.EXISTENCE_CHECK_CHUNK]
+                flt = self.make_filter_from_attr(attr, chunk)
+                if filter is not None:
+                    flt = self.combine_filters([flt, filter], self.MATCH_ALL)
+                try:
+                    entries, _truncated = self.find_entries(
+                        flt, [''], parent_dn, self.SCOPE_ONELEVEL,
+                        size_limit=-1, paged_search=True)
+                except errors.NotFound:
+                    continue
+                for entry in entries:
+                    existing[entry.dn] = entry.dn
+
+        return {dn: existing[dn] for dn in dns if dn in existing}
+
+    def add_entries_to_group(self, dns, group_dn, member_attr='member',
+                             allow_same=False):
+        """
+        Add entries designated by dns to group group_dn in the member
+        attribute member_attr.
+
+        The existence of the entries is verified with `get_existing_dns` and
+        all of them are added by a single modify operation. If it fails, the
+        entries are added one by one to find out which of them can't be
+        added.
+
+        Returns a list of (dn, error) tuples for entries which were not
+        added, in the order of dns.
+        """
+        assert isinstance(group_dn, DN)
+
+        logger.debug(
+            "add_entries_to_group: %d dns group_dn=%s member_attr=%s",
+            len(dns), group_dn, member_attr)
+
+        existing = self.get_existing_dns(dns)
+
+        failed = {}
+        to_add = []
+        for i, dn in enumerate(dns):
+            if dn not in existing:
+                # get the same error as add_entry_to_group would report,
+                # e.g. for entries which are not readable by the user
+                try:
+                    self.get_entry(dn, [''])
+                except errors.PublicError as e:
+                    failed[i] = e
+                    continue
+                existing[dn] = dn
+            if existing[dn] == group_dn and not allow_same:
+                failed[i] = errors.SameGroupError()
+                continue
+            to_add.append(i)
+
+        if to_add:
+            try:
+                self._modify_members(
+                    group_dn, _ldap.MOD_ADD, member_attr,
+                    [existing[dns[i]] for i in to_add])
+            except errors.PublicError as e:
+                logger.debug(
+                    "add_entries_to_group: bulk modify failed (%s), adding "
+                    "one by one", e)
+                for i in to_add:
+                    try:
+                        self.add_entry_to_group(
+                            existing[dns[i]], group_dn, member_attr,
+                            allow_same=allow_same)
+                    except errors.PublicError as e:
+                        failed[i] = e
+
+        return [(dns[i], failed[i]) for i in sorted(failed)]
+
+    def remove_entries_from_group(self, dns, group_dn, member_attr='member'):
+        """
+        Remove entries designated by dns from group group_dn.
+
+        All values are removed by a single modify operation. If it fails, the
+        entries are removed one by one to find out which of them can't be
+        removed.
+
+        Returns a list of (dn, error) tuples for entries which were not
+        removed, in the order of dns.
+        """
+        assert isinstance(group_dn, DN)
+
+        logger.debug(
+            "remove_entries_from_group: %d dns group_dn=%s member_attr=%s",
+            len(dns), group_dn, member_attr)
+
+        if not dns:
+            return []
+
+        try:
+            self._modify_members(
+                group_dn, _ldap.MOD_DELETE, member_attr, list(dns))
+        except errors.PublicError as e:
+            logger.debug(
+                "remove_entries_from_group: bulk modify failed (%s), "
+                "removing one by one", e)
+        else:
+            return []
+
+        failed = []
+        for dn in dns:
+            try:
+                self.remove_entry_from_group(dn, group_dn, member_attr)
+            except errors.PublicError as e:
+                failed.append((dn, e))
+        return failed
+
     def set_entry_active(self, dn, active):
         """Mark entry active/inactive."""
 
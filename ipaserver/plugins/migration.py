@@ -19,6 +19,7 @@
 
 from __future__ import absolute_import
 
+import itertools
 import logging
 import re
 from ldap import MOD_ADD
@@ -755,13 +756,17 @@ migration process might be incomplete\n''')
             migrated[ldap_obj_name] = []
             failed[ldap_obj_name] = {}
 
+            # entries are streamed from the remote server, a large directory
+            # is never held in memory as a whole
+            entries = ds_ldap.iter_entries(
+                search_filter, ['*'], search_bases[ldap_obj_name],
+                scope,
+                time_limit=0, size_limit=-1
+            )
             try:
-                entries, truncated = ds_ldap.find_entries(
-                    search_filter, ['*'], search_bases[ldap_obj_name],
-                    scope,
-                    time_limit=0, size_limit=-1
-                )
-            except errors.NotFound:
+                first = [next(entries)]
+            except (StopIteration, errors.NotFound):
+                entries.close()
                 if not options.get('continue',False):
                     raise errors.NotFound(
                         reason=_('%(container)s LDAP search did not return any result '
@@ -772,13 +777,7 @@ migration process might be incomplete\n''')
                                     'objectclass': ', '.join(oc_list)}
                     )
                 else:
-                    truncated = False
-                    entries = []
-            if truncated:
-                logger.error(
-                    '%s: %s',
-                    ldap_obj.name, self.truncated_err_msg
-                )
+                    first = []
 
             blacklists = {}
             for blacklist in ('oc_blacklist', 'attr_blacklist'):
@@ -804,7 +803,7 @@ migration process might be incomplete\n''')
             invalid_gids = set()
             migrate_cnt = 0
             context['migrate_cnt'] = 0
-            for entry_attrs in entries:
+            for entry_attrs in itertools.chain(first, entries):
                 context['migrate_cnt'] = migrate_cnt
                 s = datetime.datetime.now()
 
@@ -880,6 +879,12 @@ migration process might be incomplete\n''')
                 logger.debug("%d %ss migrated, duration: %s (total %s)",
                              migrate_cnt, ldap_obj_name, d, total_dur)
 
+            if entries.truncated:
+                logger.error(
+                    '%s: %s',
+                    ldap_obj.name, self.truncated_err_msg
+                )
+
         if 'def_group_dn' in context:
             _update_default_group(ldap, context, True)
 
@@ -1766,6 +1766,9 @@ class trust_fetch_domains(LDAPRetrieve):
         ),
     )
 
+    # the domains of the trust are written to LDAP
+    read_only = False
+
     def execute(self, *keys, **options):
         ldap = self.api.Backend.ldap2
         verify_samba_component_presence(ldap, self.api)
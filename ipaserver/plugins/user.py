@@ -1091,6 +1091,8 @@ class user_status(LDAPQuery):
     obj_name = 'userstatus'
     attr_name = 'find'
 
+    read_only = True
+
     has_output = output.standard_list_of_entries
 
     def get_args(self):
@@ -31,7 +31,7 @@ if api.env.context in ('server', 'lite'):
     from ipaserver.rpcserver import (
         wsgi_dispatch, xmlserver, jsonserver_i18n_messages, jsonserver_kerb,
         jsonserver_session, login_kerberos, login_x509, login_password,
-        change_password, sync_token, xmlserver_session)
+        change_password, sync_token, xmlserver_session, prometheus_metrics)
     register()(wsgi_dispatch)
     register()(xmlserver)
     register()(jsonserver_i18n_messages)
@@ -43,3 +43,4 @@ if api.env.context in ('server', 'lite'):
     register()(change_password)
     register()(sync_token)
     register()(xmlserver_session)
+    register()(prometheus_metrics)
@@ -0,0 +1,325 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Concurrent collector of the replication status of all masters.
+
+Checking replication health otherwise means connecting to every master in
+turn and reading its agreements one by one. The collector connects to all
+masters at once from a thread pool, with bounded network and search
+timeouts, and reads from every master:
+
+* the status attributes of its replication agreements,
+* the replica update vector (RUV) of every replicated suffix.
+
+The lag of an agreement is computed by comparing the RUV of the supplier
+with the RUV of the consumer: for every replica ID the supplier knows of,
+the difference of the time stamps of the newest change (max CSN) tells how
+far behind the consumer is. The largest difference is the lag of the
+agreement.
+
+Bound connections are kept by the collector and reused by the following
+collections, so that a periodic check does not repeat the GSSAPI bind.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ldap
+
+from ipalib import errors
+from ipaplatform.paths import paths
+from ipapython import ipaldap, ipautil
+from ipapython.dn import DN
+
+logger = logging.getLogger(__name__)
+
+MAPPING_TREE_DN = DN(('cn', 'mapping tree'), ('cn', 'config'))
+
+AGREEMENT_FILTER = (
+    '(|(objectclass=nsds5ReplicationAgreement)'
+    '(objectclass=nsDSWindowsReplicationAgreement))'
+)
+AGREEMENT_ATTRS = [
+    'cn', 'objectclass', 'nsDS5ReplicaRoot', 'nsDS5ReplicaHost',
+    'nsds5ReplicaEnabled', 'nsds5replicaUpdateInProgress',
+    'nsds5ReplicaLastUpdateStatus', 'nsds5ReplicaLastUpdateStart',
+    'nsds5ReplicaLastUpdateEnd', 'nsds5ReplicaLastInitStatus',
+    'nsds5ReplicaLastInitEnd',
+]
+
+RUV_FILTER = (
+    '(&(nsuniqueid=ffffffff-ffffffff-ffffffff-ffffffff)'
+    '(objectclass=nstombstone))'
+)
+RUV_RE = re.compile(
+    r'\{replica (\d+) ([^}\s]+)\}(?:\s+([0-9a-fA-F]+)\s+([0-9a-fA-F]+))?')
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_WORKERS = 16
+
+
+def csn_time(csn):
+    """
+    Return the time stamp of a change sequence number in seconds
+    """
+    return int(csn[:8], 16)
+
+
+def parse_ruv(values):
+    """
+    Parse the ``nsds50ruv`` values of a RUV tombstone
+
+    :returns: dict replica ID -> (replica URL, max CSN or None)
+    """
+    ruv = {}
+    for value in values:
+        match = RUV_RE.match(value)
+        if match is None:
+            if not value.startswith('{replicageneration}'):
+                logger.debug("Unable to decode RUV element: %s", value)
+            continue
+        rid, url, _min_csn, max_csn = match.groups()
+        ruv[int(rid)] = (url, max_csn)
+    return ruv
+
+
+def parse_update_status(status):
+    """
+    Split the last update status of an agreement to (code, message)
+
+    The status is either ``'<code> <message>'`` or, since 389-ds-base
+    1.3.5, ``'Error (<code>) <message>'``.
+    """
+    if not status:
+        return None, status
+    if status.startswith('Error '):
+        status = status[6:]
+    code, _sep, message = status.partition(' ')
+    try:
+        return int(code.strip('()')), message
+    except ValueError:
+        return None, status
+
+
+def get_lag(supplier_ruv, consumer_ruv):
+    """
+    Return how many seconds the consumer is behind the supplier
+
+    :returns: the lag in seconds or ``None`` when the consumer has not
+        seen any change of a replica the supplier has changes from
+    """
+    lag = 0
+    for rid, (_url, max_csn) in supplier_ruv.items():
+        if max_csn is None:
+            continue
+        consumer_csn = consumer_ruv.get(rid, (None, None))[1]
+        if consumer_csn is None:
+            return None
+        lag = max(lag, csn_time(max_csn) - csn_time(consumer_csn))
+    return lag
+
+
+def _parse_time(value):
+    if not value or value == '0':
+        return None
+    return ipautil.parse_generalized_time(value)
+
+
+class ReplicationStatusCollector:
+    """
+    Thread-safe collector of the replication status of several masters.
+
+    The collector owns the connections it binds, call `close` (or use it as
+    a context manager) to unbind them.
+    """
+
+    def __init__(self, suffixes, timeout=DEFAULT_TIMEOUT,
+                 max_workers=DEFAULT_MAX_WORKERS, dirman_passwd=None,
+                 cacert=paths.IPA_CA_CRT):
+        """
+        :param suffixes: DNs of the replicated suffixes to read RUVs of
+        :param timeout: number of seconds to wait for a master to accept
+            the connection and to answer a search
+        :param max_workers: maximum number of masters read concurrently
+        :param dirman_passwd: bind as Directory Manager with this password
+            instead of GSSAPI
+        """
+        self.suffixes = [DN(suffix) for suffix in suffixes]
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.dirman_passwd = dirman_passwd
+        self.cacert = cacert
+
+        self._lock = threading.Lock()
+        # host -> idle bound LDAPClient
+        self._idle = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _connect(self, host):
+        ldap_uri = ipaldap.get_ldap_uri(host, 636, cacert=self.cacert)
+        client = ipaldap.LDAPClient(ldap_uri, cacert=self.cacert,
+                                    no_schema=True)
+        with client.error_handler():
+            client.conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self.timeout)
+            client.conn.set_option(ldap.OPT_TIMEOUT, self.timeout)
+        if self.dirman_passwd:
+            client.simple_bind(ipaldap.DIRMAN_DN, self.dirman_passwd)
+        else:
+            client.gssapi_bind()
+        return client
+
+    def _checkout(self, host):
+        with self._lock:
+            client = self._idle.pop(host, None)
+        if client is None:
+            client = self._connect(host)
+        return client
+
+    def _release(self, host, client):
+        with self._lock:
+            previous = self._idle.pop(host, None)
+            self._idle[host] = client
+        if previous is not None:
+            self._unbind(previous)
+
+    def _unbind(self, client):
+        try:
+            client.unbind()
+        except Exception as e:
+            logger.debug("Failed to unbind from %s: %s", client, e)
+
+    def close(self):
+        """
+        Unbind all connections kept by the collector
+        """
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+        for client in idle:
+            self._unbind(client)
+
+    def _read_agreements(self, client):
+        try:
+            entries = client.get_entries(
+                MAPPING_TREE_DN, client.SCOPE_SUBTREE, AGREEMENT_FILTER,
+                AGREEMENT_ATTRS, time_limit=self.timeout)
+        except errors.NotFound:
+            return []
+
+        agreements = []
+        for entry in entries:
+            objectclasses = {o.lower() for o in entry.get('objectclass', [])}
+            code, message = parse_update_status(
+                entry.single_value.get('nsds5ReplicaLastUpdateStatus'))
+            in_progress = entry.single_value.get(
+                'nsds5replicaUpdateInProgress', 'FALSE')
+            enabled = entry.single_value.get('nsds5ReplicaEnabled', 'on')
+            agreements.append(dict(
+                name=entry.single_value['cn'],
+                suffix=DN(entry.single_value['nsDS5ReplicaRoot']),
+                consumer=entry.single_value['nsDS5ReplicaHost'],
+                winsync='nsdswindowsreplicationagreement' in objectclasses,
+                enabled=enabled.lower() != 'off',
+                update_in_progress=in_progress.lower() == 'true',
+                last_update_code=code,
+                last_update_status=message,
+                last_update_start=_parse_time(entry.single_value.get(
+                    'nsds5ReplicaLastUpdateStart')),
+                last_update_end=_parse_time(entry.single_value.get(
+                    'nsds5ReplicaLastUpdateEnd')),
+                last_init_status=entry.single_value.get(
+                    'nsds5ReplicaLastInitStatus'),
+                last_init_end=_parse_time(entry.single_value.get(
+                    'nsds5ReplicaLastInitEnd')),
+            ))
+        return agreements
+
+    def _read_ruvs(self, client):
+        ruvs = {}
+        for suffix in self.suffixes:
+            try:
+                entries = client.get_entries(
+                    suffix, client.SCOPE_ONELEVEL, RUV_FILTER,
+                    ['nsds50ruv'], time_limit=self.timeout)
+            except errors.NotFound:
+                # suffix is not replicated to this master
+                continue
+            for entry in entries:
+                ruvs[suffix] = parse_ruv(entry.get('nsds50ruv', []))
+        return ruvs
+
+    def read_host(self, host):
+        """
+        Read agreements and RUVs of a single master
+
+        :returns: dict with keys ``host``, ``agreements``, ``ruvs`` and
+            ``error``, the error message when the master could not be read
+        """
+        result = dict(host=host, agreements=[], ruvs={}, error=None)
+        try:
+            client = self._checkout(host)
+        except Exception as e:
+            logger.debug("Failed to connect to %s: %s", host, e)
+            result['error'] = str(e)
+            return result
+
+        try:
+            result['agreements'] = self._read_agreements(client)
+            result['ruvs'] = self._read_ruvs(client)
+        except Exception as e:
+            logger.debug("Failed to read replication status of %s: %s",
+                         host, e)
+            result['error'] = str(e)
+            self._unbind(client)
+        else:
+            self._release(host, client)
+        return result
+
+    def collect(self, hosts):
+        """
+        Read the replication status of all hosts concurrently
+
+        :param hosts: host names of the masters
+        :returns: tuple (host statuses, agreements). Host statuses map every
+            host to the result of `read_host`. Agreements is a list of the
+            agreements of all hosts, each one extended with ``supplier``
+            and ``lag``, see `get_lag`, sorted by suffix, supplier and
+            consumer. The lag is ``None`` when the RUV of either side is
+            not known.
+        """
+        hosts = list(hosts)
+        if not hosts:
+            return {}, []
+
+        max_workers = max(1, min(self.max_workers, len(hosts)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            statuses = dict(zip(hosts, executor.map(self.read_host, hosts)))
+
+        agreements = []
+        for host in hosts:
+            supplier_ruvs = statuses[host]['ruvs']
+            for agreement in statuses[host]['agreements']:
+                suffix = agreement['suffix']
+                consumer = statuses.get(agreement['consumer'])
+                lag = None
+                if (consumer is not None and suffix in supplier_ruvs and
+                        suffix in consumer['ruvs']):
+                    lag = get_lag(supplier_ruvs[suffix],
+                                  consumer['ruvs'][suffix])
+                agreement = dict(agreement, supplier=host, lag=lag)
+                agreements.append(agreement)
+
+        agreements.sort(key=lambda a: (
+            str(a['suffix']), a['supplier'], a['consumer']))
+        return statuses, agreements
@@ -28,7 +28,9 @@ from __future__ import absolute_import
 import logging
 from xml.sax.saxutils import escape
 import os
+import time
 import traceback
+import types
 from io import BytesIO
 from urllib.parse import parse_qs
 from xmlrpc.client import Fault
@@ -51,7 +53,7 @@ from ipalib.errors import (PublicError, InternalError, JSONError,
     ExecutionError, PasswordExpired, KrbPrincipalExpired, UserLocked)
 from ipalib.request import context, destroy_context
 from ipalib.rpc import (xml_dumps, xml_loads,
-    json_encode_binary, json_decode_binary)
+    json_encode_binary, json_encode_binary_iter, json_decode_binary)
 from ipapython.dn import DN
 from ipaserver.plugins.ldap2 import ldap2
 from ipalib.backend import Backend
@@ -59,6 +61,7 @@ from ipalib.krb_utils import (
     get_credentials_if_valid)
 from ipapython import kerberos
 from ipapython import ipautil
+from ipapython import metrics
 from ipaplatform.paths import paths
 from ipapython.version import VERSION
 from ipalib.text import _
@@ -74,6 +77,15 @@ logger = logging.getLogger(__name__)
 HTTP_STATUS_SUCCESS = '200 Success'
 HTTP_STATUS_SERVER_ERROR = '500 Internal Server Error'
 
+command_requests = metrics.registry.counter(
+    'ipa_rpc_requests_total',
+    'Number of RPC requests by command and result',
+    ('command', 'result'))
+marshal_duration = metrics.registry.histogram(
+    'ipa_rpc_marshal_duration_seconds',
+    'Duration of marshalling RPC responses',
+    ('handler',))
+
 _not_found_template = """<html>
 <head>
 <title>404 Not Found</title>
@@ -237,6 +249,38 @@ def extract_query(environ):
     return query
 
 
+class StreamedResponse:
+    """
+    Chunks of a response which is encoded while it is sent.
+
+    The chunks may be produced from data which is read with the LDAP
+    connection of the request, so the request context is destroyed only when
+    the WSGI server closes the response.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        try:
+            close = getattr(self.chunks, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            destroy_context()
+
+
+def end_request(response):
+    """
+    Destroy the request context unless the response is still to be streamed.
+    """
+    if not isinstance(response, StreamedResponse):
+        destroy_context()
+
+
 class wsgi_dispatch(Executioner, HTTP_Status):
     """
     WSGI routing middleware and entry point into IPA server.
@@ -262,10 +306,12 @@ class wsgi_dispatch(Executioner, HTTP_Status):
 
     def __call__(self, environ, start_response):
         logger.debug('WSGI wsgi_dispatch.__call__:')
+        response = None
         try:
-            return self.route(environ, start_response)
+            response = self.route(environ, start_response)
+            return response
         finally:
-            destroy_context()
+            end_request(response)
 
     def _on_finalize(self):
         self.url = self.env['mount_ipa']
@@ -396,6 +442,7 @@ class WSGIExecutioner(Executioner):
                 result_string = type(error).__name__
             else:
                 result_string = 'SUCCESS'
+            command_requests.inc(command=name, result=result_string)
             logger.info('[%s] %s: %s(%s): %s',
                         type(self).__name__,
                         principal,
@@ -410,7 +457,15 @@ class WSGIExecutioner(Executioner):
                         type(error).__name__)
 
         version = options.get('version', VERSION_WITHOUT_CAPABILITIES)
-        return self.marshal(result, error, _id, version)
+        handler = type(self).__name__
+        start = time.monotonic()
+        response = self.marshal(result, error, _id, version)
+        if isinstance(response, bytes):
+            marshal_duration.observe(time.monotonic() - start, handler=handler)
+            return response
+        # streamed responses are encoded while they are sent, time the
+        # production of the chunks instead of the creation of the iterator
+        return marshal_duration.time_iter(response, handler=handler)
 
     def simple_unmarshal(self, environ):
         name = environ['PATH_INFO'].strip('/')
@@ -442,7 +497,10 @@ class WSGIExecutioner(Executioner):
             headers.append(('IPASESSION', logout_cookie))
 
         start_response(status, headers)
-        return [response]
+        if isinstance(response, bytes):
+            return [response]
+        # streamed response, an iterable of chunks
+        return StreamedResponse(response)
 
     def unmarshal(self, data):
         raise NotImplementedError('%s.unmarshal()' % type(self).__name__)
@@ -463,6 +521,10 @@ class jsonserver(WSGIExecutioner, HTTP_Status):
 
     content_type = 'application/json'
 
+    # Results containing a list of at least this many items (e.g. entries of
+    # a *_find command) are serialized incrementally while they are sent.
+    stream_threshold = 100
+
     def __call__(self, environ, start_response):
         '''
         '''
@@ -472,6 +534,18 @@ class jsonserver(WSGIExecutioner, HTTP_Status):
         response = super(jsonserver, self).__call__(environ, start_response)
         return response
 
+    def _should_stream(self, result):
+        if self.api.env.debug or not isinstance(result, dict):
+            # pretty printing needs the whole document
+            return False
+        # generated results (e.g. the records of dnszone_export) are always
+        # streamed, they are produced while they are sent
+        return any(
+            isinstance(v, types.GeneratorType) or
+            (isinstance(v, list) and len(v) >= self.stream_threshold)
+            for v in result.values()
+        )
+
     def marshal(self, result, error, _id=None,
                 version=VERSION_WITHOUT_CAPABILITIES):
         if error:
@@ -490,6 +564,8 @@ class jsonserver(WSGIExecutioner, HTTP_Status):
             principal=unicode(principal),
             version=unicode(VERSION),
         )
+        if self._should_stream(result):
+            return json_encode_binary_iter(response, version)
         dump = json_encode_binary(
             response, version, pretty_print=self.api.env.debug
         )
@@ -686,6 +762,11 @@ class KerberosWSGIExecutioner(WSGIExecutioner, KerberosSession):
 
             return self.marshal(None, CCacheError())
 
+        # the ccache of the request, threads started by the request must
+        # not take it from the process-wide environment
+        setattr(context, 'ccache_name', user_ccache)
+
+        response = None
         try:
             self.create_context(ccache=user_ccache)
             response = super(KerberosWSGIExecutioner, self).__call__(
@@ -696,7 +777,7 @@ class KerberosWSGIExecutioner(WSGIExecutioner, KerberosSession):
             start_response(status, self.headers)
             return self.marshal(None, e)
         finally:
-            destroy_context()
+            end_request(response)
         return response
 
 
@@ -859,10 +940,11 @@ class jsonserver_session(jsonserver, KerberosSession):
         except ACIError as e:
             return self.unauthorized(environ, start_response, str(e), 'denied')
 
+        response = None
         try:
             response = super(jsonserver_session, self).__call__(environ, start_response)
         finally:
-            destroy_context()
+            end_request(response)
 
         return response
 
@@ -1244,6 +1326,84 @@ class sync_token(Backend, HTTP_Status):
                                           message=str(message))
         return [output.encode('utf-8')]
 
+
+class prometheus_metrics(Backend, HTTP_Status):
+    """
+    Metrics of this WSGI worker process in the Prometheus text format.
+
+    Every worker process keeps its own metrics, a scrape returns the metrics
+    of the worker which happened to handle the request.
+    """
+
+    key = '/metrics'
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def _on_finalize(self):
+        super(prometheus_metrics, self)._on_finalize()
+        # the collectors of a previously finalized API are replaced
+        metrics.registry.add_collector('ldap_pool', self._collect_ldap_pool)
+        metrics.registry.add_collector('ra_pool', self._collect_ra_pool)
+        self.api.Backend.wsgi_dispatch.mount(self, self.key)
+
+    def _collect_ldap_pool(self):
+        stats = self.api.Backend.ldap2.get_pool_stats()
+        for name, doc in (
+                ('hits', 'LDAP connections reused from the pool'),
+                ('misses', 'LDAP connections not found in the pool'),
+                ('evictions', 'LDAP connections evicted from the pool')):
+            counter = metrics.Counter('ipa_ldap_pool_%s_total' % name, doc)
+            counter.inc(stats[name])
+            yield counter
+        for name, doc in (
+                ('idle', 'Idle LDAP connections in the pool'),
+                ('in_use', 'Pooled LDAP connections in use')):
+            gauge = metrics.Gauge('ipa_ldap_pool_%s' % name, doc)
+            gauge.set(stats[name])
+            yield gauge
+
+    def _collect_ra_pool(self):
+        # every Dogtag REST backend owns a connection pool
+        backends = [
+            name for name in ('ra', 'ra_certprofile', 'ra_lightweight_ca')
+            if name in self.api.Backend
+        ]
+        if not backends:
+            return
+        stats = {
+            name: self.api.Backend[name].get_pool_stats()
+            for name in backends
+        }
+        for name, doc in (
+                ('hits', 'CA connections reused from the pool'),
+                ('misses', 'CA connections not found in the pool'),
+                ('evictions', 'CA connections evicted from the pool'),
+                ('retries', 'Requests retried after the CA closed a '
+                            'pooled connection'),
+                ('errors', 'Failed requests to the CA')):
+            counter = metrics.Counter(
+                'ipa_ra_pool_%s_total' % name, doc, ('backend',))
+            for backend in backends:
+                counter.inc(stats[backend][name], backend=backend)
+            yield counter
+        gauge = metrics.Gauge('ipa_ra_pool_idle',
+                              'Idle CA connections in the pool', ('backend',))
+        for backend in backends:
+            gauge.set(stats[backend]['idle'], backend=backend)
+        yield gauge
+
+    def __call__(self, environ, start_response):
+        logger.debug('WSGI prometheus_metrics.__call__:')
+        if environ['REQUEST_METHOD'] != 'GET':
+            status = '405 Method Not Allowed'
+            start_response(status, [('Allow', 'GET')])
+            return [b'']
+
+        output = metrics.registry.render()
+        start_response(HTTP_STATUS_SUCCESS,
+                       [('Content-Type', self.content_type)])
+        return [output.encode('utf-8')]
+
+
 class xmlserver_session(xmlserver, KerberosSession):
     """
     XML RPC server protected with session auth.
@@ -1291,9 +1451,10 @@ class xmlserver_session(xmlserver, KerberosSession):
         # Store the session data in the per-thread context
         setattr(context, 'ccache_name', ccache_name)
 
+        response = None
         try:
             response = super(xmlserver_session, self).__call__(environ, start_response)
         finally:
-            destroy_context()
+            end_request(response)
 
         return response
@@ -6,7 +6,7 @@
 set of functions and classes useful for management of domain level 1 topology
 """
 
-from copy import deepcopy
+from collections import Counter
 
 from ipalib import _
 from ipapython.graph import Graph
@@ -34,42 +34,151 @@ def create_topology_graph(masters, segments):
         graph.add_vertex(m['cn'][0])
 
     for s in segments:
-        direction = s['iparepltoposegmentdirection'][0]
-        left = s['iparepltoposegmentleftnode'][0]
-        right = s['iparepltoposegmentrightnode'][0]
         try:
-            if direction == u'both':
-                graph.add_edge(left, right)
-                graph.add_edge(right, left)
-            elif direction == u'left-right':
-                graph.add_edge(left, right)
-            elif direction == u'right-left':
-                graph.add_edge(right, left)
+            for tail, head in get_segment_edges(s):
+                graph.add_edge(tail, head)
         except ValueError:  # ignore segments with deleted master
             pass
 
     return graph
 
 
-def get_topology_connection_errors(graph):
+def get_segment_edges(segment):
     """
-    Traverse graph from each master and find out which masters are not
-    reachable.
+    Get edges of the topology graph created by a segment.
+
+    :param segment: topology segment entry
+    :returns: list of (tail, head) tuples
+    """
+    direction = segment['iparepltoposegmentdirection'][0]
+    left = segment['iparepltoposegmentleftnode'][0]
+    right = segment['iparepltoposegmentrightnode'][0]
+    if direction == u'both':
+        return [(left, right), (right, left)]
+    elif direction == u'left-right':
+        return [(left, right)]
+    elif direction == u'right-left':
+        return [(right, left)]
+    return []
+
+
+def get_topology_connection_errors(graph, removed_masters=(),
+                                   removed_edges=()):
+    """
+    Find out which masters are not reachable from each master.
+
+    Reachability is computed from the strongly connected components of the
+    graph, so a connected topology is verified in a single traversal.
 
     :param graph: topology graph where vertices are masters
+    :param removed_masters: masters to treat as removed from the graph
+    :param removed_edges: (tail, head) edges to treat as removed
     :returns: list of errors, error is: (master, visited, not_visited)
     """
+    removed_masters = set(removed_masters)
+    masters = graph.vertices - removed_masters
+    reachable = graph.get_reachable(removed_masters, removed_edges)
+
     connect_errors = []
-    master_cns = list(graph.vertices)
-    master_cns.sort()
-    for m in master_cns:
-        visited = graph.bfs(m)
-        not_visited = graph.vertices - visited
-        if not_visited:
-            connect_errors.append((m, list(visited), list(not_visited)))
+    for m in sorted(masters):
+        visited = reachable[m]
+        if len(visited) == len(masters):
+            continue
+        not_visited = masters - visited
+        connect_errors.append((m, list(visited), list(not_visited)))
     return connect_errors
 
 
+def _is_connected_symmetric(graph):
+    """
+    Return True if the graph is connected and all its edges go both ways.
+
+    In such a graph removal of a master (segment) disconnects the topology
+    exactly if it is a cut vertex (bridge) of the undirected graph.
+    """
+    if not graph.is_symmetric():
+        return False
+    return len(graph.strongly_connected_components()) <= 1
+
+
+def get_master_removal_errors(graph, masters=None):
+    """
+    Evaluate removal of every master from the topology.
+
+    When the topology is connected and uses only bidirectional segments,
+    the masters whose removal disconnects it are found in a single pass
+    and connection errors are computed only for them.
+
+    :param graph: topology graph where vertices are masters
+    :param masters: masters to evaluate, all masters of the graph by default
+    :returns: dict master -> list of errors as returned by
+        `get_topology_connection_errors` for the graph without the master
+    """
+    if masters is None:
+        masters = graph.vertices
+
+    if _is_connected_symmetric(graph):
+        cut_vertices, _bridges = graph.get_cuts()
+    else:
+        cut_vertices = graph.vertices
+
+    current_errors = None
+    result = {}
+    for m in masters:
+        if m in cut_vertices:
+            result[m] = get_topology_connection_errors(graph, [m])
+        elif m in graph.vertices:
+            result[m] = []
+        else:
+            if current_errors is None:
+                current_errors = get_topology_connection_errors(graph)
+            result[m] = current_errors
+    return result
+
+
+def get_segment_removal_errors(graph, segments):
+    """
+    Evaluate removal of every segment from the topology.
+
+    Edges which are also created by another segment stay in the graph.
+    When the topology is connected and uses only bidirectional segments,
+    only removal of a segment between the two ends of a bridge is
+    evaluated in full.
+
+    :param graph: topology graph created from the segments
+    :param segments: topology segment entries
+    :returns: dict segment name -> list of errors as returned by
+        `get_topology_connection_errors` for the graph without the segment
+    """
+    edge_count = Counter(
+        edge for s in segments for edge in get_segment_edges(s))
+
+    if _is_connected_symmetric(graph):
+        _cut_vertices, bridges = graph.get_cuts()
+        current_errors = []
+    else:
+        bridges = None
+        current_errors = get_topology_connection_errors(graph)
+
+    result = {}
+    for s in segments:
+        removed_edges = [
+            edge for edge in get_segment_edges(s)
+            if edge_count[edge] == 1 and edge[0] in graph.vertices and
+            edge[1] in graph.vertices
+        ]
+        if not removed_edges:
+            errors = current_errors
+        elif bridges is not None and not any(
+                frozenset(edge) in bridges for edge in removed_edges):
+            errors = current_errors
+        else:
+            errors = get_topology_connection_errors(
+                graph, removed_edges=removed_edges)
+        result[s['cn'][0]] = errors
+    return result
+
+
 def map_masters_to_suffixes(masters):
     masters_to_suffix = {}
     managed_suffix_attr = 'iparepltopomanagedsuffix_topologysuffix'
@@ -92,26 +201,26 @@ def map_masters_to_suffixes(masters):
     return masters_to_suffix
 
 
-def _create_topology_graphs(api_instance):
+def _get_topology_segments(api_instance):
     """
-    Construct a topology graph for each topology suffix
+    Get masters and segments of each topology suffix
     :param api_instance: instance of IPA API
+    :returns: dict suffix -> (masters, segments)
     """
     masters = api_instance.Command.server_find(
         u'', sizelimit=0, no_members=False)['result']
 
     suffix_to_masters = map_masters_to_suffixes(masters)
 
-    topology_graphs = {}
+    topology = {}
 
     for suffix_name in suffix_to_masters:
         segments = api_instance.Command.topologysegment_find(
             suffix_name, sizelimit=0).get('result')
 
-        topology_graphs[suffix_name] = create_topology_graph(
-            suffix_to_masters[suffix_name], segments)
+        topology[suffix_name] = (suffix_to_masters[suffix_name], segments)
 
-    return topology_graphs
+    return topology
 
 
 def _format_topology_errors(topo_errors):
@@ -136,7 +245,12 @@ class TopologyConnectivity:
     def __init__(self, api_instance):
         self.api = api_instance
 
-        self.graphs = _create_topology_graphs(self.api)
+        self.segments = {}
+        self.graphs = {}
+        for suffix, (masters, segments) in _get_topology_segments(
+                self.api).items():
+            self.segments[suffix] = segments
+            self.graphs[suffix] = create_topology_graph(masters, segments)
 
     @property
     def errors(self):
@@ -149,19 +263,41 @@ class TopologyConnectivity:
         return errors_by_suffix
 
     def errors_after_master_removal(self, master_cn):
-        graphs_before = deepcopy(self.graphs)
+        errors_by_suffix = {}
+        for suffix in self.graphs:
+            errors_by_suffix[suffix] = get_topology_connection_errors(
+                self.graphs[suffix], removed_masters=[master_cn]
+            )
 
-        for s in self.graphs:
-            try:
-                self.graphs[s].remove_vertex(master_cn)
-            except ValueError:
-                pass
+        return errors_by_suffix
 
-        errors_after_removal = self.errors
+    def errors_after_each_master_removal(self):
+        """
+        Connection errors after removal of each master, by suffix
 
-        self.graphs = graphs_before
+        :returns: dict suffix -> master -> list of errors
+        """
+        errors_by_suffix = {}
+        for suffix in self.graphs:
+            errors_by_suffix[suffix] = get_master_removal_errors(
+                self.graphs[suffix]
+            )
+
+        return errors_by_suffix
+
+    def errors_after_each_segment_removal(self):
+        """
+        Connection errors after removal of each segment, by suffix
 
-        return errors_after_removal
+        :returns: dict suffix -> segment name -> list of errors
+        """
+        errors_by_suffix = {}
+        for suffix in self.graphs:
+            errors_by_suffix[suffix] = get_segment_removal_errors(
+                self.graphs[suffix], self.segments[suffix]
+            )
+
+        return errors_by_suffix
 
     def check_current_state(self):
         err_msg = ""
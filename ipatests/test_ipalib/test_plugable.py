@@ -25,6 +25,7 @@ Test the `ipalib.plugable` module.
 # pylint: disable=no-member
 
 import os
+import sys
 import textwrap
 
 from ipalib import plugable, errors, create_api
@@ -309,3 +310,111 @@ class test_API(ClassChecker):
                 os.environ['IPA_CONFDIR'] = ipa_confdir
             else:
                 os.environ.pop('IPA_CONFDIR')
+
+
+SNAPSHOT_PACKAGE = {
+    '__init__.py': """
+        from ipalib import plugable
+
+        class base0(plugable.Plugin):
+            pass
+
+        class base1(plugable.Plugin):
+            pass
+        """,
+    'plugins_a.py': """
+        from ipalib import plugable
+        from snapshot_plugins import base0
+
+        register = plugable.Registry()
+
+        @register()
+        class plugin_a(base0):
+            pass
+
+        @register()
+        class plugin_a2(base0):
+            version = '2'
+        """,
+    'plugins_b.py': """
+        from ipalib import plugable
+        from snapshot_plugins import base1
+
+        register = plugable.Registry()
+
+        @register()
+        class plugin_b(base1):
+            pass
+        """,
+}
+
+
+class test_plugin_snapshot:
+    """
+    Test `ipalib.plugable.API.save_plugin_snapshot` and
+    `ipalib.plugable.API.load_plugin_snapshot`.
+    """
+
+    @pytest.fixture(autouse=True)
+    def package(self, tmpdir, monkeypatch):
+        pkgdir = tmpdir.mkdir('snapshot_plugins')
+        for name, content in SNAPSHOT_PACKAGE.items():
+            pkgdir.join(name).write(textwrap.dedent(content))
+        monkeypatch.syspath_prepend(str(tmpdir))
+        self.pkgdir = pkgdir
+        self.snapshot = str(tmpdir.join('snapshot.json'))
+        self.unload()
+        yield
+        self.unload()
+
+    def unload(self):
+        for name in list(sys.modules):
+            if name.startswith('snapshot_plugins'):
+                del sys.modules[name]
+
+    def create_api(self, **overrides):
+        package = __import__('snapshot_plugins')
+
+        class API(plugable.API):
+            bases = (package.base0, package.base1)
+            snapshot_eager_bases = (package.base1,)
+            packages = (package,)
+
+        api = API()
+        api.bootstrap(
+            in_tree=True, confdir=str(self.pkgdir), log=None, **overrides)
+        api.finalize()
+        return api
+
+    def test_roundtrip(self):
+        api = self.create_api(plugins_on_demand=True)
+        api.save_plugin_snapshot(self.snapshot)
+        self.unload()
+
+        api = self.create_api(plugin_snapshot=self.snapshot)
+        # base1 plugins are eager, base0 plugins are loaded on demand
+        assert 'snapshot_plugins.plugins_a' not in sys.modules
+        assert 'snapshot_plugins.plugins_b' in sys.modules
+
+        plugin = api.base0.get_plugin('plugin_a')
+        assert isinstance(plugin, plugable.SnapshotPlugin)
+        assert plugin.full_name == 'plugin_a/1'
+        assert sorted(p.full_name for p in api.base0) == [
+            'plugin_a/1', 'plugin_a2/2']
+        assert 'snapshot_plugins.plugins_a' not in sys.modules
+
+        instance = api.base0.plugin_a
+        assert 'snapshot_plugins.plugins_a' in sys.modules
+        assert isinstance(instance, plugin.plugin)
+        assert api.base0['plugin_a2', '2'].version == '2'
+
+    def test_outdated(self):
+        api = self.create_api(plugins_on_demand=True)
+        api.save_plugin_snapshot(self.snapshot)
+        self.unload()
+
+        self.pkgdir.join('plugins_c.py').write('register = None\n')
+        api = self.create_api(plugin_snapshot=self.snapshot)
+        assert 'snapshot_plugins.plugins_a' in sys.modules
+        assert not isinstance(
+            api.base0.get_plugin('plugin_a'), plugable.SnapshotPlugin)
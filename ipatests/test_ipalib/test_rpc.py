@@ -102,6 +102,64 @@ def test_round_trip():
     assert round_trip(compound) == tuple(compound)
 
 
+def test_json_encode_binary_iter():
+    """
+    Test `ipalib.rpc.json_encode_binary_iter`.
+    """
+    def make_response():
+        entries = [
+            dict(dn=u'uid=user%d' % i, uid=(u'user%d' % i,),
+                 data=binary_bytes)
+            for i in range(20)
+        ]
+        return dict(
+            result=dict(result=entries, count=len(entries), truncated=False),
+            error=None, id=0, principal=unicode_str,
+        )
+
+    expected = rpc.json_encode_binary(make_response(), API_VERSION)
+
+    response = make_response()
+    chunks = list(rpc.json_encode_binary_iter(
+        response, API_VERSION, chunk_size=64))
+    assert len(chunks) > 1
+    assert_equal(b''.join(chunks).decode('utf-8'), expected)
+    # streamed entries are released
+    assert response['result']['result'] == [None] * 20
+
+
+def test_json_encode_binary_generator():
+    """
+    Test that `ipalib.rpc.json_encode_binary_iter` consumes generators.
+    """
+    def make_response(lines):
+        return dict(
+            result=dict(result=lines, value=u'ipa.test.', summary=None),
+            error=None, id=0, principal=unicode_str,
+        )
+
+    lines = [u'$ORIGIN ipa.test.', u'www 300 IN A 192.0.2.2']
+    expected = rpc.json_encode_binary(make_response(lines), API_VERSION)
+    assert_equal(
+        rpc.json_encode_binary(
+            make_response(line for line in lines), API_VERSION),
+        expected)
+
+    produced = []
+
+    def generate():
+        for line in lines:
+            produced.append(line)
+            yield line
+
+    chunks = rpc.json_encode_binary_iter(
+        make_response(generate()), API_VERSION, chunk_size=1)
+    first = next(chunks)
+    # the items are produced while the output is consumed
+    assert len(produced) < len(lines)
+    assert_equal((first + b''.join(chunks)).decode('utf-8'), expected)
+
+
 def test_xml_wrap():
     """
     Test the `ipalib.rpc.xml_wrap` function.
@@ -23,6 +23,7 @@ Test the `ipalib.x509` module.
 
 import base64
 import datetime
+import pickle
 
 import pytest
 
@@ -268,3 +269,25 @@ class test_x509:
             b'0 \x06\x03U\x1d%\x01\x01\xff\x04\x160\x14\x06\x08+\x06\x01'
             b'\x05\x05\x07\x03\x01\x06\x08+\x06\x01\x05\x05\x07\x03\x02'
         )
+
+    def test_der_cache(self):
+        der = base64.b64decode(goodcert)
+        cert = x509.load_der_x509_certificate(der)
+        assert x509.load_der_x509_certificate(bytes(bytearray(der))) is cert
+
+        # the cached object must not be changed through returned values
+        eku = cert.extended_key_usage
+        eku.add('1.2.3.4')
+        assert cert.extended_key_usage == {'1.3.6.1.5.5.7.3.1'}
+        gns = cert.san_general_names
+        gns.append(DNSName('example.com'))
+        assert cert.san_general_names == []
+
+    def test_pickle(self):
+        cert = x509.load_pem_x509_certificate(ipa_demo_crt)
+        copy = pickle.loads(pickle.dumps(cert))
+        assert copy == cert
+        assert copy.subject_bytes == cert.subject_bytes
+        assert copy.issuer_bytes == cert.issuer_bytes
+        assert copy.serial_number_bytes == cert.serial_number_bytes
+        assert copy.san_a_label_dns_names == ['ipa.demo1.freeipa.org']
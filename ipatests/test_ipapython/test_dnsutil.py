@@ -104,3 +104,46 @@ class TestSortURI:
         assert dnsutil.sort_prio_weight([h3, h2, h1]) == [h1, h2, h3]
         assert dnsutil.sort_prio_weight([h3, h3, h3]) == [h3]
         assert dnsutil.sort_prio_weight([h2, h2, h1, h1]) == [h1, h2]
+
+
+ZONE_FILE = u"""\
+$TTL 3600
+@       IN SOA ns1 hostmaster 1 3600 900 604800 3600
+        IN NS  ns1
+ns1     A      192.0.2.1
+www 300 IN A   192.0.2.2
+        IN 60 AAAA 2001:db8::2
+bad     A      not-an-address
+mail    MX     10 ns1.example.com.
+$ORIGIN sub.example.com.
+host    TXT    "multiple words"
+"""
+
+
+class TestIterZoneFile:
+    def test_records(self):
+        origin = dns.name.from_text(u'example.com.')
+        records = list(dnsutil.iter_zone_file(ZONE_FILE, origin))
+        assert len(records) == 8
+
+        errors = [r for r in records if r.error is not None]
+        assert [r.line for r in errors] == [7]
+
+        parsed = [(str(r.name), r.ttl, r.rdtype, r.value)
+                  for r in records if r.error is None]
+        assert parsed[1:] == [
+            ('example.com.', 3600, 'NS', 'ns1.example.com.'),
+            ('ns1.example.com.', 3600, 'A', '192.0.2.1'),
+            ('www.example.com.', 300, 'A', '192.0.2.2'),
+            ('www.example.com.', 60, 'AAAA', '2001:db8::2'),
+            ('mail.example.com.', 3600, 'MX', '10 ns1.example.com.'),
+            ('host.sub.example.com.', 3600, 'TXT', '"multiple words"'),
+        ]
+        assert isinstance(records[0].name, dnsutil.DNSName)
+
+    def test_unsupported_directive(self):
+        origin = dns.name.from_text(u'example.com.')
+        records = list(dnsutil.iter_zone_file(
+            u'$INCLUDE other.zone\nwww A 192.0.2.2\n', origin))
+        assert records[0].error is not None
+        assert records[1].value == '192.0.2.2'
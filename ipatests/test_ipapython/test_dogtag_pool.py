@@ -0,0 +1,190 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the keep-alive connection pool of `ipapython.dogtag`.
+"""
+
+import http.client
+
+import pytest
+
+from ipalib.errors import NetworkError
+from ipapython import dogtag
+
+pytestmark = pytest.mark.tier0
+
+
+class FakeResponse:
+    status = 200
+    msg = {}
+
+    def __init__(self, will_close=False):
+        self.will_close = will_close
+
+    def read(self):
+        return b'OK'
+
+    def getheader(self, name):
+        return None
+
+
+class FakeConnection:
+    def __init__(self, stale=False, will_close=False, reset=False):
+        self.stale = stale
+        self.will_close = will_close
+        # the peer closes the connection after it received the request
+        self.reset = reset
+        self.requests = 0
+        self.closed = False
+
+    def request(self, method, uri, body=None, headers=None):
+        assert not self.closed
+        if self.stale:
+            raise http.client.RemoteDisconnected('closed by peer')
+        self.requests += 1
+
+    def getresponse(self):
+        if self.reset:
+            raise ConnectionResetError('connection reset by peer')
+        return FakeResponse(self.will_close)
+
+    def close(self):
+        self.closed = True
+
+
+class Factory:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.created = []
+
+    def __call__(self, host, port):
+        conn = FakeConnection(**self.kwargs)
+        self.created.append(conn)
+        return conn
+
+
+def request(factory, pool, method='GET'):
+    return dogtag._httplib_request(
+        'https', 'ca.ipa.test', 8443, '/ca/rest/certs', factory, '',
+        method=method, pool=pool, pool_key='ra')
+
+
+def test_reuse():
+    pool = dogtag.HTTPConnectionPool()
+    factory = Factory()
+    for _i in range(3):
+        assert request(factory, pool) == (200, {}, b'OK')
+    assert len(factory.created) == 1
+    assert factory.created[0].requests == 3
+    stats = pool.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['idle'] == 1
+
+
+def test_will_close():
+    pool = dogtag.HTTPConnectionPool()
+    factory = Factory(will_close=True)
+    request(factory, pool)
+    assert factory.created[0].closed
+    assert pool.stats()['idle'] == 0
+
+
+def test_disabled():
+    pool = dogtag.HTTPConnectionPool(max_size=0)
+    factory = Factory()
+    request(factory, pool)
+    request(factory, pool)
+    assert len(factory.created) == 2
+    assert all(conn.closed for conn in factory.created)
+
+
+def test_bounded():
+    pool = dogtag.HTTPConnectionPool(max_size=1)
+    first, second = FakeConnection(), FakeConnection()
+    pool.release('a', first)
+    pool.release('b', second)
+    assert first.closed
+    assert pool.checkout('a') is None
+    assert pool.checkout('b') is second
+    assert pool.stats()['evictions'] == 1
+
+
+def test_ttl():
+    pool = dogtag.HTTPConnectionPool(ttl=0)
+    conn = FakeConnection()
+    pool.release('a', conn)
+    assert pool.checkout('a') is None
+    assert conn.closed
+
+
+def test_stale_connection_is_retried():
+    pool = dogtag.HTTPConnectionPool()
+    stale = FakeConnection(stale=True)
+    pool.release(('https', 'ca.ipa.test', 8443, 'ra'), stale)
+    factory = Factory()
+    assert request(factory, pool)[0] == 200
+    assert stale.closed
+    assert len(factory.created) == 1
+    assert pool.stats()['retries'] == 1
+
+
+def test_new_connection_is_not_retried():
+    pool = dogtag.HTTPConnectionPool()
+    factory = Factory(stale=True)
+    with pytest.raises(NetworkError):
+        request(factory, pool)
+    assert len(factory.created) == 1
+    assert pool.stats()['errors'] == 1
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_unsent_request_is_retried(method):
+    pool = dogtag.HTTPConnectionPool()
+    stale = FakeConnection(stale=True)
+    pool.release(('https', 'ca.ipa.test', 8443, 'ra'), stale)
+    factory = Factory()
+    assert request(factory, pool, method)[0] == 200
+    assert factory.created[0].requests == 1
+
+
+def test_sent_idempotent_request_is_retried():
+    pool = dogtag.HTTPConnectionPool()
+    reset = FakeConnection(reset=True)
+    pool.release(('https', 'ca.ipa.test', 8443, 'ra'), reset)
+    factory = Factory()
+    assert request(factory, pool, 'GET')[0] == 200
+    assert reset.requests == 1
+    assert pool.stats()['retries'] == 1
+
+
+def test_sent_post_is_not_retried():
+    # the CA may have processed the request, e.g. issued a certificate
+    pool = dogtag.HTTPConnectionPool()
+    reset = FakeConnection(reset=True)
+    pool.release(('https', 'ca.ipa.test', 8443, 'ra'), reset)
+    factory = Factory()
+    with pytest.raises(NetworkError):
+        request(factory, pool, 'POST')
+    assert reset.closed
+    assert factory.created == []
+    stats = pool.stats()
+    assert stats['retries'] == 0
+    assert stats['errors'] == 1
+
+
+def test_dropped_connection_is_not_reused(monkeypatch):
+    pool = dogtag.HTTPConnectionPool()
+    dropped, alive = FakeConnection(), FakeConnection()
+    dropped.sock = 'dropped'
+    alive.sock = 'alive'
+    pool.release('a', alive)
+    pool.release('a', dropped)
+    monkeypatch.setattr(
+        dogtag.select, 'select',
+        lambda r, w, x, timeout: ([s for s in r if s == 'dropped'], [], []))
+    assert pool.checkout('a') is alive
+    assert dropped.closed
+    assert pool.stats()['evictions'] == 1
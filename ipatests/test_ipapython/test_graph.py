@@ -0,0 +1,76 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the `ipapython.graph` module.
+"""
+
+import pytest
+
+from ipapython.graph import Graph
+
+pytestmark = pytest.mark.tier0
+
+
+def make_graph(vertices, edges):
+    graph = Graph()
+    for vertex in vertices:
+        graph.add_vertex(vertex)
+    for tail, head in edges:
+        graph.add_edge(tail, head)
+    return graph
+
+
+def test_edges():
+    graph = make_graph('abc', [('a', 'b'), ('b', 'c'), ('c', 'b')])
+    assert graph.get_heads('b') == ['c']
+    assert graph.get_tails('b') == ['a', 'c']
+
+    graph.remove_edge('a', 'b')
+    assert graph.get_tails('b') == ['c']
+    with pytest.raises(ValueError):
+        graph.remove_edge('a', 'b')
+
+    graph.remove_vertex('c')
+    assert graph.vertices == {'a', 'b'}
+    assert graph.edges == []
+    with pytest.raises(ValueError):
+        graph.remove_vertex('c')
+
+
+def test_strongly_connected_components():
+    graph = make_graph('abcde', [
+        ('a', 'b'), ('b', 'a'), ('b', 'c'), ('c', 'd'), ('d', 'c'),
+        ('d', 'e'),
+    ])
+    # components are listed after the components reachable from them
+    assert graph.strongly_connected_components() == [
+        {'e'}, {'c', 'd'}, {'a', 'b'}]
+    assert graph.strongly_connected_components(
+        ignored_vertices=['a'], ignored_edges=[('d', 'c')]) == [
+        {'e'}, {'d'}, {'c'}, {'b'}]
+    assert len(graph.edges) == 6
+
+
+def test_get_reachable():
+    graph = make_graph('abcde', [
+        ('a', 'b'), ('b', 'a'), ('b', 'c'), ('c', 'd'), ('d', 'c'),
+    ])
+    reachable = graph.get_reachable()
+    assert reachable['a'] == set('abcd')
+    assert reachable['d'] == set('cd')
+    assert reachable['e'] == {'e'}
+    assert graph.get_reachable(ignored_edges=[('b', 'c')])['a'] == set('ab')
+    for vertex in graph.vertices:
+        assert reachable[vertex] == graph.bfs(vertex)
+
+
+def test_get_cuts():
+    # two triangles joined by the b-d edge, e is a leaf of d
+    edges = [('a', 'b'), ('b', 'c'), ('c', 'a'), ('b', 'd'), ('d', 'f'),
+             ('f', 'g'), ('g', 'd'), ('d', 'e')]
+    graph = make_graph('abcdefg', edges + [(h, t) for t, h in edges])
+    cut_vertices, bridges = graph.get_cuts()
+    assert cut_vertices == {'b', 'd'}
+    assert bridges == {frozenset('bd'), frozenset('de')}
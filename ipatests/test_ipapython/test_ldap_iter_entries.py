@@ -0,0 +1,99 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test `ipapython.ipaldap.LDAPClient.iter_entries`.
+"""
+
+import ldap
+from ldap.controls import SimplePagedResultsControl
+import pytest
+
+from ipapython import ipaldap
+from ipapython.dn import DN
+
+pytestmark = pytest.mark.tier0
+
+BASE_DN = DN('cn=users,cn=accounts,dc=ipa,dc=test')
+
+
+class FakeConnection:
+    """
+    Serve ``count`` entries in pages of the requested page size.
+    """
+
+    def __init__(self, count, sizelimit_after=None):
+        self.count = count
+        self.sizelimit_after = sizelimit_after
+        self.searches = []
+        self.abandoned = []
+        self._pending = {}
+
+    def search_ext(self, base, scope, filterstr, attrlist, serverctrls,
+                   timeout, sizelimit):
+        page = [c for c in serverctrls
+                if isinstance(c, SimplePagedResultsControl)][0]
+        start = int(page.cookie or 0)
+        end = min(start + page.size, self.count)
+        msgid = len(self.searches) + 1
+        self.searches.append((start, page.size))
+        self._pending[msgid] = (start, end)
+        return msgid
+
+    def result3(self, msgid, all):
+        start, end = self._pending[msgid]
+        if start == self.sizelimit_after:
+            raise ldap.SIZELIMIT_EXCEEDED({'desc': 'Size limit exceeded'})
+        if start < end:
+            self._pending[msgid] = (start + 1, end)
+            dn = 'uid=user{},{}'.format(start, BASE_DN)
+            return (ldap.RES_SEARCH_ENTRY,
+                    [(dn, {'uid': [b'user%d' % start]})], msgid, [])
+        cookie = str(end).encode('ascii') if end < self.count else b''
+        return (ldap.RES_SEARCH_RESULT, [], msgid,
+                [SimplePagedResultsControl(0, 0, cookie)])
+
+    def abandon(self, msgid):
+        self.abandoned.append(msgid)
+
+
+def client(conn):
+    c = ipaldap.LDAPClient('ldap://ipa.test', no_schema=True)
+    object.__setattr__(c, '_conn', conn)
+    return c
+
+
+def test_pages():
+    conn = FakeConnection(5)
+    entries = client(conn).iter_entries(
+        '(uid=*)', ['uid'], BASE_DN, page_size=2, size_limit=0)
+    uids = [e.single_value['uid'] for e in entries]
+    assert uids == ['user0', 'user1', 'user2', 'user3', 'user4']
+    assert conn.searches == [(0, 2), (2, 2), (4, 2)]
+    assert not entries.truncated
+    assert conn.abandoned == []
+
+
+def test_empty():
+    entries = client(FakeConnection(0)).iter_entries(
+        '(uid=*)', ['uid'], BASE_DN, size_limit=0)
+    assert list(entries) == []
+    assert not entries.truncated
+
+
+def test_truncated():
+    conn = FakeConnection(5, sizelimit_after=2)
+    entries = client(conn).iter_entries(
+        '(uid=*)', ['uid'], BASE_DN, page_size=2, size_limit=0)
+    assert len(list(entries)) == 2
+    assert entries.truncated is ipaldap.TRUNCATED_SIZE_LIMIT
+
+
+def test_close_abandons_search():
+    conn = FakeConnection(5)
+    with client(conn).iter_entries(
+            '(uid=*)', ['uid'], BASE_DN, page_size=2,
+            size_limit=0) as entries:
+        next(entries)
+    assert conn.abandoned == [1]
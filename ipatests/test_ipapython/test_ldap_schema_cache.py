@@ -0,0 +1,110 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the on-disk cache of `ipapython.ipaldap.SchemaCache`.
+"""
+
+import os
+
+import ldap.schema
+import pytest
+
+from ipapython.ipaldap import SchemaCache
+
+pytestmark = pytest.mark.tier0
+
+URL = 'ldapi://%2fvar%2frun%2fslapd-IPA-TEST.socket'
+
+
+class FakeConnection:
+    def __init__(self, csn=b'5b1e7d4e000000000000'):
+        self.csn = csn
+        self.searches = []
+
+    def search_s(self, base, scope, attrlist):
+        self.searches.append(sorted(a.lower() for a in attrlist))
+        attrs = {
+            'modifyTimestamp': [b'20180611120000Z'],
+            'nsSchemaCSN': [self.csn],
+        }
+        if 'attributetypes' in attrlist:
+            attrs['attributeTypes'] = [
+                b"( 2.5.4.3 NAME 'cn' "
+                b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )"
+            ]
+            attrs['objectClasses'] = [
+                b"( 2.5.6.0 NAME 'top' ABSTRACT MUST objectClass )"
+            ]
+        return [('cn=schema', attrs)]
+
+
+FULL = ['attributetypes', 'modifytimestamp', 'nsschemacsn', 'objectclasses']
+VALIDATE = ['modifytimestamp', 'nsschemacsn']
+
+
+@pytest.fixture
+def cache_dir(tmpdir):
+    return str(tmpdir.join('schema'))
+
+
+def test_memory_only(tmpdir):
+    cache = SchemaCache()
+    conn = FakeConnection()
+    schema = cache.get_schema(URL, conn)
+    assert cache.get_schema(URL, conn) is schema
+    assert conn.searches == [FULL]
+    assert tmpdir.listdir() == []
+
+
+def test_shared_on_disk(cache_dir):
+    conn = FakeConnection()
+    schema = SchemaCache(cache_dir).get_schema(URL, conn)
+    assert len(os.listdir(cache_dir)) == 1
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+
+    # another process loads the schema from disk and only revalidates it
+    conn = FakeConnection()
+    cached = SchemaCache(cache_dir).get_schema(URL, conn)
+    assert conn.searches == [VALIDATE]
+    assert cached is not schema
+    assert cached.get_obj(ldap.schema.ObjectClass, 'top') is not None
+
+
+def test_explicit_cache_dir(tmpdir, cache_dir):
+    default_dir = str(tmpdir.join('default'))
+    cache = SchemaCache(default_dir)
+    cache.get_schema(URL, FakeConnection(), cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    assert not os.path.exists(default_dir)
+    # the directory is not remembered by the cache
+    assert cache.cache_dir == default_dir
+
+
+def test_outdated(cache_dir):
+    SchemaCache(cache_dir).get_schema(URL, FakeConnection())
+    conn = FakeConnection(csn=b'5b1e7d4e000100000000')
+    SchemaCache(cache_dir).get_schema(URL, conn)
+    assert conn.searches == [VALIDATE, FULL]
+
+    # the refreshed schema was written back
+    conn = FakeConnection(csn=b'5b1e7d4e000100000000')
+    SchemaCache(cache_dir).get_schema(URL, conn)
+    assert conn.searches == [VALIDATE]
+
+
+def test_force_update(cache_dir):
+    SchemaCache(cache_dir).get_schema(URL, FakeConnection())
+    conn = FakeConnection()
+    SchemaCache(cache_dir).get_schema(URL, conn, force_update=True)
+    assert conn.searches == [FULL]
+
+
+def test_unsafe_permissions(cache_dir):
+    SchemaCache(cache_dir).get_schema(URL, FakeConnection())
+    for name in os.listdir(cache_dir):
+        os.chmod(os.path.join(cache_dir, name), 0o666)
+    conn = FakeConnection()
+    SchemaCache(cache_dir).get_schema(URL, conn)
+    assert conn.searches == [FULL]
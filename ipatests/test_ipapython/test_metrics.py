@@ -0,0 +1,123 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the `ipapython.metrics` module.
+"""
+
+import pytest
+
+from ipapython import metrics
+
+pytestmark = pytest.mark.tier0
+
+
+@pytest.fixture
+def registry():
+    return metrics.MetricsRegistry()
+
+
+def test_counter(registry):
+    counter = registry.counter('requests_total', 'Requests', ('command',))
+    counter.inc(command=u'user_show')
+    counter.inc(2, command=u'user_show')
+    assert counter.get(command=u'user_show') == 3
+    assert registry.counter('requests_total', 'Requests') is counter
+    assert registry.render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{command="user_show"} 3.0',
+    ]
+
+
+def test_histogram(registry):
+    hist = registry.histogram(
+        'duration_seconds', 'Duration', ('op',), buckets=(0.1, 1.0))
+    hist.observe(0.05, op='search')
+    hist.observe(0.5, op='search')
+    hist.observe(5, op='search')
+    assert hist.get(op='search') == (3, 5.55)
+    assert registry.render().splitlines() == [
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{op="search",le="0.1"} 1',
+        'duration_seconds_bucket{op="search",le="1.0"} 2',
+        'duration_seconds_bucket{op="search",le="+Inf"} 3',
+        'duration_seconds_sum{op="search"} 5.55',
+        'duration_seconds_count{op="search"} 3',
+    ]
+
+
+def test_histogram_time(registry):
+    hist = registry.histogram('block_seconds', 'Block', ('phase',))
+    with pytest.raises(RuntimeError):
+        with hist.time(phase='execute'):
+            raise RuntimeError()
+    assert hist.get(phase='execute')[0] == 1
+
+
+def test_histogram_time_iter(registry, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(metrics.time, 'monotonic', lambda: next(clock))
+
+    def chunks():
+        yield b'a'
+        yield b'b'
+
+    hist = registry.histogram('iter_seconds', 'Iter', ('handler',))
+    timed = hist.time_iter(chunks(), handler='jsonserver')
+    assert hist.get(handler='jsonserver') == (0, 0.0)
+    assert next(timed) == b'a'
+    # time spent by the consumer between two chunks is not counted
+    next(clock)
+    assert list(timed) == [b'b']
+    # three calls of next(), one clock tick each
+    assert hist.get(handler='jsonserver') == (1, 3.0)
+
+
+def test_histogram_time_iter_closed(registry):
+    hist = registry.histogram('closed_seconds', 'Closed', ('handler',))
+    timed = hist.time_iter(iter([b'a', b'b']), handler='jsonserver')
+    next(timed)
+    timed.close()
+    assert hist.get(handler='jsonserver')[0] == 1
+
+
+def test_wrong_labels(registry):
+    counter = registry.counter('labelled_total', 'Labelled', ('command',))
+    with pytest.raises(ValueError):
+        counter.inc(cmd='user_show')
+    with pytest.raises(ValueError):
+        registry.histogram('labelled_total', 'Labelled')
+
+
+def test_label_escaping(registry):
+    gauge = registry.gauge('escaped', 'Escaped', ('name',))
+    gauge.set(1, name='a"b\\c\nd')
+    assert r'escaped{name="a\"b\\c\nd"} 1.0' in registry.render()
+
+
+def test_collector(registry):
+    def collector():
+        gauge = metrics.Gauge('collected', 'Collected')
+        gauge.set(42)
+        yield gauge
+
+    registry.add_collector('test', collector)
+    assert 'collected 42.0' in registry.render().splitlines()
+
+
+def test_collector_replaced(registry):
+    def make_collector(value):
+        def collector():
+            gauge = metrics.Gauge('collected', 'Collected')
+            gauge.set(value)
+            yield gauge
+        return collector
+
+    registry.add_collector('test', make_collector(1))
+    registry.add_collector('test', make_collector(2))
+    lines = registry.render().splitlines()
+    assert 'collected 2.0' in lines
+    assert 'collected 1.0' not in lines
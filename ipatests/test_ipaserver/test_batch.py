@@ -0,0 +1,179 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the parallel mode of `ipaserver.plugins.batch`.
+"""
+
+import threading
+import time
+
+import pytest
+
+from ipalib import errors
+from ipalib.request import context
+from ipaserver.plugins import batch as batch_plugin
+
+pytestmark = pytest.mark.tier0
+
+
+class FakeCommand:
+    def __init__(self, name, read_only, log, delay=0, error=None):
+        self.name = name
+        self.read_only = read_only
+        self.log = log
+        self.delay = delay
+        self.error = error
+
+    def args_options_2_params(self, *args, **options):
+        return dict(options)
+
+    def _repr_iter(self, **params):
+        return iter(())
+
+    def __call__(self, *args, **options):
+        self.log.append(('start', self.name, threading.current_thread()))
+        time.sleep(self.delay)
+        self.log.append(('end', self.name, threading.current_thread()))
+        if self.error is not None:
+            raise self.error
+        return dict(result=self.name)
+
+
+class FakeLDAP2:
+    def __init__(self):
+        self.connected = []
+        self.ccaches = []
+
+    def connect(self, ccache=None, size_limit=None, time_limit=None):
+        self.connected.append(threading.current_thread())
+        self.ccaches.append(ccache)
+
+
+class FakeAPI:
+    class env:
+        context = 'server'
+
+    def __init__(self, *commands):
+        self.Command = {c.name: c for c in commands}
+        self.Backend = type('Backend', (), {'ldap2': FakeLDAP2()})()
+
+
+REQUEST_CCACHE = 'FILE:/run/ipa/ccaches/admin@IPA.TEST-abc'
+
+
+@pytest.fixture
+def log():
+    return []
+
+
+@pytest.fixture
+def make_batch(monkeypatch):
+    context.principal = u'admin@IPA.TEST'
+    context.ccache_name = REQUEST_CCACHE
+
+    def make_batch(*commands):
+        api = FakeAPI(*commands)
+        monkeypatch.setattr(batch_plugin, 'api', api)
+        return batch_plugin.batch(api)
+
+    yield make_batch
+    del context.principal
+    if hasattr(context, 'ccache_name'):
+        del context.ccache_name
+
+
+def _call(name):
+    return dict(method=name, params=[[], {}])
+
+
+def _run(cmd, *names):
+    return cmd.execute([_call(n) for n in names], version=u'2.230',
+                       parallel=True)
+
+
+def test_results_keep_request_order(make_batch, log):
+    # the first method is the slowest, so it finishes last
+    cmd = make_batch(
+        FakeCommand('a_show', True, log, delay=0.3),
+        FakeCommand('b_show', True, log, delay=0.1),
+        FakeCommand('c_find', True, log),
+    )
+    result = _run(cmd, 'a_show', 'b_show', 'c_find')
+
+    assert result['count'] == 3
+    assert [r['result'] for r in result['results']] == [
+        'a_show', 'b_show', 'c_find']
+    assert all(r['error'] is None for r in result['results'])
+    assert [name for event, name, _t in log if event == 'end'][-1] == 'a_show'
+    # each nested read gets its own connection in a worker thread
+    assert len(cmd.api.Backend.ldap2.connected) == 3
+    main = threading.current_thread()
+    assert all(t is not main for t in cmd.api.Backend.ldap2.connected)
+
+
+def test_write_runs_sequentially(make_batch, log):
+    cmd = make_batch(
+        FakeCommand('a_show', True, log, delay=0.2),
+        FakeCommand('b_mod', False, log),
+        FakeCommand('c_show', True, log),
+    )
+    result = _run(cmd, 'a_show', 'b_mod', 'c_show')
+
+    assert [r['result'] for r in result['results']] == [
+        'a_show', 'b_mod', 'c_show']
+    events = [(event, name) for event, name, _t in log]
+    # the write waits for the preceding read and precedes the next one
+    assert events.index(('end', 'a_show')) < events.index(('start', 'b_mod'))
+    assert events.index(('end', 'b_mod')) < events.index(('start', 'c_show'))
+    # the write is executed in the request thread
+    write_thread = [t for event, name, t in log if name == 'b_mod'][0]
+    assert write_thread is threading.current_thread()
+    assert len(cmd.api.Backend.ldap2.connected) == 2
+
+
+def test_errors_are_isolated(make_batch, log):
+    cmd = make_batch(
+        FakeCommand('a_show', True, log, delay=0.1),
+        FakeCommand('b_show', True, log,
+                    error=errors.NotFound(reason=u'no such entry')),
+        FakeCommand('c_show', True, log, error=ValueError('boom')),
+        FakeCommand('d_show', True, log),
+    )
+    result = _run(cmd, 'a_show', 'b_show', 'c_show', 'd_show', 'e_show')
+    results = result['results']
+
+    assert result['count'] == 5
+    assert results[0]['result'] == 'a_show'
+    assert results[0]['error'] is None
+    assert results[1]['error_name'] == u'NotFound'
+    assert results[1]['error'] == u'no such entry'
+    assert results[2]['error_name'] == u'InternalError'
+    assert results[3]['result'] == 'd_show'
+    # unknown methods are reported, not submitted to the pool
+    assert results[4]['error_name'] == u'CommandError'
+
+
+def test_request_ccache_is_used(make_batch, log, monkeypatch):
+    # another request thread of the worker set the environment
+    monkeypatch.setenv('KRB5CCNAME', 'FILE:/run/ipa/ccaches/other')
+    cmd = make_batch(
+        FakeCommand('a_show', True, log),
+        FakeCommand('b_show', True, log),
+    )
+    _run(cmd, 'a_show', 'b_show')
+    assert cmd.api.Backend.ldap2.ccaches == [REQUEST_CCACHE] * 2
+
+
+def test_sequential_without_request_ccache(make_batch, log):
+    del context.ccache_name
+    cmd = make_batch(
+        FakeCommand('a_show', True, log),
+        FakeCommand('b_show', True, log),
+    )
+    result = _run(cmd, 'a_show', 'b_show')
+    assert [r['result'] for r in result['results']] == ['a_show', 'b_show']
+    # the reads are executed in the request thread with its connection
+    assert cmd.api.Backend.ldap2.connected == []
+    assert all(t is threading.current_thread() for _e, _n, t in log)
@@ -0,0 +1,162 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the cached CA ACL index of `ipaserver.plugins.cert`
+"""
+
+import itertools
+
+import pytest
+
+from ipapython.dn import DN
+from ipapython.kerberos import Principal
+
+pyhbac = pytest.importorskip('pyhbac')
+
+# pylint: disable=wrong-import-position
+from ipaserver.plugins import cert as cert_plugin
+
+pytestmark = pytest.mark.tier0
+
+ACLS = [
+    {'cn': [u'hosts_services_caIPAserviceCert'], 'ipaenabledflag': [True],
+     'hostcategory': [u'all'], 'servicecategory': [u'all'],
+     'ipamembercertprofile_certprofile': [u'caIPAserviceCert']},
+    {'cn': [u'admins_sub_userCert'], 'ipaenabledflag': [True],
+     'ipamemberca_ca': [u'sub'],
+     'ipamembercertprofile_certprofile': [u'userCert'],
+     'memberuser_group': [u'admins']},
+    {'cn': [u'u1_everything'], 'ipaenabledflag': [True],
+     'ipacacategory': [u'all'], 'ipacertprofilecategory': [u'all'],
+     'memberuser_user': [u'u1']},
+    {'cn': [u'web_service'], 'ipaenabledflag': [True],
+     'ipamemberca_ca': [u'ipa', u'sub'],
+     'ipamembercertprofile_certprofile': [u'webServer'],
+     'memberservice_service': [u'HTTP/web.ipa.test@IPA.TEST']},
+    {'cn': [u'disabled'], 'ipaenabledflag': [False],
+     'ipacacategory': [u'all'], 'ipacertprofilecategory': [u'all'],
+     'usercategory': [u'all'], 'hostcategory': [u'all'],
+     'servicecategory': [u'all']},
+]
+
+GROUPS = {
+    u'u1': [u'ipausers'],
+    u'u2': [u'admins', u'ipausers'],
+    u'web.ipa.test': [u'webservers'],
+}
+
+
+class FakeLDAP2:
+    def __init__(self):
+        self.signature = (len(ACLS), 1)
+
+    def get_entries_signature(self, filter, base_dn):
+        return self.signature
+
+    def get_membership_graph(self):
+        return None
+
+
+class FakeCommands:
+    def __init__(self):
+        self.acls = list(ACLS)
+        self.finds = 0
+
+    def caacl_find(self, no_members=True):
+        self.finds += 1
+        return dict(result=[dict(acl) for acl in self.acls])
+
+    def user_show(self, uid):
+        return dict(result=dict(memberof_group=list(GROUPS[uid])))
+
+    def host_show(self, fqdn):
+        return dict(result=dict(memberof_hostgroup=list(GROUPS[fqdn])))
+
+
+class FakeAPI:
+    class env:
+        basedn = DN('dc=ipa,dc=test')
+        container_caacl = DN('cn=caacls,cn=ca')
+
+    def __init__(self):
+        self.Backend = type('Backend', (), {'ldap2': FakeLDAP2()})()
+        self.Command = FakeCommands()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = FakeAPI()
+    monkeypatch.setattr(cert_plugin, 'api', api)
+    monkeypatch.setattr(cert_plugin, '_acl_cache', {})
+    return api
+
+
+def _principal_type(principal):
+    if principal.is_user:
+        return 'user'
+    elif principal.is_host:
+        return 'host'
+    return 'service'
+
+
+def _evaluate_all(acls, principal, ca_id, profile_id):
+    """The former evaluation of all CA ACLs on every request"""
+    principal_type = _principal_type(principal)
+    rules = [cert_plugin._acl_make_rule(principal_type, obj) for obj in acls]
+    req = cert_plugin._acl_make_request(
+        principal_type, principal, ca_id, profile_id)
+    return req.evaluate(rules) == pyhbac.HBAC_EVAL_ALLOW
+
+
+PRINCIPALS = [
+    Principal(u'u1@IPA.TEST'),
+    Principal(u'u2@IPA.TEST'),
+    Principal(u'host/web.ipa.test@IPA.TEST'),
+    Principal(u'HTTP/web.ipa.test@IPA.TEST'),
+    Principal(u'HTTP/db.ipa.test@IPA.TEST'),
+]
+CAS = [u'ipa', u'sub', u'SUB', u'other']
+PROFILES = [u'caIPAserviceCert', u'userCert', u'webServer', u'unknown']
+
+
+def test_index_matches_evaluation_of_all_rules(api):
+    granted = 0
+    for principal, ca_id, profile_id in itertools.product(
+            PRINCIPALS, CAS, PROFILES):
+        expected = _evaluate_all(ACLS, principal, ca_id, profile_id)
+        assert cert_plugin.acl_evaluate(
+            principal, ca_id, profile_id) == expected, (
+            principal, ca_id, profile_id)
+        granted += expected
+    # make sure the data set covers both outcomes
+    assert 0 < granted < len(PRINCIPALS) * len(CAS) * len(PROFILES)
+    # the rules are read once per principal type
+    assert api.Command.finds == 3
+
+
+def test_disabled_rules_are_not_indexed(api):
+    index = cert_plugin._acl_get_index('user')
+    assert [rule.name for rule in index.rules] == [
+        u'hosts_services_caIPAserviceCert', u'admins_sub_userCert',
+        u'u1_everything', u'web_service']
+    assert [rule.name for rule in index.select(u'SUB', u'USERCERT')] == [
+        u'admins_sub_userCert', u'u1_everything']
+    assert index.select(u'other', u'unknown') == [
+        index.rules[2]]
+
+
+def test_cache_invalidated_when_acl_changes(api):
+    u2 = Principal(u'u2@IPA.TEST')
+    assert not cert_plugin.acl_evaluate(u2, u'ipa', u'userCert')
+    assert cert_plugin._acl_get_index('user') is \
+        cert_plugin._acl_get_index('user')
+    assert api.Command.finds == 1
+
+    # an ACL was modified
+    api.Command.acls[1] = dict(ACLS[1], ipamemberca_ca=[u'ipa', u'sub'])
+    api.Backend.ldap2.signature = (len(ACLS), 2)
+
+    assert cert_plugin.acl_evaluate(u2, u'ipa', u'userCert')
+    assert api.Command.finds == 2
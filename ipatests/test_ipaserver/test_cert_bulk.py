@@ -0,0 +1,273 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the commands of `ipaserver.plugins.cert` which work on many certificates
+"""
+
+import pytest
+
+from ipalib import errors
+from ipapython.dn import DN
+from ipapython.kerberos import Principal
+
+pytest.importorskip('pyhbac')
+
+# pylint: disable=wrong-import-position
+from ipaserver.plugins import cert as cert_plugin
+
+pytestmark = pytest.mark.tier0
+
+ISSUER = u'CN=Certificate Authority,O=IPA.TEST'
+
+
+class FakeLDAP2:
+    size_limit = 100
+    time_limit = 2
+
+
+class FakeRA:
+    DEFAULT_PROFILE = u'caIPAserviceCert'
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.requested = []
+        self.submitted = []
+
+    def get_certificates(self, serial_numbers):
+        serial_numbers = list(serial_numbers)
+        self.requested.append(serial_numbers)
+        for serial_number in serial_numbers:
+            if serial_number in self.fail:
+                raise errors.CertificateOperationError(
+                    error=u'Certificate ID %s not found' % serial_number)
+        return [dict(certificate=u'MII\r\n%s' % sn, serial_number=sn)
+                for sn in serial_numbers]
+
+    def request_certificates(self, requests):
+        results = []
+        for request_id, (csr, profile_id, ca_id) in enumerate(requests, 1):
+            self.submitted.append((csr, profile_id, ca_id))
+            if csr == u'rejected':
+                results.append(errors.CertificateOperationError(
+                    error=u'Request rejected'))
+                continue
+            result = dict(request_id=u'%d' % request_id,
+                          serial_number=u'%d' % (100 + request_id))
+            if csr != u'pending':
+                result['certificate'] = u'MII%d' % request_id
+            results.append(result)
+        return results
+
+
+class FakeCommands:
+    def __init__(self):
+        self.ca_shows = []
+        self.stored = []
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def ca_is_enabled(self):
+        return dict(result=True)
+
+    def ca_show(self, cacn, all=False):
+        self.ca_shows.append(cacn)
+        return dict(result=dict(cn=[cacn], ipacaid=[u'%s-id' % cacn]))
+
+    def certprofile_show(self, profile_id):
+        if profile_id == u'broken':
+            raise errors.NotFound(reason=u'broken: profile not found')
+        store = u'FALSE' if profile_id == u'nostore' else u'TRUE'
+        return dict(result=dict(ipacertprofilestoreissued=[store]))
+
+    def user_mod(self, uid, addattr):
+        if uid == u'readonly':
+            raise errors.ACIError(info=u'Insufficient access')
+        self.stored.append((uid, addattr))
+        return dict(result=dict())
+
+
+class FakeCertObject:
+    def _parse(self, obj, full=True):
+        obj['parsed'] = True
+
+    def _fill_owners(self, obj):
+        pass
+
+
+class FakeAPI:
+    class env:
+        basedn = DN('dc=ipa,dc=test')
+
+    def __init__(self, ra):
+        self.Backend = type('Backend', (), {
+            'ldap2': FakeLDAP2(), 'ra': ra})()
+        self.Command = FakeCommands()
+        self.Object = {('cert', '1'): FakeCertObject()}
+
+
+def make_cert_find(ra, count=5):
+    cmd = cert_plugin.cert_find(FakeAPI(ra))
+    messages = []
+    certs = [
+        ((ISSUER, serial), dict(serial_number=serial, cacn=u'ipa'))
+        for serial in range(1, count + 1)
+    ]
+
+    def cert_search(**options):
+        return dict(certs), False, True
+
+    def no_search(**options):
+        return {}, False, False
+
+    cmd._cert_search = cert_search
+    cmd._ca_search = no_search
+    cmd._ldap_search = no_search
+    cmd.add_message = messages.append
+    return cmd, messages
+
+
+class TestCertFind:
+    def test_details_in_order(self):
+        ra = FakeRA()
+        cmd, _messages = make_cert_find(ra)
+        result = cmd.execute(all=True)
+        assert result['count'] == 5
+        assert [r['serial_number'] for r in result['result']] == [
+            u'1', u'2', u'3', u'4', u'5']
+        assert [r['certificate'] for r in result['result']] == [
+            u'MII1', u'MII2', u'MII3', u'MII4', u'MII5']
+        assert all(r['parsed'] for r in result['result'])
+        # one batch for all certificates, one ca_show per CA
+        assert len(ra.requested) == 1
+        assert cmd.api.Command.ca_shows == [u'ipa']
+
+    def test_truncated_before_details(self):
+        ra = FakeRA()
+        cmd, messages = make_cert_find(ra)
+        result = cmd.execute(all=True, sizelimit=2)
+        assert result['count'] == 2
+        assert result['truncated']
+        assert ra.requested == [[u'1', u'2']]
+        assert len(messages) == 1
+
+    def test_no_details_without_all(self):
+        ra = FakeRA()
+        cmd, _messages = make_cert_find(ra)
+        result = cmd.execute(all=False)
+        assert result['count'] == 5
+        assert ra.requested == []
+
+    def test_failed_detail(self):
+        ra = FakeRA(fail=[u'3'])
+        cmd, _messages = make_cert_find(ra)
+        with pytest.raises(errors.CertificateOperationError):
+            cmd.execute(all=True)
+        # the certificate past the size limit is not retrieved
+        assert cmd.execute(all=True, sizelimit=2)['count'] == 2
+
+
+class FakeCSR:
+    def __init__(self, name):
+        self.name = name
+
+    def public_bytes(self, encoding):
+        return self.name.encode('utf-8')
+
+
+def make_cert_request_batch(ra):
+    cmd = cert_plugin.cert_request_batch(FakeAPI(ra))
+
+    def get_request(request):
+        return (FakeCSR(request['csr']), Principal(request['principal']),
+                request.get('cacn', u'ipa'),
+                request.get('profile_id', FakeRA.DEFAULT_PROFILE), False)
+
+    def check_request(csr, principal, add, ca, profile_id, access):
+        if principal.username == u'denied':
+            raise errors.ACIError(info=u'Insufficient access')
+        return principal
+
+    cmd._get_request = get_request
+    cmd._check_request = check_request
+    return cmd
+
+
+def _request(csr, principal=u'u1@IPA.TEST', **kwargs):
+    return dict(csr=csr, principal=principal, **kwargs)
+
+
+class TestCertRequestBatch:
+    def test_mixed_results(self):
+        ra = FakeRA()
+        cmd = make_cert_request_batch(ra)
+        result = cmd.execute([
+            _request(u'c1'),
+            _request(u'c2', principal=u'denied@IPA.TEST'),
+            _request(u'rejected'),
+            _request(u'pending', principal=u'u2@IPA.TEST'),
+            _request(u'c3', cacn=u'sub'),
+        ])
+        results = result['results']
+
+        assert result['count'] == 5
+        assert result['issued'] == 2
+        assert [r['error_name'] if r['error'] else r['certificate']
+                for r in results[:3]] == [
+            u'MII1', u'ACIError', u'CertificateOperationError']
+        assert results[3]['error'] is None
+        assert 'certificate' not in results[3]
+        assert results[4]['cacn'] == u'sub'
+        assert results[4]['principal'] == u'u1@IPA.TEST'
+        # only the valid requests reach the CA, each CA is looked up once
+        assert ra.submitted == [
+            (u'c1', u'caIPAserviceCert', u'ipa-id'),
+            (u'rejected', u'caIPAserviceCert', u'ipa-id'),
+            (u'pending', u'caIPAserviceCert', u'ipa-id'),
+            (u'c3', u'caIPAserviceCert', u'sub-id'),
+        ]
+        assert cmd.api.Command.ca_shows == [u'ipa', u'sub']
+        # both certificates of u1 are added with one modification
+        assert cmd.api.Command.stored == [
+            (u'u1', [u'usercertificate=MII1', u'usercertificate=MII4'])]
+
+    def test_store_failure(self):
+        ra = FakeRA()
+        cmd = make_cert_request_batch(ra)
+        result = cmd.execute([
+            _request(u'c1', principal=u'readonly@IPA.TEST'),
+            _request(u'c2'),
+            _request(u'c3', principal=u'readonly@IPA.TEST'),
+        ])
+        results = result['results']
+
+        assert result['issued'] == 1
+        for failed in (results[0], results[2]):
+            assert failed['error_name'] == u'ACIError'
+            assert 'certificate' not in failed
+            # the issued certificate can still be found in the CA
+            assert failed['serial_number']
+        assert results[1]['certificate'] == u'MII2'
+        assert results[1]['error'] is None
+
+    def test_profile_failure(self):
+        ra = FakeRA()
+        cmd = make_cert_request_batch(ra)
+        result = cmd.execute([
+            _request(u'c1', profile_id=u'broken'),
+            _request(u'c2', profile_id=u'nostore'),
+            _request(u'c3', profile_id=u'broken'),
+            _request(u'c4'),
+        ])
+        results = result['results']
+
+        assert result['issued'] == 2
+        assert [r['error_name'] if r['error'] else None
+                for r in results] == [u'NotFound', None, u'NotFound', None]
+        assert 'certificate' not in results[0]
+        assert results[1]['certificate'] == u'MII2'
+        # certificates of profiles which don't store them are not added
+        assert cmd.api.Command.stored == [
+            (u'u1', [u'usercertificate=MII4'])]
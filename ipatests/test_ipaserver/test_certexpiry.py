@@ -0,0 +1,255 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the in-memory certificate expiration index
+"""
+
+from __future__ import absolute_import
+
+import datetime
+import re
+
+import pytest
+from cryptography import x509 as crypto_x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from ipapython.dn import DN
+from ipaserver.certexpiry import CertExpiryIndex
+
+pytestmark = pytest.mark.tier0
+
+BASE_DN = DN('dc=ipa,dc=test')
+ISSUER = DN('CN=Certificate Authority,O=IPA.TEST')
+NOW = datetime.datetime(2018, 6, 1)
+
+
+def user(uid):
+    return DN(('uid', uid), 'cn=users,cn=accounts', BASE_DN)
+
+
+@pytest.fixture(scope='module')
+def key():
+    return rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend())
+
+
+@pytest.fixture(scope='module')
+def make_cert(key):
+    name = crypto_x509.Name([
+        crypto_x509.NameAttribute(crypto_x509.oid.NameOID.ORGANIZATION_NAME,
+                                  u'IPA.TEST'),
+        crypto_x509.NameAttribute(crypto_x509.oid.NameOID.COMMON_NAME,
+                                  u'Certificate Authority'),
+    ])
+
+    def make_cert(serial_number, days):
+        not_after = NOW + datetime.timedelta(days=days)
+        cert = crypto_x509.CertificateBuilder(
+            issuer_name=name,
+            subject_name=name,
+            public_key=key.public_key(),
+            serial_number=serial_number,
+            not_valid_before=not_after - datetime.timedelta(days=365),
+            not_valid_after=not_after,
+        ).sign(key, hashes.SHA256(), default_backend())
+        return cert.public_bytes(serialization.Encoding.DER)
+
+    return make_cert
+
+
+class FakeResult(list):
+    truncated = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class FakeEntry(dict):
+    def __init__(self, dn, attrs):
+        super(FakeEntry, self).__init__(attrs)
+        self.dn = dn
+        self.raw = attrs
+        self.single_value = {k: v[0] for k, v in attrs.items()}
+
+
+class FakeLDAP:
+    def __init__(self):
+        self.last_usn = 0
+        # entry DN -> (entryusn, nsUniqueId, DER certificates)
+        self.entries = {}
+        # nsUniqueId -> entryusn of the tombstone
+        self.tombstones = {}
+        self.searches = []
+
+    def set_certs(self, dn, *certs):
+        self.last_usn += 1
+        unique_id = self.entries.get(dn, (None, str(dn)))[1]
+        self.entries[dn] = (self.last_usn, unique_id, list(certs))
+
+    def delete(self, dn):
+        self.last_usn += 1
+        _usn, unique_id, _certs = self.entries.pop(dn)
+        self.tombstones[unique_id] = self.last_usn
+
+    def rename(self, dn, new_dn):
+        self.last_usn += 1
+        _usn, unique_id, certs = self.entries.pop(dn)
+        self.entries[new_dn] = (self.last_usn, unique_id, certs)
+
+    def get_entry(self, dn, attrs_list):
+        assert dn == DN()
+        return FakeEntry(dn, {'lastusn': [str(self.last_usn)]})
+
+    def iter_entries(self, filter, attrs_list, base_dn, **kwargs):
+        self.searches.append(filter)
+        match = re.search(r'\(entryusn>=(\d+)\)', filter)
+        min_usn = int(match.group(1)) if match else 0
+        if 'nstombstone' in filter:
+            return FakeResult(
+                FakeEntry(DN(('nsuniqueid', unique_id), BASE_DN),
+                          {'nsuniqueid': [unique_id]})
+                for unique_id, usn in self.tombstones.items()
+                if usn >= min_usn
+            )
+        return FakeResult(
+            FakeEntry(dn, {'usercertificate': certs,
+                           'nsuniqueid': [unique_id]})
+            for dn, (usn, unique_id, certs) in self.entries.items()
+            if usn >= min_usn and
+            (certs or 'usercertificate' not in filter)
+        )
+
+    def handle_truncated_result(self, truncated):
+        assert not truncated
+
+
+def serials(rows):
+    return [(serial_number, owner) for _na, _i, serial_number, owner in rows]
+
+
+@pytest.fixture
+def ldap(make_cert):
+    ldap = FakeLDAP()
+    ldap.set_certs(user('u1'), make_cert(1, 10), make_cert(2, -5))
+    ldap.set_certs(user('u2'), make_cert(3, 40), b'garbage')
+    ldap.set_certs(user('u3'), make_cert(1, 10))
+    return ldap
+
+
+def test_find(ldap):
+    index = CertExpiryIndex()
+    index.refresh(ldap, BASE_DN)
+
+    end = NOW + datetime.timedelta(days=30)
+    assert serials(index.find(NOW, end)) == [(1, user('u1')), (1, user('u3'))]
+    assert serials(index.find(None, end)) == [
+        (2, user('u1')), (1, user('u1')), (1, user('u3'))]
+    assert serials(index.find(NOW)) == [
+        (1, user('u1')), (1, user('u3')), (3, user('u2'))]
+    assert index.find(NOW, end, issuer=DN('CN=Other CA')) == []
+    assert index.find(NOW, end, issuer=ISSUER)[0][:3] == (
+        NOW + datetime.timedelta(days=10), ISSUER, 1)
+
+
+def test_incremental_update(ldap, make_cert):
+    index = CertExpiryIndex()
+    index.refresh(ldap, BASE_DN)
+
+    ldap.set_certs(user('u1'), make_cert(4, 20))
+    ldap.set_certs(user('u3'))
+    del ldap.searches[:]
+    index.refresh(ldap, BASE_DN)
+
+    # only the changed entries are read
+    assert ldap.searches == [
+        '(entryusn>=4)', '(&(objectclass=nstombstone)(entryusn>=4))']
+    assert serials(index.find(None)) == [(4, user('u1')), (3, user('u2'))]
+    stats = index.stats()
+    assert stats['full_loads'] == 1
+    assert stats['incremental_loads'] == 1
+    assert stats['certificates'] == 2
+    assert stats['owners'] == 2
+
+
+def test_deleted_and_renamed(ldap, make_cert):
+    index = CertExpiryIndex()
+    index.refresh(ldap, BASE_DN)
+
+    ldap.delete(user('u1'))
+    ldap.rename(user('u3'), user('u4'))
+    ldap.set_certs(user('u5'), make_cert(5, 1))
+    ldap.delete(user('u5'))
+    index.refresh(ldap, BASE_DN)
+
+    assert serials(index.find(None)) == [(1, user('u4')), (3, user('u2'))]
+    stats = index.stats()
+    assert stats['full_loads'] == 1
+    assert stats['owners'] == 2
+
+
+def test_unchanged(ldap):
+    index = CertExpiryIndex()
+    index.refresh(ldap, BASE_DN)
+    index.refresh(ldap, BASE_DN)
+    assert len(ldap.searches) == 1
+
+
+def test_poll_interval(ldap, make_cert):
+    index = CertExpiryIndex(poll_interval=3600)
+    index.refresh(ldap, BASE_DN)
+    ldap.set_certs(user('u4'), make_cert(5, 1))
+    index.refresh(ldap, BASE_DN)
+    assert index.stats()['certificates'] == 4
+
+
+class FakeLDAP2:
+    EXISTENCE_CHECK_CHUNK = 1
+    size_limit = 100
+
+    def __init__(self, index, readable):
+        self.index = index
+        self.readable = readable
+        self.checked = []
+
+    def get_cert_expiry_index(self):
+        return self.index
+
+    def get_existing_dns(self, dns, filter=None):
+        assert filter == '(usercertificate=*)'
+        self.checked.extend(dns)
+        return {dn: dn for dn in dns if dn in self.readable}
+
+
+@pytest.fixture
+def report(ldap):
+    pytest.importorskip('pyhbac')
+    from ipaserver.plugins import cert as cert_plugin
+
+    index = CertExpiryIndex()
+    index.refresh(ldap, BASE_DN)
+    ldap2 = FakeLDAP2(index, readable={user('u1'), user('u2')})
+    api = type('FakeAPI', (), {})()
+    api.Backend = type('Backend', (), {'ldap2': ldap2})()
+    cmd = cert_plugin.cert_expiry_report(api)
+    cmd.add_message = lambda message: None
+    return cmd
+
+
+def test_report_filters_unreadable_owners(report):
+    result = report.execute(days=36500, expired=True)
+    assert [(r['serial_number'], r['owner']) for r in result['result']] == [
+        (2, [user('u1')]), (1, [user('u1')]), (3, [user('u2')])]
+
+
+def test_report_checks_owners_up_to_sizelimit(report):
+    result = report.execute(days=36500, expired=True, sizelimit=1)
+    assert result['count'] == 1
+    assert result['truncated']
+    assert report.api.Backend.ldap2.checked == [user('u1'), user('u1')]
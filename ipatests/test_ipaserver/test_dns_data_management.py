@@ -0,0 +1,219 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the update of the IPA system records in `ipaserver.dns_data_management`
+"""
+
+from collections import OrderedDict
+
+import pytest
+
+from ipalib import errors
+from ipalib.request import context
+from ipapython.dn import DN
+from ipaserver import dns_data_management
+
+pytestmark = pytest.mark.tier0
+
+BASE_DN = DN('dc=ipa,dc=test')
+ZONE_DN = DN(('idnsname', 'ipa.test.'), 'cn=dns', BASE_DN)
+MASTERS_DN = DN('cn=masters,cn=ipa,cn=etc', BASE_DN)
+LOCATIONS_DN = DN('cn=locations,cn=etc', BASE_DN)
+TEMPLATE_ATTR = 'idnsTemplateAttribute;cnamerecord'
+
+
+class FakeResult(list):
+    truncated = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class FakeEntry(dict):
+    def __init__(self, dn, attrs):
+        super(FakeEntry, self).__init__(attrs)
+        self.dn = dn
+
+
+class FakeLDAP:
+    SCOPE_ONELEVEL = 1
+    SCOPE_SUBTREE = 2
+    MATCH_ANY = '|'
+
+    def __init__(self, records):
+        # relative record name -> attributes
+        self.records = records
+        self.signatures = {MASTERS_DN: (1, 10), LOCATIONS_DN: (1, 10)}
+
+    def get_entries_signature(self, filter, base_dn, scope):
+        return self.signatures[base_dn]
+
+    def make_filter_from_attr(self, attr, values, rules):
+        return (attr, list(values))
+
+    def iter_entries(self, filter, attrs_list, base_dn, scope=None,
+                     time_limit=None, size_limit=None):
+        assert base_dn == ZONE_DN
+        _attr, names = filter
+        return FakeResult(
+            FakeEntry(DN(('idnsname', name), ZONE_DN),
+                      dict(self.records[name]))
+            for name in names if name in self.records
+        )
+
+    def handle_truncated_result(self, truncated):
+        assert not truncated
+
+
+class FakeCommands:
+    def __init__(self, records):
+        self.records = records
+        self.weight = u'100'
+        self.server_finds = []
+        self.writes = []
+
+    def server_find(self, **kwargs):
+        self.server_finds.append(context.principal)
+        return dict(result=[dict(
+            cn=[u'master.ipa.test'],
+            ipaserviceweight=[self.weight],
+            enabled_role_servrole=[u'IPA master'],
+        )])
+
+    def location_find(self):
+        return dict(result=[])
+
+    def _set(self, name, options):
+        record = self.records[name]
+        for attr, values in options.items():
+            if attr == 'addattr':
+                record.setdefault('objectclass', []).extend(
+                    v.split('=', 1)[1] for v in values)
+            elif attr == 'setattr':
+                for value in values:
+                    attr, value = value.split('=', 1)
+                    record[attr] = [value]
+            else:
+                record[attr] = list(values)
+
+    def dnsrecord_mod(self, zone, record_name, **options):
+        name = record_name.relativize(zone).ToASCII()
+        if name not in self.records:
+            raise errors.NotFound(reason=u'%s: record not found' % name)
+        self.writes.append(name)
+        self._set(name, options)
+
+    def dnsrecord_add(self, zone, record_name, **options):
+        name = record_name.relativize(zone).ToASCII()
+        self.records[name] = dict(objectclass=[u'top', u'idnsrecord'])
+        self._set(name, options)
+
+
+class FakeAPI:
+    class env:
+        domain = u'ipa.test'
+        realm = u'IPA.TEST'
+        basedn = BASE_DN
+        container_masters = DN('cn=masters,cn=ipa,cn=etc')
+        container_locations = DN('cn=locations,cn=etc')
+
+    def __init__(self):
+        self.records = {}
+        self.Backend = type('Backend', (), {
+            'ldap2': FakeLDAP(self.records)})()
+        self.Command = FakeCommands(self.records)
+        self.Object = type('Object', (), {
+            'dnszone': type('dnszone', (), {
+                'get_dn': staticmethod(lambda zone: ZONE_DN)})()})()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(dns_data_management, '_servers_cache', OrderedDict())
+    monkeypatch.setattr(dns_data_management, '_locations_cache',
+                        OrderedDict())
+    context.principal = u'admin@IPA.TEST'
+    api = FakeAPI()
+    # create the records
+    dns_data_management.IPASystemRecords(api).update_base_records()
+    del api.Command.writes[:]
+    yield api
+    del context.principal
+
+
+def update(api):
+    system_records = dns_data_management.IPASystemRecords(api)
+    success, fail = system_records.update_base_records()
+    assert fail == []
+    return len(success)
+
+
+def test_records_created(api):
+    assert api.records['_ldap._tcp']['srvrecord'] == [
+        u'0 100 389 master.ipa.test.']
+    assert api.records['_ldap._tcp'][TEMPLATE_ATTR] == [
+        u'_ldap._tcp.\\{substitutionvariable_ipalocation\\}._locations']
+    assert api.records['_kerberos']['txtrecord'] == [u'"IPA.TEST"']
+
+
+def test_unchanged_names_are_not_written(api):
+    assert update(api) == 8
+    assert api.Command.writes == []
+
+
+def test_changed_srv_records_are_written(api):
+    api.Command.weight = u'50'
+    api.Backend.ldap2.signatures[MASTERS_DN] = (1, 11)
+    assert update(api) == 8
+    # all SRV records changed, the TXT record did not
+    assert sorted(api.Command.writes) == sorted(
+        name for name in api.records if name != '_kerberos')
+    assert api.records['_ldap._tcp']['srvrecord'] == [
+        u'0 50 389 master.ipa.test.']
+
+
+def test_missing_cname_template_is_written(api):
+    record = api.records['_kerberos._udp']
+    record['objectclass'].remove(u'idnsTemplateObject')
+    del record[TEMPLATE_ATTR]
+    update(api)
+    assert api.Command.writes == ['_kerberos._udp']
+    assert u'idnsTemplateObject' in record['objectclass']
+
+
+def test_extra_srv_record_is_written(api):
+    api.records['_ldap._tcp']['srvrecord'].append(
+        u'0 100 389 old.ipa.test.')
+    update(api)
+    assert api.Command.writes == ['_ldap._tcp']
+
+
+def test_servers_cache_invalidated(api):
+    assert len(api.Command.server_finds) == 1
+    update(api)
+    assert len(api.Command.server_finds) == 1
+
+    # a master entry or one of its service entries changed
+    api.Backend.ldap2.signatures[MASTERS_DN] = (1, 11)
+    update(api)
+    update(api)
+    assert len(api.Command.server_finds) == 2
+
+
+def test_servers_cache_per_principal(api):
+    context.principal = u'dnsadmin@IPA.TEST'
+    update(api)
+    assert api.Command.server_finds == [
+        u'admin@IPA.TEST', u'dnsadmin@IPA.TEST']
+
+
+def test_servers_not_cached_without_entryusn(api):
+    api.Backend.ldap2.signatures[MASTERS_DN] = (1, 0)
+    update(api)
+    update(api)
+    assert len(api.Command.server_finds) == 3
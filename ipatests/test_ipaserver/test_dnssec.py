@@ -4,8 +4,15 @@
 """
 Test the `ipaserver/dnssec` package.
 """
+import os
+
 import dns.name
+import pytest
 
+from ipaplatform.paths import paths
+from ipapython import ipautil
+from ipapython.dn import DN
+from ipaserver.dnssec import bindmgr, keysyncer
 from ipaserver.dnssec.odsmgr import ODSZoneListReader
 
 
@@ -39,3 +46,152 @@ def test_ods_zonelist_reader():
     assert reader.mapping == {uuid: name}
     assert reader.names == {name}
     assert reader.uuids == {uuid}
+
+
+ZONE = dns.name.from_text('ipa.example.')
+BASE_DN = 'cn=dns,dc=ipa,dc=example'
+
+
+class FakeEnv:
+    container_dns = DN('cn=dns')
+    basedn = DN('dc=ipa,dc=example')
+
+
+class FakeAPI:
+    env = FakeEnv()
+
+
+class FakeRunResult:
+    def __init__(self, output):
+        self.output = output
+        self.output_log = output
+
+
+def make_key(ref, sep=b'FALSE'):
+    attrs = ipautil.CIDict(
+        idnsseckeyzone=[b'TRUE'],
+        idnsseckeyref=[ref],
+        idnssecalgorithm=[b'RSASHA256'],
+        idnsseckeysep=[sep],
+    )
+    attrs['dn'] = 'cn=%s,cn=keys,idnsname=ipa.example.,%s' % (
+        ref.decode('ascii'), BASE_DN)
+    return attrs
+
+
+@pytest.fixture
+def commands(tmpdir, monkeypatch):
+    monkeypatch.setattr(paths, 'BIND_LDAP_DNS_ZONE_WORKDIR',
+                        str(tmpdir.mkdir('zones')))
+    monkeypatch.setattr(paths, 'DNSSEC_TOKENS_DIR',
+                        str(tmpdir.mkdir('tokens')))
+    commands = []
+
+    def run(cmd, capture_output=False):
+        commands.append(cmd[0])
+        if cmd[0] != paths.DNSSEC_KEYFROMLABEL:
+            return FakeRunResult('')
+        workdir = cmd[cmd.index('-K') + 1]
+        ref = cmd[cmd.index('-l') + 1].split(b';')[0].decode('ascii')
+        basename = 'Kipa.example.+008+%s' % ref
+        for suffix in ('.key', '.private'):
+            with open(os.path.join(workdir, basename + suffix), 'w') as f:
+                f.write(' '.join(str(c) for c in cmd))
+        return FakeRunResult(basename)
+
+    monkeypatch.setattr(bindmgr.ipautil, 'run', run)
+    return commands
+
+
+def keys_dir():
+    return os.path.join(
+        paths.BIND_LDAP_DNS_ZONE_WORKDIR, 'ipa.example', 'keys')
+
+
+def test_bindmgr_incremental_sync(commands):
+    mgr = bindmgr.BINDMgr(FakeAPI())
+    mgr.ldap_event('add', 'uuid1', make_key(b'1'))
+    mgr.ldap_event('add', 'uuid2', make_key(b'2'))
+    mgr.sync({ZONE})
+    assert commands == [paths.DNSSEC_KEYFROMLABEL] * 2 + ['rndc']
+    assert sorted(os.listdir(keys_dir())) == [
+        'Kipa.example.+008+%s%s' % (ref, suffix)
+        for ref in '12' for suffix in ('.dn', '.key', '.private', '.uuid')
+    ]
+
+    # unchanged key attributes do not regenerate any key
+    del commands[:]
+    mgr.ldap_event('mod', 'uuid1', make_key(b'1'))
+    mgr.sync({ZONE})
+    assert commands == []
+
+    del commands[:]
+    mgr.ldap_event('mod', 'uuid1', make_key(b'1', sep=b'TRUE'))
+    mgr.ldap_event('del', 'uuid2', make_key(b'2'))
+    mgr.sync({ZONE})
+    assert commands == [paths.DNSSEC_KEYFROMLABEL, 'rndc']
+    assert sorted(os.listdir(keys_dir())) == [
+        'Kipa.example.+008+1%s' % suffix
+        for suffix in ('.dn', '.key', '.private', '.uuid')
+    ]
+    with open(os.path.join(keys_dir(), 'Kipa.example.+008+1.key')) as f:
+        assert '-f KSK' in f.read()
+
+
+def test_keysyncer_coalesces_events(monkeypatch):
+    monkeypatch.delenv('ISMASTER', raising=False)
+    steps = []
+    monkeypatch.setattr(keysyncer.ipautil, 'run',
+                        lambda cmd: steps.append('hsm_replica'))
+    syncer = keysyncer.KeySyncer(
+        'ldap://localhost', ipa_api=FakeAPI(), sync_delay=60)
+    monkeypatch.setattr(syncer.bindmgr, 'ldap_event',
+                        lambda op, uuid, attrs: None)
+    monkeypatch.setattr(syncer.bindmgr, 'sync',
+                        lambda zones: steps.append('bind'))
+
+    syncer.syncrepl_refreshdone()
+    assert steps == ['hsm_replica', 'bind']
+
+    del steps[:]
+    attrs = {'objectClass': [b'top', b'idnsSecKey']}
+    for i in range(10):
+        syncer.application_add('uuid%d' % i, 'cn=key%d' % i, attrs)
+    syncer.application_sync('uuid0', 'cn=key0', attrs, attrs)
+    assert syncer.sync_timeout() > 0
+    syncer.run_pending_sync()
+    assert steps == []
+    syncer.run_pending_sync(force=True)
+    assert steps == ['hsm_replica', 'bind']
+    assert syncer.sync_timeout() is None
+
+    # keys are removed from the replica HSM after BIND stopped using them
+    del steps[:]
+    syncer.application_del('uuid1', 'cn=key1', attrs)
+    syncer.application_del('uuid2', 'cn=key2', attrs)
+    syncer.run_pending_sync(force=True)
+    assert steps == ['bind', 'hsm_replica']
+
+    # key rollover, the old key is removed from the replica HSM only after
+    # BIND switched to the new one
+    del steps[:]
+    syncer.application_add('uuid10', 'cn=key10', attrs)
+    syncer.application_del('uuid0', 'cn=key0', attrs)
+    syncer.run_pending_sync(force=True)
+    assert steps == ['hsm_replica', 'bind', 'hsm_replica']
+
+    assert syncer.counters['events'] == 15
+    assert syncer.counters['passes'] == 4
+    assert syncer.counters['bind'] == 4
+
+
+def test_keysyncer_overdue_timeout(monkeypatch):
+    monkeypatch.delenv('ISMASTER', raising=False)
+    syncer = keysyncer.KeySyncer(
+        'ldap://localhost', ipa_api=FakeAPI(), sync_delay=0)
+    syncer.init_done = True
+    syncer.schedule_sync(keysyncer.SYNC_BIND)
+    monkeypatch.setattr(keysyncer.time, 'time',
+                        lambda: syncer.sync_deadline + 1)
+    # a timeout of 0 would make syncrepl_poll() return without results
+    assert syncer.sync_timeout() == keysyncer.MIN_POLL_TIMEOUT
@@ -0,0 +1,375 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the zone file import and export of `ipaserver.plugins.dns`
+"""
+
+import io
+import json
+
+import pytest
+
+from ipalib import errors
+from ipapython.dn import DN
+from ipapython.dnsutil import DNSName
+from ipaserver.plugins import dns as dns_plugin
+
+pytestmark = pytest.mark.tier0
+
+ZONE = DNSName(u'ipa.test.')
+ZONE_DN = DN(('idnsname', u'ipa.test.'), 'cn=dns', 'dc=ipa,dc=test')
+
+ZONE_FILE = u"""\
+$TTL 3600
+@       IN SOA ns1 hostmaster 1 3600 900 604800 3600
+        IN NS  ns1
+ns1     A      192.0.2.1
+www     A      192.0.2.2
+www 300 A      192.0.2.3
+mail    A      192.0.2.4
+bad     A      300.0.0.1
+www     AAAA   2001:db8::1
+"""
+
+
+class FakeDNSRecord:
+    params = {param.name: param for param in dns_plugin._dns_records}
+
+    def check_zone(self, zone):
+        assert zone == ZONE
+        return ZONE_DN
+
+
+class FakeResult(list):
+    truncated = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class FakeEntry(dict):
+    def __init__(self, dn, **attrs):
+        super(FakeEntry, self).__init__(attrs)
+        self.dn = dn
+
+    @property
+    def single_value(self):
+        return {attr: values[0] for attr, values in self.items()}
+
+
+class FakeLDAP:
+    SCOPE_ONELEVEL = 1
+
+    def __init__(self, zone_entry, entries):
+        self.zone_entry = zone_entry
+        self.entries = entries
+        self.searches = []
+
+    def get_entry(self, dn, attrs_list):
+        assert dn == ZONE_DN
+        return self.zone_entry
+
+    def iter_entries(self, filter, attrs_list, base_dn, scope=None,
+                     time_limit=None, size_limit=None):
+        self.searches.append((filter, base_dn, scope, size_limit))
+        return FakeResult(self.entries)
+
+    def handle_truncated_result(self, truncated):
+        assert not truncated
+
+
+class FakeObjects:
+    def __init__(self, backend):
+        self.dnsrecord = FakeDNSRecord()
+        self.dnszone = type('dnszone', (), {'backend': backend})()
+
+    def __getitem__(self, key):
+        return getattr(self, key[0])
+
+
+class FakeAPI:
+    def __init__(self, backend=None):
+        self.Object = FakeObjects(backend)
+
+
+@pytest.fixture
+def importer():
+    cmd = dns_plugin.dnszone_import(FakeAPI())
+    cmd.calls = []
+
+    def get_entries(zone_dn, names):
+        cmd.calls.append(('lookup', [name.ToASCII() for name in names]))
+        return {}
+
+    def import_name(keys, dn, records, ttl, entry):
+        cmd.calls.append(('write', keys[-1].ToASCII(),
+                          [value for _record, _attr, value in records], ttl))
+        return True
+
+    cmd._get_entries = get_entries
+    cmd._import_name = import_name
+    return cmd
+
+
+def _groups(importer, zonefile):
+    stats = dict(records=0, skipped=0)
+    failed = []
+    groups = [
+        (name.ToASCII(), [value for _record, _attr, value in records], ttl)
+        for name, records, ttl in importer._iter_groups(
+            zonefile, ZONE, stats, failed)
+    ]
+    return groups, stats, failed
+
+
+class TestZoneImport:
+    def test_groups(self, importer):
+        groups, stats, failed = _groups(importer, ZONE_FILE)
+        assert groups == [
+            (u'ns1', [u'192.0.2.1'], 3600),
+            (u'www', [u'192.0.2.2', u'192.0.2.3'], 300),
+            (u'mail', [u'192.0.2.4'], 3600),
+            (u'www', [u'2001:db8::1'], 3600),
+        ]
+        assert stats == dict(records=9, skipped=2)
+        assert [f['line'] for f in failed] == [8]
+
+    def test_groups_are_yielded_while_parsing(self, importer):
+        zonefile = io.StringIO(ZONE_FILE)
+        groups = importer._iter_groups(
+            zonefile, ZONE, dict(records=0, skipped=0), [])
+        name, _records, _ttl = next(groups)
+        assert name.ToASCII() == u'ns1'
+        # the parser stopped at the next name
+        assert zonefile.tell() < ZONE_FILE.index(u'mail')
+
+    def test_chunks_merge_names(self, importer):
+        importer.lookup_size = 2
+        chunks = list(importer._iter_chunks([
+            (u'a', [1], None), (u'b', [2], 60), (u'a', [3], 30),
+            (u'c', [4], None), (u'b', [5], None),
+        ]))
+        assert [list(chunk.items()) for chunk in chunks] == [
+            [(u'a', ([1, 3], 30)), (u'b', ([2], 60))],
+            [(u'c', ([4], None)), (u'b', ([5], None))],
+        ]
+
+    def test_written_per_chunk(self, importer):
+        importer.lookup_size = 2
+        result = importer.execute(ZONE, zonefile=ZONE_FILE)
+        assert importer.calls == [
+            ('lookup', [u'ns1', u'www']),
+            ('write', u'ns1', [u'192.0.2.1'], 3600),
+            ('write', u'www', [u'192.0.2.2', u'192.0.2.3'], 300),
+            ('lookup', [u'mail', u'www']),
+            ('write', u'mail', [u'192.0.2.4'], 3600),
+            ('write', u'www', [u'2001:db8::1'], 3600),
+        ]
+        stats = result['result']
+        assert (stats['records'], stats['names'], stats['imported'],
+                stats['skipped'], stats['failed']) == (9, 4, 5, 2, 1)
+        assert [f['line'] for f in result['failed']] == [8]
+
+
+class FakeZoneLDAP:
+    """Zone entries kept in a dict, for the import of records"""
+    MATCH_ANY = '|'
+    SCOPE_ONELEVEL = 1
+
+    def __init__(self, *entries):
+        self.entries = {entry.dn: entry for entry in entries}
+        self.writes = []
+
+    def get_entry(self, dn, attrs_list):
+        try:
+            return self.entries[dn]
+        except KeyError:
+            raise errors.NotFound(reason=u'%s: entry not found' % dn)
+
+    def make_filter_from_attr(self, attr, values, rules):
+        return (attr, list(values))
+
+    def get_entries(self, base_dn, scope, filter, attrs_list):
+        _attr, names = filter
+        result = [entry for dn, entry in self.entries.items()
+                  if dn[1:] == base_dn and dn[0].value in names]
+        if not result:
+            raise errors.NotFound(reason=u'no such entry')
+        return result
+
+    def make_entry(self, dn, **attrs):
+        return FakeEntry(dn, **attrs)
+
+    def add_entry(self, entry):
+        self.writes.append(('add', entry.dn[0].value))
+        self.entries[entry.dn] = entry
+
+    def update_entry(self, entry):
+        self.writes.append(('update', entry.dn[0].value))
+
+
+def zone_import(*entries):
+    """dnszone_import with the real dnsrecord checks and a fake backend"""
+    ldap = FakeZoneLDAP(FakeEntry(
+        ZONE_DN, objectclass=[u'top', u'idnszone'], idnsname=[ZONE],
+        nsrecord=[u'ns1.ipa.test.']), *entries)
+    api = FakeAPI(ldap)
+    api.Backend = type('Backend', (), {'ldap2': ldap})()
+    record_obj = dns_plugin.dnsrecord(api)
+    record_obj.params = FakeDNSRecord.params
+    record_obj.check_zone = FakeDNSRecord().check_zone
+    api.Object.dnsrecord = record_obj
+    return dns_plugin.dnszone_import(api), ldap
+
+
+def _failed_lines(result):
+    return [(f['line'], f['error']) for f in result['failed']]
+
+
+class TestZoneImportWrite:
+    def test_zonefile_with_newline_is_valid(self):
+        param, = [p for p in dns_plugin.dnszone_import.takes_options
+                  if p.name == 'zonefile']
+        param.validate(ZONE_FILE)
+        assert ZONE_FILE.endswith(u'\n')
+
+    def test_new_entry(self):
+        cmd, ldap = zone_import()
+        result = cmd.execute(
+            ZONE, zonefile=u'new 300 A 192.0.2.5\nnew 600 A 192.0.2.6\n')
+        assert ldap.writes == [('add', u'new')]
+        entry = ldap.entries[DN(('idnsname', u'new'), ZONE_DN)]
+        assert entry['objectclass'] == [u'top', u'idnsrecord']
+        assert entry['idnsname'] == [DNSName(u'new')]
+        assert entry['arecord'] == [u'192.0.2.5', u'192.0.2.6']
+        # the lowest TTL of the records is used
+        assert entry['dnsttl'] == [300]
+        assert result['result']['added'] == 1
+
+    def test_merge_into_existing_entry(self):
+        cmd, ldap = zone_import(record_entry(
+            u'www', dnsttl=[u'3600'], arecord=[u'192.0.2.2'],
+            aaaarecord=[u'2001:db8::1']))
+        result = cmd.execute(
+            ZONE, zonefile=u'www 300 A 192.0.2.2\nwww A 192.0.2.9\n')
+        assert ldap.writes == [('update', u'www')]
+        entry = ldap.entries[DN(('idnsname', u'www'), ZONE_DN)]
+        assert entry['arecord'] == [u'192.0.2.2', u'192.0.2.9']
+        assert entry['aaaarecord'] == [u'2001:db8::1']
+        # the TTL of existing entries is kept
+        assert entry['dnsttl'] == [u'3600']
+        stats = result['result']
+        assert (stats['added'], stats['updated'], stats['imported']) == (
+            0, 1, 2)
+
+    def test_collision_with_existing_record(self):
+        cmd, ldap = zone_import(record_entry(
+            u'alias', cnamerecord=[u'www']))
+        result = cmd.execute(
+            ZONE, zonefile=u'alias A 192.0.2.5\nok A 192.0.2.6\n')
+        assert ldap.writes == [('add', u'ok')]
+        line, error = _failed_lines(result)[0]
+        assert line == 1
+        assert u'CNAME record is not allowed to coexist' in error
+        assert result['result']['imported'] == 1
+
+    def test_missing_dependency(self):
+        cmd, ldap = zone_import()
+        result = cmd.execute(ZONE, zonefile=(
+            u'sub DS 60485 5 1 2BB183AF5F22588179A53B0A98631FAD1A292118\n'))
+        assert ldap.writes == []
+        line, error = _failed_lines(result)[0]
+        assert line == 1
+        assert u'DS record requires to coexist with an NS record' in error
+
+    def test_apex(self):
+        cmd, ldap = zone_import()
+        result = cmd.execute(ZONE, zonefile=(
+            u'@ IN SOA ns1 hostmaster 1 3600 900 604800 3600\n'
+            u'@ NS ns2\n'
+            u'@ MX 10 mail\n'))
+        # SOA and NS of the apex are managed by IPA
+        assert ldap.writes == [('update', u'ipa.test.')]
+        zone_entry = ldap.entries[ZONE_DN]
+        assert zone_entry['nsrecord'] == [u'ns1.ipa.test.']
+        assert zone_entry['mxrecord'] == [u'10 mail.ipa.test.']
+        stats = result['result']
+        assert (stats['skipped'], stats['updated'], stats['imported']) == (
+            2, 1, 1)
+
+
+def record_entry(name, **attrs):
+    return FakeEntry(
+        DN(('idnsname', name), ZONE_DN), idnsname=[DNSName(name)], **attrs)
+
+
+@pytest.fixture
+def exporter():
+    zone_entry = FakeEntry(
+        ZONE_DN,
+        dnsdefaultttl=[u'3600'],
+        idnssoamname=[u'ns1.ipa.test.'],
+        idnssoarname=[u'hostmaster.ipa.test.'],
+        idnssoaserial=[u'2018060101'],
+        idnssoarefresh=[u'3600'],
+        idnssoaretry=[u'900'],
+        idnssoaexpire=[u'1209600'],
+        idnssoaminimum=[u'3600'],
+        nsrecord=[u'ns1.ipa.test.'],
+    )
+    ldap = FakeLDAP(zone_entry, [
+        record_entry(u'ns1', arecord=[u'192.0.2.1']),
+        record_entry(u'www', dnsttl=[u'300'],
+                     arecord=[u'192.0.2.2', u'192.0.2.3'],
+                     aaaarecord=[u'2001:db8::1']),
+    ])
+    return dns_plugin.dnszone_export(FakeAPI(ldap))
+
+
+class TestZoneExport:
+    def test_zone(self, exporter):
+        result = exporter.execute(ZONE, format=u'zone')
+        assert list(result['result']) == [
+            u'$ORIGIN ipa.test.',
+            u'$TTL 3600',
+            u'@ IN SOA ns1.ipa.test. hostmaster.ipa.test. 2018060101 3600 '
+            u'900 1209600 3600',
+            u'@ IN NS ns1.ipa.test.',
+            u'ns1 IN A 192.0.2.1',
+            u'www 300 IN A 192.0.2.2',
+            u'www 300 IN A 192.0.2.3',
+            u'www 300 IN AAAA 2001:db8::1',
+        ]
+        assert 'count' not in result
+
+    def test_jsonl(self, exporter):
+        result = exporter.execute(ZONE, format=u'jsonl')
+        records = [json.loads(line) for line in result['result']]
+        assert records[0] == dict(
+            name=u'@', ttl=None, type=u'SOA',
+            data=u'ns1.ipa.test. hostmaster.ipa.test. 2018060101 3600 '
+                 u'900 1209600 3600')
+        assert records[-1] == dict(
+            name=u'www', ttl=300, type=u'AAAA', data=u'2001:db8::1')
+        assert len(records) == 6
+
+    def test_paged_read(self, exporter):
+        result = exporter.execute(ZONE, format=u'zone')
+        ldap = exporter.obj.backend
+        # the records are read while the result is consumed
+        assert ldap.searches == []
+        list(result['result'])
+        # one paged one-level search, without size limit
+        assert ldap.searches == [
+            ('(objectclass=idnsrecord)', ZONE_DN, ldap.SCOPE_ONELEVEL, -1)]
+
+    def test_records_read_lazily(self, exporter):
+        records = exporter._iter_records(exporter.obj.backend.zone_entry)
+        assert next(records)[2] == u'SOA'
+        assert next(records)[2] == u'NS'
+        assert exporter.obj.backend.searches == []
@@ -0,0 +1,159 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the concurrent requests of the `ipaserver.plugins.dogtag` RA backend
+"""
+
+import threading
+import time
+
+import pytest
+
+from ipalib import api, errors
+from ipapython import dogtag
+
+if api.env.ra_plugin != 'dogtag':
+    pytest.skip('dogtag is not the RA plugin', allow_module_level=True)
+
+# pylint: disable=wrong-import-position
+from ipaserver.plugins import dogtag as dogtag_plugin
+
+pytestmark = pytest.mark.tier0
+
+
+class FakeCA:
+    """Answer requests from several threads, the later ones first"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.requested = []
+
+    def __call__(self, serial_number):
+        with self.lock:
+            self.threads.add(threading.current_thread().name)
+            self.requested.append(serial_number)
+        time.sleep(0.01 * (10 - int(serial_number) % 10))
+        if serial_number in self.fail:
+            raise errors.CertificateOperationError(
+                error=u'Certificate ID %s not found' % serial_number)
+        return dict(certificate=u'cert%s' % serial_number,
+                    serial_number=serial_number)
+
+
+def make_ra(pool_size, get_certificate=None, request_certificate=None):
+    ra = object.__new__(dogtag_plugin.ra)
+    ra._pool = dogtag.HTTPConnectionPool(max_size=pool_size)
+    ra._ca_host = u'ca.ipa.test'
+    ra.get_certificate = get_certificate
+    ra.request_certificate = request_certificate
+    return ra
+
+
+SERIALS = [u'%d' % i for i in range(1, 10)]
+
+
+def test_get_certificates_keeps_order():
+    ca = FakeCA()
+    ra = make_ra(4, ca)
+    result = ra.get_certificates(iter(SERIALS))
+    assert [r['serial_number'] for r in result] == SERIALS
+    assert sorted(ca.requested) == SERIALS
+    # the requests were spread over the threads
+    assert 1 < len(ca.threads) <= 4
+
+
+def test_get_certificates_without_pool():
+    ca = FakeCA()
+    ra = make_ra(0, ca)
+    result = ra.get_certificates(SERIALS)
+    assert [r['serial_number'] for r in result] == SERIALS
+    assert ca.requested == SERIALS
+    assert ca.threads == {threading.current_thread().name}
+
+
+@pytest.mark.parametrize('pool_size', [0, 4])
+def test_get_certificates_failure(pool_size):
+    ca = FakeCA(fail=[u'5'])
+    ra = make_ra(pool_size, ca)
+    with pytest.raises(errors.CertificateOperationError) as e:
+        ra.get_certificates(SERIALS)
+    assert u'Certificate ID 5 not found' in str(e.value)
+
+
+@pytest.mark.parametrize('pool_size', [0, 4])
+def test_request_certificates(pool_size):
+    ca = FakeCA(fail=[u'3', u'7'])
+
+    def request_certificate(csr, profile_id, ca_id):
+        assert (profile_id, ca_id) == (u'caIPAserviceCert', u'ipa-id')
+        return ca(csr)
+
+    ra = make_ra(pool_size, request_certificate=request_certificate)
+    result = ra.request_certificates(
+        (sn, u'caIPAserviceCert', u'ipa-id') for sn in SERIALS)
+
+    # failures are returned in place of the result, not raised
+    assert [
+        type(r).__name__ if isinstance(r, Exception) else r['serial_number']
+        for r in result
+    ] == [u'1', u'2', 'CertificateOperationError', u'4', u'5', u'6',
+          'CertificateOperationError', u'8', u'9']
+    assert sorted(ca.requested) == SERIALS
+
+
+class FakeRestAPI:
+    class env:
+        tls_ca_cert = '/etc/ipa/ca.crt'
+        in_tree = False
+        context = 'cli'
+        ca_agent_port = 8443
+
+    Backend = type('Backend', (), {'ldap2': None})()
+
+
+def test_rest_session_per_thread(monkeypatch):
+    logins = []
+    used = []
+
+    def https_request(host, port, url, **kwargs):
+        if url.endswith('/account/login'):
+            logins.append(url)
+            return 200, {'set-cookie': 'JSESSIONID=%d' % len(logins)}, b''
+        if not url.endswith('/account/logout'):
+            used.append(kwargs['headers']['Cookie'])
+        return 200, {}, b''
+
+    monkeypatch.setattr(dogtag, 'https_request', https_request)
+    monkeypatch.setattr(dogtag_plugin, 'host_has_service',
+                        lambda host, ldap2, service: True)
+    client = dogtag_plugin.ra_certprofile(FakeRestAPI())
+    barrier = threading.Barrier(2, timeout=10)
+    failures = []
+
+    def run():
+        try:
+            with client as profile_api:
+                assert profile_api is client
+                # both threads are logged in
+                barrier.wait()
+                client._ssldo('GET', 'caIPAserviceCert')
+                # neither thread logged out before the other one is done
+                barrier.wait()
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=run) for _i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    assert len(logins) == 2
+    # every thread used the cookie of its own session
+    assert len(set(used)) == 2
+    assert client.cookie is None
@@ -0,0 +1,197 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the bulk update of group members in `ipaserver.plugins.ldap2`
+"""
+
+import re
+
+import ldap
+import pytest
+
+from ipalib import errors
+from ipapython import ipaldap
+from ipapython.dn import DN
+from ipaserver.plugins.baseldap import LDAPModMember
+from ipaserver.plugins.ldap2 import ldap2
+
+pytestmark = pytest.mark.tier0
+
+BASE_DN = DN('dc=ipa,dc=test')
+USERS = DN('cn=users,cn=accounts', BASE_DN)
+GROUPS = DN('cn=groups,cn=accounts', BASE_DN)
+
+
+def user(uid):
+    return DN(('uid', uid), USERS)
+
+
+def group(cn):
+    return DN(('cn', cn), GROUPS)
+
+
+class FakeConnection:
+    def __init__(self, directory):
+        self.directory = directory
+        self.modifications = []
+
+    def modify_s(self, dn, modlist):
+        self.modifications.append(dn)
+        members = self.directory[DN(dn)]
+        for op, attr, values in modlist:
+            assert attr == 'member'
+            values = [DN(v.decode('utf-8')) for v in values]
+            if op == ldap.MOD_ADD:
+                if any(v in members for v in values):
+                    raise ldap.TYPE_OR_VALUE_EXISTS({'desc': 'exists'})
+                members.extend(values)
+            elif op == ldap.MOD_DELETE:
+                if any(v not in members for v in values):
+                    raise ldap.NO_SUCH_ATTRIBUTE({'desc': 'no such value'})
+                for v in values:
+                    members.remove(v)
+
+
+class FakeLDAP2(ldap2):
+    # pylint: disable=super-init-not-called
+    def __init__(self):
+        # group DN -> list of member DNs
+        self.directory = {
+            user('u1'): None,
+            user('u2'): None,
+            user('u3'): None,
+            group('g1'): [user('u2')],
+        }
+        ipaldap.LDAPClient.__init__(self, None, no_schema=True)
+        self.searches = []
+
+    def _connect(self):
+        return FakeConnection(self.directory)
+
+    @property
+    def conn(self):
+        return self._conn
+
+    def get_entry(self, dn, attrs_list=None, **kwargs):
+        if dn not in self.directory:
+            raise errors.NotFound(reason=u'%s: entry not found' % dn)
+        return ipaldap.LDAPEntry(self, dn)
+
+    def find_entries(self, filter=None, attrs_list=None, base_dn=None,
+                     scope=None, **kwargs):
+        self.searches.append(filter)
+        values = re.findall(r'\((\w+)=([^()]*)\)', filter)
+        entries = [
+            ipaldap.LDAPEntry(self, dn)
+            for dn in sorted(self.directory)
+            if dn[1:] == base_dn and
+            (dn[0].attr.lower(), dn[0].value) in values
+        ]
+        if not entries:
+            raise errors.NotFound(reason=u'no such entry')
+        return entries, False
+
+
+@pytest.fixture
+def ldap2_backend():
+    return FakeLDAP2()
+
+
+def _errors(errs):
+    return [(dn, type(e)) for dn, e in errs]
+
+
+def test_get_existing_dns(ldap2_backend):
+    dns = [user('u1'), user('ghost'), group('g1'), user('u3')]
+    assert ldap2_backend.get_existing_dns(dns) == {
+        user('u1'): user('u1'),
+        group('g1'): group('g1'),
+        user('u3'): user('u3'),
+    }
+    # one search per container and RDN attribute
+    assert len(ldap2_backend.searches) == 2
+
+
+def test_get_existing_dns_chunks(ldap2_backend):
+    ldap2_backend.EXISTENCE_CHECK_CHUNK = 2
+    dns = [user('u1'), user('u2'), user('u3')]
+    assert sorted(ldap2_backend.get_existing_dns(dns)) == sorted(dns)
+    assert len(ldap2_backend.searches) == 2
+
+
+def test_add_new_members(ldap2_backend):
+    before = ipaldap.ldap_operation_duration.get(operation='modify')[0]
+    errs = ldap2_backend.add_entries_to_group(
+        [user('u1'), user('u3')], group('g1'))
+
+    assert errs == []
+    assert ldap2_backend.directory[group('g1')] == [
+        user('u2'), user('u1'), user('u3')]
+    # a single modify, recorded in the LDAP operation metric
+    assert len(ldap2_backend.conn.modifications) == 1
+    after = ipaldap.ldap_operation_duration.get(operation='modify')[0]
+    assert after == before + 1
+
+
+def test_add_members_with_failures(ldap2_backend):
+    dns = [user('u1'), user('u2'), user('ghost'), group('g1')]
+    errs = ldap2_backend.add_entries_to_group(dns, group('g1'))
+
+    assert _errors(errs) == [
+        (user('u2'), errors.AlreadyGroupMember),
+        (user('ghost'), errors.NotFound),
+        (group('g1'), errors.SameGroupError),
+    ]
+    assert ldap2_backend.directory[group('g1')] == [user('u2'), user('u1')]
+    # the failed bulk modify, then one modify per member
+    assert len(ldap2_backend.conn.modifications) == 3
+
+
+def test_add_same_group_allowed(ldap2_backend):
+    errs = ldap2_backend.add_entries_to_group(
+        [group('g1')], group('g1'), allow_same=True)
+    assert errs == []
+    assert group('g1') in ldap2_backend.directory[group('g1')]
+
+
+def test_remove_members(ldap2_backend):
+    ldap2_backend.directory[group('g1')].append(user('u1'))
+    errs = ldap2_backend.remove_entries_from_group(
+        [user('u1'), user('u2')], group('g1'))
+
+    assert errs == []
+    assert ldap2_backend.directory[group('g1')] == []
+    assert len(ldap2_backend.conn.modifications) == 1
+
+
+def test_remove_members_with_failures(ldap2_backend):
+    dns = [user('u2'), user('u3'), user('ghost')]
+    errs = ldap2_backend.remove_entries_from_group(dns, group('g1'))
+
+    assert _errors(errs) == [
+        (user('u3'), errors.NotGroupMember),
+        (user('ghost'), errors.NotGroupMember),
+    ]
+    assert ldap2_backend.directory[group('g1')] == []
+    assert len(ldap2_backend.conn.modifications) == 4
+
+
+def test_remove_no_members(ldap2_backend):
+    assert ldap2_backend.remove_entries_from_group([], group('g1')) == []
+    assert ldap2_backend.conn.modifications == []
+
+
+def test_collect_member_dns():
+    cmd = object.__new__(LDAPModMember)
+    m_dns, obj_names = cmd._collect_member_dns({
+        'user': [user('u1'), DN(), user('u2')],
+        'group': [group('g1')],
+    })
+    assert m_dns == [user('u1'), user('u2'), group('g1')]
+    assert obj_names == {
+        user('u1'): 'user',
+        user('u2'): 'user',
+        group('g1'): 'group',
+    }
@@ -0,0 +1,188 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the HBAC rule cache and hbactest_bulk of `ipaserver.plugins.hbactest`
+"""
+
+import collections
+
+import pytest
+
+from ipalib import errors
+from ipalib.request import context
+from ipapython.dn import DN
+
+pytest.importorskip('pyhbac')
+
+# pylint: disable=wrong-import-position
+from ipaserver.plugins import hbactest as hbactest_plugin
+
+pytestmark = pytest.mark.tier0
+
+RULES = [
+    {'cn': [u'allow_u1'], 'ipaenabledflag': [True],
+     'memberuser_user': [u'u1'], 'hostcategory': [u'all'],
+     'servicecategory': [u'all']},
+    {'cn': [u'allow_admins_sshd'], 'ipaenabledflag': [True],
+     'memberuser_group': [u'admins'], 'hostcategory': [u'all'],
+     'memberservice_hbacsvc': [u'sshd']},
+    {'cn': [u'disabled'], 'ipaenabledflag': [False],
+     'usercategory': [u'all'], 'hostcategory': [u'all'],
+     'servicecategory': [u'all']},
+]
+
+USER_GROUPS = {
+    u'u1': [u'ipausers'],
+    u'u2': [u'admins', u'ipausers'],
+}
+
+
+class FakeLDAP2:
+    size_limit = 100
+
+    def __init__(self):
+        self.signature = (len(RULES), 1)
+
+    def get_entries_signature(self, filter, base_dn):
+        return self.signature
+
+    def get_membership_graph(self):
+        return None
+
+
+class FakeCommands:
+    def __init__(self):
+        self.finds = []
+
+    def hbacrule_find(self, sizelimit=None, no_members=True):
+        self.finds.append((context.principal, sizelimit))
+        rules = RULES[:sizelimit] if sizelimit else RULES
+        return dict(result=[dict(rule) for rule in rules])
+
+    def hbacrule_show(self, cn):
+        for rule in RULES:
+            if rule['cn'][0] == cn:
+                return dict(result=dict(rule))
+        raise errors.NotFound(reason=u'%s: HBAC rule not found' % cn)
+
+    def user_show(self, uid):
+        return dict(result=dict(memberof_group=USER_GROUPS[uid]))
+
+    def host_show(self, fqdn):
+        return dict(result=dict(memberof_hostgroup=[]))
+
+    def hbacsvc_show(self, cn):
+        return dict(result=dict())
+
+
+class FakeAPI:
+    class env:
+        domain = u'ipa.test'
+        basedn = DN('dc=ipa,dc=test')
+        container_hbac = DN('cn=hbac')
+
+    def __init__(self):
+        self.Backend = type('Backend', (), {'ldap2': FakeLDAP2()})()
+        self.Command = FakeCommands()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(hbactest_plugin, '_rule_cache',
+                        collections.OrderedDict())
+    monkeypatch.setattr(hbactest_plugin, '_dcerpc_bindings_installed',
+                        False, raising=False)
+    context.principal = u'admin@IPA.TEST'
+    yield FakeAPI()
+    del context.principal
+
+
+def _names(rules):
+    return [ipa_rule.name for _rule, ipa_rule in rules]
+
+
+class TestRuleCache:
+    def test_cached_until_rules_change(self, api):
+        cmd = hbactest_plugin.hbactest(api)
+        first = cmd._find_rules(None)
+        assert cmd._find_rules(None) is first
+        assert len(api.Command.finds) == 1
+
+        api.Backend.ldap2.signature = (len(RULES), 2)
+        assert cmd._find_rules(None) is not first
+        assert len(api.Command.finds) == 2
+
+    def test_per_principal(self, api):
+        cmd = hbactest_plugin.hbactest(api)
+        admin_rules = cmd._find_rules(None)
+        context.principal = u'u1@IPA.TEST'
+        assert cmd._find_rules(None) is not admin_rules
+        assert api.Command.finds == [
+            (u'admin@IPA.TEST', 0), (u'u1@IPA.TEST', 0)]
+
+    def test_sizelimit_applied_to_cached_rules(self, api):
+        cmd = hbactest_plugin.hbactest(api)
+        assert _names(cmd._find_rules(1)) == [u'allow_u1']
+        assert len(cmd._find_rules(0)) == len(RULES)
+        api.Backend.ldap2.size_limit = 2
+        assert len(cmd._find_rules(None)) == 2
+        # all rules are read once, regardless of the sizelimit
+        assert api.Command.finds == [(u'admin@IPA.TEST', 0)]
+        assert list(hbactest_plugin._rule_cache) == [u'admin@IPA.TEST']
+
+    def test_size_is_capped(self, api, monkeypatch):
+        monkeypatch.setattr(hbactest_plugin, 'RULE_CACHE_SIZE', 2)
+        cmd = hbactest_plugin.hbactest(api)
+        for principal in (u'u1@IPA.TEST', u'u2@IPA.TEST', u'u1@IPA.TEST',
+                          u'u3@IPA.TEST'):
+            context.principal = principal
+            cmd._find_rules(None)
+        # u2 was the least recently used principal
+        assert list(hbactest_plugin._rule_cache) == [
+            u'u1@IPA.TEST', u'u3@IPA.TEST']
+        assert len(api.Command.finds) == 3
+
+
+class TestHBACTestBulk:
+    def _execute(self, api, **options):
+        cmd = hbactest_plugin.hbactest_bulk(api)
+        options.setdefault('nodetail', False)
+        options.setdefault('enabled', False)
+        options.setdefault('disabled', False)
+        return cmd.execute(**options)
+
+    def test_combinations(self, api):
+        result = self._execute(
+            api, user=[u'u1', u'u2'], targethost=[u'web'],
+            service=[u'sshd', u'ftp'])
+
+        assert result['count'] == 4
+        assert result['summary'] == u'3 of 4 access requests granted'
+        assert [(r['user'], r['targethost'], r['service'], r['value'])
+                for r in result['result']] == [
+            (u'u1', u'web.ipa.test', u'sshd', True),
+            (u'u1', u'web.ipa.test', u'ftp', True),
+            (u'u2', u'web.ipa.test', u'sshd', True),
+            (u'u2', u'web.ipa.test', u'ftp', False),
+        ]
+        assert result['result'][2]['matched'] == [u'allow_admins_sshd']
+        assert result['result'][3]['notmatched'] == [
+            u'allow_u1', u'allow_admins_sshd']
+        # the rules are read once for all combinations
+        assert len(api.Command.finds) == 1
+
+    def test_explicit_rules(self, api):
+        result = self._execute(
+            api, user=[u'u2'], targethost=[u'web'], service=[u'ftp'],
+            rules=[u'disabled'])
+        assert result['result'][0]['value'] is True
+        assert result['result'][0]['matched'] == [u'disabled']
+        assert api.Command.finds == []
+
+    def test_unresolved_rules(self, api):
+        with pytest.raises(errors.NotFound):
+            self._execute(
+                api, user=[u'u1'], targethost=[u'web'], service=[u'sshd'],
+                rules=[u'allow_u1', u'missing'])
@@ -0,0 +1,197 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the batched resolution of indirect membership in
+`ipaserver.plugins.baseldap.LDAPObject`.
+"""
+
+import re
+
+import pytest
+from ldap.controls.libldap import MatchedValuesControl
+
+from ipapython import ipaldap
+from ipapython.dn import DN
+from ipaserver.plugins import baseldap
+
+pytestmark = pytest.mark.tier0
+
+BASE_DN = DN('dc=ipa,dc=test')
+
+
+def user(uid):
+    return DN(('uid', uid), 'cn=users,cn=accounts', BASE_DN)
+
+
+def group(cn):
+    return DN(('cn', cn), 'cn=groups,cn=accounts', BASE_DN)
+
+
+def rule(cn):
+    return DN(('cn', cn), 'cn=hbac', BASE_DN)
+
+
+# g1 > g2 > g3, u1 is a direct member of g1 and g3, u2 of g2 and r1
+DIRECTORY = {
+    user('u1'): {'memberof': [group('g1'), group('g2'), group('g3')]},
+    user('u2'): {'memberof': [group('g1'), group('g2'), rule('r1')]},
+    group('g1'): {'member': [user('u1'), group('g2')]},
+    group('g2'): {'member': [user('u2'), group('g3')],
+                  'memberof': [group('g1')]},
+    group('g3'): {'member': [user('u1')],
+                  'memberof': [group('g1'), group('g2')]},
+    rule('r1'): {'memberuser': [user('u2')]},
+}
+
+
+def _parse(flt, i=0):
+    assert flt[i] == '('
+    if flt[i + 1] in '&|':
+        op, children, i = flt[i + 1], [], i + 2
+        while flt[i] == '(':
+            child, i = _parse(flt, i)
+            children.append(child)
+        return (op, children), i + 1
+    end = flt.index(')', i)
+    attr, value = flt[i + 1:end].split('=', 1)
+    return ('=', attr.lower(), value), end + 1
+
+
+def _match(node, attrs):
+    if node[0] == '&':
+        return all(_match(child, attrs) for child in node[1])
+    if node[0] == '|':
+        return any(_match(child, attrs) for child in node[1])
+    _op, attr, value = node
+    if value == '*':
+        return attr in attrs
+    return DN(value) in attrs.get(attr, [])
+
+
+class FakeResult(list):
+    truncated = False
+
+
+class FakeLDAP(ipaldap.LDAPClient):
+    def __init__(self):
+        super(FakeLDAP, self).__init__('ldap://ipa.test', no_schema=True)
+        self.searches = []
+        self.values_returned = 0
+
+    def make_entry(self, dn, attrs, attrs_list=None, values_filter=None):
+        entry = ipaldap.LDAPEntry(self, dn)
+        for attr, values in attrs.items():
+            if attrs_list is None or attr in attrs_list:
+                if values_filter is not None:
+                    values = [v for v in values
+                              if (attr, str(v)) in values_filter]
+                entry.raw[attr] = [str(v).encode('utf-8') for v in values]
+                self.values_returned += len(values)
+        return entry
+
+    def iter_entries(self, filter, attrs_list, base_dn, size_limit=None,
+                     server_controls=None):
+        self.searches.append(filter)
+        node, _end = _parse(filter)
+        values_filter = None
+        for ctrl in server_controls or []:
+            if isinstance(ctrl, MatchedValuesControl):
+                values_filter = {
+                    (attr.lower(), str(DN(value))) for attr, value in
+                    re.findall(r'\((\w+)=([^()]*)\)', ctrl.filterstr)
+                }
+        return FakeResult(
+            self.make_entry(dn, attrs, attrs_list, values_filter)
+            for dn, attrs in sorted(DIRECTORY.items())
+            if _match(node, attrs))
+
+
+class FakeAPI:
+    class env:
+        basedn = BASE_DN
+
+
+class FakeObject(baseldap.LDAPObject):
+    api = FakeAPI
+    backend = FakeLDAP()
+
+
+@pytest.fixture
+def obj():
+    obj = object.__new__(FakeObject)
+    del obj.backend.searches[:]
+    obj.backend.values_returned = 0
+    return obj
+
+
+def _entries(obj):
+    return [obj.backend.make_entry(dn, attrs)
+            for dn, attrs in sorted(DIRECTORY.items())]
+
+
+def _membership(entries):
+    return {
+        entry.dn: {attr: sorted(entry.raw.get(attr, []))
+                   for attr in ('member', 'memberof', 'memberindirect',
+                                'memberofindirect')}
+        for entry in entries
+    }
+
+
+ATTRS = ['member', 'memberof', 'memberindirect', 'memberofindirect']
+
+
+@pytest.mark.parametrize('chunk', [100, 1])
+def test_batch_matches_per_entry(obj, chunk):
+    expected = _entries(obj)
+    for entry in expected:
+        obj.get_indirect_members(entry, ATTRS)
+    per_entry_searches = len(obj.backend.searches)
+
+    del obj.backend.searches[:]
+    entries = _entries(obj)
+    obj.indirect_members_chunk = chunk
+    obj.get_indirect_members_batch(entries, ATTRS)
+
+    assert _membership(entries) == _membership(expected)
+    if chunk > len(entries):
+        assert len(obj.backend.searches) == 2
+    else:
+        assert len(obj.backend.searches) == per_entry_searches
+
+
+def test_batch_result(obj):
+    entries = {e.dn: e for e in _entries(obj)}
+    obj.get_indirect_members_batch(list(entries.values()), ATTRS)
+
+    u1 = entries[user('u1')].raw
+    assert sorted(u1['memberof']) == sorted(
+        str(g).encode('utf-8') for g in (group('g1'), group('g3')))
+    assert u1['memberofindirect'] == [str(group('g2')).encode('utf-8')]
+
+    g1 = entries[group('g1')].raw
+    assert sorted(g1['memberindirect']) == sorted(
+        str(dn).encode('utf-8') for dn in (user('u2'), group('g3')))
+
+
+def test_batch_returns_only_chunk_members(obj, monkeypatch):
+    # u1 is a member of a large group, the members of the large group are
+    # not returned with each chunk
+    others = [user('other%d' % i) for i in range(500)]
+    monkeypatch.setitem(DIRECTORY, group('big'),
+                        {'member': others + [user('u1')]})
+    monkeypatch.setitem(DIRECTORY, user('u1'), {
+        'memberof': [group('g1'), group('g2'), group('g3'), group('big')]})
+
+    entry = obj.backend.make_entry(user('u1'), DIRECTORY[user('u1')])
+    obj.backend.values_returned = 0
+    obj.get_indirect_members_batch([entry], ['memberofindirect'])
+
+    assert sorted(entry.raw['memberof']) == sorted(
+        str(g).encode('utf-8') for g in (group('big'), group('g1'),
+                                         group('g3')))
+    assert entry.raw['memberofindirect'] == [str(group('g2')).encode('utf-8')]
+    # g1, g3 and big, one value each
+    assert obj.backend.values_returned == 3
@@ -0,0 +1,116 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the per-worker LDAP connection pool
+"""
+
+from __future__ import absolute_import
+
+import time
+
+import pytest
+
+from ipaserver.ldap_pool import LDAPConnectionPool
+
+pytestmark = pytest.mark.tier0
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.unbound = False
+
+    def whoami_s(self):
+        if not self.alive:
+            raise RuntimeError('server down')
+        return 'dn: uid=admin'
+
+    def unbind_s(self):
+        self.unbound = True
+
+
+KEY = (u'admin@IPA.TEST', 'FILE:/tmp/krb5cc_admin')
+
+
+def far_future():
+    return time.time() + 3600
+
+
+class TestLDAPConnectionPool:
+    def test_reuse(self):
+        pool = LDAPConnectionPool(max_size=2)
+        assert pool.checkout(KEY) is None
+
+        conn = FakeConnection()
+        pool.add(KEY, conn, far_future())
+        assert pool.release(conn)
+        assert pool.checkout(KEY) is conn
+        assert pool.checkout(KEY) is None
+
+        stats = pool.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 2
+        assert stats['in_use'] == 1
+
+    def test_keyed_by_principal(self):
+        pool = LDAPConnectionPool(max_size=2)
+        conn = FakeConnection()
+        pool.add(KEY, conn, far_future())
+        pool.release(conn)
+        assert pool.checkout((u'other@IPA.TEST', KEY[1])) is None
+
+    def test_unknown_connection_not_released(self):
+        pool = LDAPConnectionPool(max_size=2)
+        assert not pool.release(FakeConnection())
+
+    def test_lru_eviction(self):
+        pool = LDAPConnectionPool(max_size=1)
+        first, second = FakeConnection(), FakeConnection()
+        pool.add(KEY, first, far_future())
+        pool.add(KEY, second, far_future())
+        pool.release(first)
+        pool.release(second)
+        assert first.unbound
+        assert not second.unbound
+        assert pool.stats()['evictions'] == 1
+
+    def test_expired_credentials(self):
+        pool = LDAPConnectionPool(max_size=2)
+        conn = FakeConnection()
+        pool.add(KEY, conn, time.time() - 1)
+        assert pool.release(conn)
+        assert conn.unbound
+        assert pool.checkout(KEY) is None
+
+    def test_idle_ttl(self):
+        pool = LDAPConnectionPool(max_size=2, ttl=0)
+        conn = FakeConnection()
+        pool.add(KEY, conn, far_future())
+        pool.release(conn)
+        assert pool.checkout(KEY) is None
+        assert conn.unbound
+
+    def test_dead_connection(self):
+        pool = LDAPConnectionPool(max_size=2, validate_interval=0)
+        conn = FakeConnection(alive=False)
+        pool.add(KEY, conn, far_future())
+        pool.release(conn)
+        assert pool.checkout(KEY) is None
+        assert conn.unbound
+
+    def test_discard(self):
+        pool = LDAPConnectionPool(max_size=2)
+        conn = FakeConnection()
+        pool.add(KEY, conn, far_future())
+        pool.discard(conn)
+        assert not pool.release(conn)
+        assert not conn.unbound
+
+    def test_disabled(self):
+        pool = LDAPConnectionPool(max_size=0)
+        assert not pool.enabled
+        conn = FakeConnection()
+        pool.add(KEY, conn, far_future())
+        assert not pool.release(conn)
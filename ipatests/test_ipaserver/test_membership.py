@@ -0,0 +1,230 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the in-memory group membership graph
+"""
+
+from __future__ import absolute_import
+
+import re
+
+import pytest
+
+from ipapython.dn import DN
+from ipaserver.membership import MembershipGraph
+
+pytestmark = pytest.mark.tier0
+
+BASE_DN = DN('dc=ipa,dc=test')
+GROUPS = DN('cn=groups,cn=accounts', BASE_DN)
+HOSTGROUPS = DN('cn=hostgroups,cn=accounts', BASE_DN)
+
+
+def user(uid):
+    return DN(('uid', uid), 'cn=users,cn=accounts', BASE_DN)
+
+
+def group(cn):
+    return DN(('cn', cn), GROUPS)
+
+
+class FakeResult(list):
+    truncated = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class FakeEntry(dict):
+    def __init__(self, dn, attrs):
+        super(FakeEntry, self).__init__(attrs)
+        self.dn = dn
+        self.single_value = {k: v[0] for k, v in attrs.items()}
+
+
+class FakeLDAP:
+    """
+    Directory with the memberOf and referential integrity plugins
+    """
+
+    def __init__(self, usn_plugin=True):
+        self.usn_plugin = usn_plugin
+        self.last_usn = 0
+        # group DN -> list of members
+        self.groups = {}
+        # entry DN -> entryusn
+        self.usns = {}
+        self.searches = []
+
+    def _bump(self, dn):
+        self.last_usn += 1
+        self.usns[dn] = self.last_usn
+
+    def memberof(self, dn):
+        groups = set()
+        stack = [dn]
+        while stack:
+            member = stack.pop()
+            for group, members in self.groups.items():
+                if member in members and group not in groups:
+                    groups.add(group)
+                    stack.append(group)
+        return groups
+
+    def _modify(self, change):
+        before = {dn: self.memberof(dn) for dn in self.usns}
+        for dn in change():
+            self._bump(dn)
+        for dn in list(self.usns):
+            if self.memberof(dn) != before.get(dn, set()):
+                # memberOf plugin
+                self._bump(dn)
+
+    def set_members(self, dn, *members):
+        def change():
+            for member in members:
+                self.usns.setdefault(member, 0)
+            self.groups[dn] = list(members)
+            return [dn]
+        self._modify(change)
+
+    def delete(self, dn):
+        def change():
+            del self.groups[dn]
+            del self.usns[dn]
+            # referential integrity plugin
+            parents = [group for group, members in self.groups.items()
+                       if dn in members]
+            for group in parents:
+                self.groups[group].remove(dn)
+            return parents
+        self._modify(change)
+
+    def get_entry(self, dn, attrs_list):
+        assert dn == DN()
+        attrs = {}
+        if self.usn_plugin:
+            attrs['lastusn'] = [str(self.last_usn)]
+        return FakeEntry(dn, attrs)
+
+    def iter_entries(self, filter, attrs_list, base_dn, size_limit=None):
+        self.searches.append(filter)
+        match = re.search(r'\(entryusn>=(\d+)\)', filter)
+        min_usn = int(match.group(1)) if match else 0
+        groups_only = '(objectclass=ipausergroup)' in filter
+        entries = []
+        for dn, usn in self.usns.items():
+            if usn < min_usn or (groups_only and dn not in self.groups):
+                continue
+            attrs = {}
+            if 'objectclass' in attrs_list:
+                attrs['objectclass'] = (
+                    ['top', 'ipaUserGroup'] if dn in self.groups
+                    else ['top', 'person'])
+            if 'member' in attrs_list and dn in self.groups:
+                attrs['member'] = self.groups[dn]
+            if 'memberof' in attrs_list and self.memberof(dn):
+                attrs['memberof'] = sorted(self.memberof(dn))
+            entries.append(FakeEntry(dn, attrs))
+        return FakeResult(entries)
+
+    def handle_truncated_result(self, truncated):
+        assert not truncated
+
+
+@pytest.fixture
+def ldap():
+    ldap = FakeLDAP()
+    ldap.set_members(group('admins'), user('admin'))
+    ldap.set_members(group('editors'), group('admins'), user('u1'))
+    ldap.set_members(group('staff'), group('editors'))
+    ldap.set_members(DN(('cn', 'web'), HOSTGROUPS), group('staff'))
+    return ldap
+
+
+def test_transitive_groups(ldap):
+    graph = MembershipGraph()
+    graph.refresh(ldap, BASE_DN)
+    assert graph.get_group_names(user('admin'), GROUPS) == [
+        'admins', 'editors', 'staff']
+    assert graph.get_group_names(user('u1'), GROUPS) == ['editors', 'staff']
+    assert graph.get_group_names(user('u1'), HOSTGROUPS) == ['web']
+    assert graph.get_group_names(user('nobody'), GROUPS) == []
+
+
+def test_cycle(ldap):
+    ldap.set_members(group('admins'), user('admin'), group('staff'))
+    graph = MembershipGraph()
+    graph.refresh(ldap, BASE_DN)
+    assert graph.get_groups(group('staff')) == {
+        group('admins'), group('editors'), group('staff')}
+
+
+def test_unchanged(ldap):
+    graph = MembershipGraph()
+    graph.refresh(ldap, BASE_DN)
+    graph.refresh(ldap, BASE_DN)
+    assert len(ldap.searches) == 1
+    assert graph.stats()['full_loads'] == 1
+
+
+def test_incremental_update(ldap):
+    graph = MembershipGraph()
+    graph.refresh(ldap, BASE_DN)
+    assert graph.get_group_names(user('u1'), GROUPS) == ['editors', 'staff']
+
+    last_usn = ldap.last_usn
+    ldap.set_members(group('editors'), group('admins'))
+    ldap.set_members(group('staff'), group('editors'), user('u1'))
+    ldap.delete(group('admins'))
+    del ldap.searches[:]
+    graph.refresh(ldap, BASE_DN)
+
+    # only the changed entries are read
+    assert ldap.searches == ['(entryusn>={})'.format(last_usn + 1)]
+    assert graph.get_group_names(user('u1'), GROUPS) == ['staff']
+    assert graph.get_group_names(user('admin'), GROUPS) == []
+    stats = graph.stats()
+    assert stats['full_loads'] == 1
+    assert stats['incremental_loads'] == 1
+    assert stats['last_usn'] == ldap.last_usn
+
+
+def test_deleted_group(ldap):
+    graph = MembershipGraph()
+    graph.refresh(ldap, BASE_DN)
+    assert graph.get_group_names(user('admin'), GROUPS) == [
+        'admins', 'editors', 'staff']
+
+    # admins is not a member of any group anymore, only the memberOf values
+    # of its members change when it is deleted
+    ldap.set_members(group('editors'), user('u1'))
+    ldap.delete(group('admins'))
+    graph.refresh(ldap, BASE_DN)
+
+    assert graph.get_group_names(user('admin'), GROUPS) == []
+    assert graph.get_groups(group('admins')) == frozenset()
+    assert graph.stats()['groups'] == 3
+
+
+def test_poll_interval(ldap):
+    graph = MembershipGraph(poll_interval=3600)
+    graph.refresh(ldap, BASE_DN)
+    ldap.set_members(group('staff'), user('u2'))
+    graph.refresh(ldap, BASE_DN)
+    assert graph.get_group_names(user('u2'), GROUPS) == []
+
+
+def test_without_usn_plugin(ldap):
+    ldap.usn_plugin = False
+    graph = MembershipGraph()
+    graph.refresh(ldap, BASE_DN)
+    ldap.set_members(group('staff'), user('u2'))
+    graph.refresh(ldap, BASE_DN)
+    assert graph.get_group_names(user('u2'), GROUPS) == ['staff']
+    assert graph.stats()['full_loads'] == 2
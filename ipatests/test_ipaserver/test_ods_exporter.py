@@ -0,0 +1,253 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Test the synchronization of all zones in `daemons/dnssec/ipa-ods-exporter`
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+from ipalib import errors
+from ipapython.dn import DN
+
+pytest.importorskip('gssapi')
+pytest.importorskip('systemd.daemon')
+pytest.importorskip('systemd.journal')
+
+pytestmark = pytest.mark.tier0
+
+EXPORTER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__)))),
+    'daemons', 'dnssec', 'ipa-ods-exporter.in')
+# the code after this line is run by the service
+MAIN_MARKER = '# this service is usually socket-activated'
+
+DNS_DN = DN('cn=dns', 'dc=ipa,dc=test')
+
+KASP_SCHEMA = """
+CREATE TABLE zones (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE keypairs (id INTEGER PRIMARY KEY, HSMkey_id TEXT,
+                       generate TEXT, algorithm INTEGER);
+CREATE TABLE dnsseckeys (id INTEGER PRIMARY KEY, keypair_id INTEGER,
+                         zone_id INTEGER, publish TEXT, active TEXT,
+                         retire TEXT, dead TEXT, keytype INTEGER,
+                         state INTEGER);
+"""
+
+ZSK = 256
+KSK = 257
+KSM_STATE_ACTIVE = 4
+RSASHA256 = 8
+
+
+@pytest.fixture(scope='module')
+def exporter():
+    """Definitions of ipa-ods-exporter, without the code run by the service"""
+    if not os.path.isfile(EXPORTER):
+        pytest.skip('ipa-ods-exporter source is not available')
+    with open(EXPORTER) as f:
+        source = f.read()
+    # comment out the shebang placeholder to keep the line numbers
+    source = '#' + source.split(MAIN_MARKER, 1)[0]
+    ns = {'__name__': 'ipa_ods_exporter', '__file__': EXPORTER}
+    exec(compile(source, EXPORTER, 'exec'), ns)
+    return ns
+
+
+class KASPDB:
+    """In-memory ODS KASP DB"""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(KASP_SCHEMA)
+
+    def add_zone(self, name):
+        cur = self.conn.execute("INSERT INTO zones (name) VALUES (?)",
+                                (name,))
+        return cur.lastrowid
+
+    def add_key(self, zone_id, hsm_key_id, keytype=ZSK):
+        cur = self.conn.execute(
+            "INSERT INTO keypairs (HSMkey_id, generate, algorithm) "
+            "VALUES (?, '2018-01-01 10:00:00', ?)", (hsm_key_id, RSASHA256))
+        self.conn.execute(
+            "INSERT INTO dnsseckeys (keypair_id, zone_id, publish, active, "
+            "keytype, state) VALUES (?, ?, '2018-01-01 11:00:00', "
+            "'2018-01-01 12:00:00', ?, ?)",
+            (cur.lastrowid, zone_id, keytype, KSM_STATE_ACTIVE))
+
+
+@pytest.fixture
+def kasp(exporter, monkeypatch):
+    db = KASPDB()
+    monkeypatch.setitem(exporter, 'db', db.conn)
+    yield db
+    db.conn.close()
+
+
+class FakeResult(list):
+    truncated = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class FakeEntry(dict):
+    def __init__(self, dn, **attrs):
+        super(FakeEntry, self).__init__(attrs)
+        self.dn = dn
+
+
+class FakeLDAP:
+    MATCH_ALL = '&'
+    MATCH_ANY = '|'
+
+    def __init__(self):
+        self.entries = {}
+        self.added = []
+        self.deleted = []
+        self.updated = []
+        self.searches = 0
+
+    def add_zone(self, name):
+        zone_dn = DN(('idnsname', name), DNS_DN)
+        self.entries[zone_dn] = FakeEntry(
+            zone_dn, objectClass=[u'top', u'idnsZone'], idnsname=[name])
+        return zone_dn
+
+    def add_keys_container(self, zone_dn):
+        keys_dn = DN('cn=keys', zone_dn)
+        self.entries[keys_dn] = FakeEntry(
+            keys_dn, objectClass=[u'nsContainer'], cn=[u'keys'])
+        return keys_dn
+
+    def add_key(self, keys_dn, key_id):
+        key_dn = DN(('cn', key_id), keys_dn)
+        self.entries[key_dn] = FakeEntry(
+            key_dn, objectClass=[u'idnsSecKey'], cn=[key_id])
+
+    def combine_filters(self, filters, rules):
+        return (rules, filters)
+
+    def make_filter_from_attr(self, attr, value):
+        return (attr, value)
+
+    def make_filter(self, kw, rules):
+        return (rules, sorted(kw.items()))
+
+    def iter_entries(self, filter, attrs_list, base_dn, time_limit=None,
+                     size_limit=None):
+        self.searches += 1
+        assert base_dn == DNS_DN
+        return FakeResult(self.entries.values())
+
+    def handle_truncated_result(self, truncated):
+        assert not truncated
+
+    def make_entry(self, dn, **attrs):
+        return FakeEntry(dn, **attrs)
+
+    def add_entry(self, entry):
+        if entry.dn in self.entries:
+            raise errors.DuplicateEntry()
+        self.entries[entry.dn] = entry
+        self.added.append(entry.dn)
+
+    def delete_entry(self, dn):
+        del self.entries[dn]
+        self.deleted.append(dn)
+
+    def update_entry(self, entry):
+        self.updated.append(entry.dn)
+
+
+def test_zone_without_keys(exporter, kasp):
+    kasp.add_zone(u'empty.test')
+    zone_id = kasp.add_zone(u'ipa.test')
+    kasp.add_key(zone_id, u'aa01', keytype=KSK)
+    kasp.add_key(zone_id, u'aa02')
+
+    ods_zones = exporter['get_all_ods_keys']()
+    assert ods_zones[u'empty.test'] == {}
+    assert sorted(key_id.split('-')[0] for key_id in
+                  ods_zones[u'ipa.test']) == ['KSK', 'ZSK']
+
+    ldap = FakeLDAP()
+    empty_dn = ldap.add_zone(u'empty.test.')
+    ldap.add_keys_container(empty_dn)
+    ldap.add_key(DN('cn=keys', empty_dn), u'ZSK-old-aa00')
+    ipa_dn = ldap.add_zone(u'ipa.test.')
+    ldap.add_keys_container(ipa_dn)
+
+    exporter['sync_all_zones'](ldap, DNS_DN)
+    # the keys of the zone which has none in ODS are removed
+    assert ldap.deleted == [DN('cn=ZSK-old-aa00,cn=keys', empty_dn)]
+    assert sorted(dn[0].value for dn in ldap.added) == sorted(
+        ods_zones[u'ipa.test'])
+    assert ldap.searches == 1
+
+
+def test_missing_keys_container(exporter, kasp):
+    zone_id = kasp.add_zone(u'ipa.test')
+    kasp.add_key(zone_id, u'aa01')
+
+    ldap = FakeLDAP()
+    zone_dn = ldap.add_zone(u'ipa.test.')
+    ldap_zones = exporter['get_all_ldap_keys'](ldap, DNS_DN)
+    assert ldap_zones == {u'ipa.test': (zone_dn, False, {})}
+
+    exporter['sync_all_zones'](ldap, DNS_DN)
+    keys_dn = DN('cn=keys', zone_dn)
+    assert ldap.added[0] == keys_dn
+    assert ldap.entries[keys_dn]['objectClass'] == ['nsContainer']
+    assert [dn[1:] for dn in ldap.added[1:]] == [keys_dn]
+
+
+def test_zone_name_normalization(exporter, kasp):
+    zone_id = kasp.add_zone(u'IPA.Test')
+    kasp.add_key(zone_id, u'aa01')
+    key_id, = exporter['get_all_ods_keys']()[u'IPA.Test']
+
+    ldap = FakeLDAP()
+    zone_dn = ldap.add_zone(u'ipa.test.')
+    keys_dn = ldap.add_keys_container(zone_dn)
+    ldap.add_key(keys_dn, key_id)
+    # zone entries which are not right under the DNS container are ignored
+    sub_dn = DN('idnsname=sub.ipa.test.', zone_dn)
+    ldap.entries[sub_dn] = FakeEntry(
+        sub_dn, objectClass=[u'idnsZone'], idnsname=[u'sub.ipa.test.'])
+
+    ldap_zones = exporter['get_all_ldap_keys'](ldap, DNS_DN)
+    assert list(ldap_zones) == [u'ipa.test']
+    _dn, has_container, ldap_keys = ldap_zones[u'ipa.test']
+    assert has_container
+    assert list(ldap_keys) == [key_id]
+
+    exporter['sync_all_zones'](ldap, DNS_DN)
+    # the existing key is updated in place
+    assert ldap.added == []
+    assert ldap.deleted == []
+    assert ldap.updated == [DN(('cn', key_id), keys_dn)]
+    assert ldap.entries[DN(('cn', key_id), keys_dn)][
+        'idnsSecKeyRef'] == 'pkcs11:object=aa01'
+
+
+def test_zone_not_found(exporter, kasp):
+    kasp.add_zone(u'ipa.test')
+    kasp.add_zone(u'missing.test')
+
+    ldap = FakeLDAP()
+    ldap.add_zone(u'ipa.test.')
+
+    with pytest.raises(errors.NotFound) as e:
+        exporter['sync_all_zones'](ldap, DNS_DN)
+    assert u'missing.test' in str(e.value)
@@ -0,0 +1,139 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the concurrent replication status collector
+"""
+
+from __future__ import absolute_import
+
+import pytest
+
+from ipalib import errors
+from ipapython.dn import DN
+from ipaserver import replstatus
+
+pytestmark = pytest.mark.tier0
+
+SUFFIX = DN('dc=ipa,dc=test')
+CA_SUFFIX = DN(('o', 'ipaca'))
+
+
+def ruv(*elements):
+    values = [u'{replicageneration} 5a8bd5ef000000040000']
+    for rid, host, max_time in elements:
+        value = u'{replica %d ldap://%s:389}' % (rid, host)
+        if max_time is not None:
+            value += u' 5a000000000000%02x0000 %08x0000%04x0000' % (
+                rid, max_time, rid)
+        values.append(value)
+    return values
+
+
+class FakeEntry(dict):
+    def __init__(self, attrs):
+        super(FakeEntry, self).__init__(attrs)
+        self.single_value = {k: v[0] for k, v in attrs.items()}
+
+
+def agreement(consumer, status=u'Error (0) Replica acquired successfully: '
+                                u'Incremental update succeeded'):
+    return FakeEntry({
+        'cn': [u'meTo%s' % consumer],
+        'objectclass': [u'nsds5ReplicationAgreement'],
+        'nsDS5ReplicaRoot': [str(SUFFIX)],
+        'nsDS5ReplicaHost': [consumer],
+        'nsds5replicaUpdateInProgress': [u'FALSE'],
+        'nsds5ReplicaLastUpdateStatus': [status],
+        'nsds5ReplicaLastUpdateEnd': [u'20180601120000Z'],
+    })
+
+
+class FakeClient:
+    SCOPE_SUBTREE = 2
+    SCOPE_ONELEVEL = 1
+
+    def __init__(self, host, agreements, ruvs):
+        self.host = host
+        self.agreements = agreements
+        self.ruvs = ruvs
+        self.unbound = False
+
+    def get_entries(self, base_dn, scope, filter, attrs_list, time_limit):
+        assert time_limit == 5
+        if base_dn == replstatus.MAPPING_TREE_DN:
+            return self.agreements
+        if base_dn not in self.ruvs:
+            raise errors.NotFound(reason='no such entry')
+        return [FakeEntry({'nsds50ruv': self.ruvs[base_dn]})]
+
+    def unbind(self):
+        self.unbound = True
+
+
+class Collector(replstatus.ReplicationStatusCollector):
+    def __init__(self, servers):
+        super(Collector, self).__init__([SUFFIX, CA_SUFFIX], timeout=5)
+        self.servers = servers
+        self.connected = []
+
+    def _connect(self, host):
+        self.connected.append(host)
+        if host not in self.servers:
+            raise errors.NetworkError(uri=host, error='timed out')
+        return FakeClient(host, *self.servers[host])
+
+
+@pytest.fixture
+def servers():
+    return {
+        'm1.ipa.test': (
+            [agreement('m2.ipa.test'), agreement('m3.ipa.test')],
+            {SUFFIX: ruv((4, 'm1.ipa.test', 1000), (5, 'm2.ipa.test', 900)),
+             CA_SUFFIX: ruv((6, 'm1.ipa.test', 50))},
+        ),
+        'm2.ipa.test': (
+            [agreement('m1.ipa.test', u'Error (-1) Problem connecting')],
+            {SUFFIX: ruv((4, 'm1.ipa.test', 970), (5, 'm2.ipa.test', 900))},
+        ),
+    }
+
+
+def test_parse():
+    assert replstatus.parse_ruv(ruv((4, 'm1.ipa.test', 16),
+                                    (7, 'm2.ipa.test', None))) == {
+        4: (u'ldap://m1.ipa.test:389', u'00000010000000040000'),
+        7: (u'ldap://m2.ipa.test:389', None),
+    }
+    assert replstatus.parse_update_status(
+        u'Error (0) Replica acquired successfully') == (
+        0, u'Replica acquired successfully')
+    assert replstatus.parse_update_status(u'1 Can\'t acquire replica') == (
+        1, u'Can\'t acquire replica')
+    assert replstatus.parse_update_status(None) == (None, None)
+
+
+def test_collect(servers):
+    collector = Collector(servers)
+    statuses, agreements = collector.collect(
+        ['m1.ipa.test', 'm2.ipa.test', 'm3.ipa.test'])
+
+    assert statuses['m1.ipa.test']['error'] is None
+    assert statuses['m3.ipa.test']['error']
+    assert [(a['supplier'], a['consumer'], a['lag'], a['last_update_code'])
+            for a in agreements] == [
+        ('m1.ipa.test', 'm2.ipa.test', 30, 0),
+        ('m1.ipa.test', 'm3.ipa.test', None, 0),
+        ('m2.ipa.test', 'm1.ipa.test', 0, -1),
+    ]
+    assert agreements[0]['last_update_end'].year == 2018
+
+
+def test_connections_are_reused(servers):
+    with Collector(servers) as collector:
+        collector.collect(['m1.ipa.test', 'm2.ipa.test'])
+        collector.collect(['m1.ipa.test', 'm2.ipa.test'])
+        assert sorted(collector.connected) == ['m1.ipa.test', 'm2.ipa.test']
+        clients = list(collector._idle.values())
+    assert all(client.unbound for client in clients)
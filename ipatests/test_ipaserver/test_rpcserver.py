@@ -136,6 +136,29 @@ def test_params_2_args_options():
     assert f([args, options]) == (args, options)
 
 
+def test_streamed_response(monkeypatch):
+    """
+    Test that a streamed response keeps the request context until closed.
+    """
+    destroyed = []
+    monkeypatch.setattr(rpcserver, 'destroy_context',
+                        lambda: destroyed.append(True))
+
+    def chunks():
+        yield b'['
+        yield b']'
+
+    response = rpcserver.StreamedResponse(chunks())
+    rpcserver.end_request(response)
+    assert destroyed == []
+    assert list(response) == [b'[', b']']
+    response.close()
+    assert destroyed == [True]
+
+    rpcserver.end_request([b'{}'])
+    assert destroyed == [True, True]
+
+
 class test_session:
     klass = rpcserver.wsgi_dispatch
 
@@ -262,3 +285,13 @@ class test_jsonserver(PluginTester):
         options = dict(givenname=u'John', sn='Doe')
         d = dict(method=u'user_add', params=(args, options), id=18)
         assert o.unmarshal(json.dumps(d)) == (u'user_add', args, options, 18)
+
+    def test_should_stream(self):
+        """
+        Test the `ipaserver.rpcserver.jsonserver._should_stream` method.
+        """
+        o, _api, _home = self.instance('Backend', in_server=True)
+        assert not o._should_stream(dict(result=[u'line']))
+        assert o._should_stream(dict(result=(u'line' for _i in range(1))))
+        assert o._should_stream(
+            dict(result=[u'line'] * o.stream_threshold))
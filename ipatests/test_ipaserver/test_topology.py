@@ -0,0 +1,93 @@
+#
+# Copyright (C) 2018  FreeIPA Contributors see COPYING for license
+#
+
+"""
+Tests for the connectivity checks of the replication topology
+"""
+
+import pytest
+
+from ipaserver.topology import (
+    create_topology_graph, get_topology_connection_errors,
+    get_master_removal_errors, get_segment_removal_errors)
+
+pytestmark = pytest.mark.tier0
+
+
+def master(cn):
+    return {'cn': [cn]}
+
+
+def segment(left, right, direction=u'both'):
+    return {
+        'cn': [u'%s-to-%s' % (left, right)],
+        'iparepltoposegmentleftnode': [left],
+        'iparepltoposegmentrightnode': [right],
+        'iparepltoposegmentdirection': [direction],
+    }
+
+
+def normalize(errors):
+    return [(m, sorted(visited), sorted(not_visited))
+            for m, visited, not_visited in errors]
+
+
+def check_removal(masters, segments, results):
+    # compare with errors of topologies rebuilt without the removed master
+    for m, errors in results.items():
+        assert normalize(errors) == normalize(get_topology_connection_errors(
+            create_topology_graph(
+                [x for x in masters if x['cn'][0] != m], segments)))
+
+
+@pytest.fixture
+def line():
+    # m1 - m2 - m3 - m4 with a cycle m2 - m3 - m5
+    masters = [master(u'm%d' % i) for i in range(1, 6)]
+    segments = [segment(u'm1', u'm2'), segment(u'm2', u'm3'),
+                segment(u'm3', u'm4'), segment(u'm3', u'm5'),
+                segment(u'm5', u'm2')]
+    return masters, segments
+
+
+def test_connection_errors(line):
+    masters, segments = line
+    graph = create_topology_graph(masters, segments)
+    assert get_topology_connection_errors(graph) == []
+
+    segments[2] = segment(u'm3', u'm4', u'right-left')
+    graph = create_topology_graph(masters, segments)
+    errors = get_topology_connection_errors(graph)
+    assert [(m, sorted(not_visited)) for m, _v, not_visited in errors] == [
+        (u'm1', [u'm4']), (u'm2', [u'm4']), (u'm3', [u'm4']),
+        (u'm5', [u'm4'])]
+
+
+def test_master_removal(line):
+    masters, segments = line
+    graph = create_topology_graph(masters, segments)
+    results = get_master_removal_errors(graph)
+    assert sorted(m for m in results if results[m]) == [u'm2', u'm3']
+    assert [e[0] for e in results[u'm3']] == [u'm1', u'm2', u'm4', u'm5']
+    check_removal(masters, segments, results)
+    assert get_master_removal_errors(graph, [u'm9']) == {u'm9': []}
+
+    # not symmetric, every master is evaluated in full
+    segments.append(segment(u'm4', u'm1', u'left-right'))
+    graph = create_topology_graph(masters, segments)
+    results = get_master_removal_errors(graph)
+    assert results[u'm1'] == []
+    check_removal(masters, segments, results)
+
+
+def test_segment_removal(line):
+    masters, segments = line
+    segments.append(segment(u'm4', u'm3'))
+    graph = create_topology_graph(masters, segments)
+    results = get_segment_removal_errors(graph, segments)
+    assert sorted(s for s in results if results[s]) == [u'm1-to-m2']
+    assert results[u'm1-to-m2'][0][0] == u'm1'
+    assert results[u'm2-to-m3'] == []
+    # m3 - m4 is covered by two segments
+    assert results[u'm3-to-m4'] == []
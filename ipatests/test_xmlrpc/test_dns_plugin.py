@@ -28,6 +28,7 @@ from ipapython.dnsutil import DNSName
 from ipapython.dn import DN
 from ipatests.test_xmlrpc import objectclasses
 from ipatests.test_xmlrpc.xmlrpc_test import Declarative, fuzzy_digits
+from ipatests.util import Fuzzy
 import pytest
 
 try:
@@ -6223,3 +6224,67 @@ class test_dns_type_uri(test_dns):
             },
         ),
     ]
+
+
+@pytest.mark.tier1
+class test_dns_zone_import(test_dns):
+    """Test import of resource records from a zone file."""
+
+    @classmethod
+    def setup_class(cls):
+        super(test_dns_zone_import, cls).setup_class()
+        try:
+            api.Command['dnszone_add'](zone1, idnssoarname=zone1_rname)
+        except errors.DuplicateEntry:
+            pass
+
+    cleanup_commands = [
+        ('dnszone_del', [zone1], {'continue': True}),
+    ]
+
+    # zone files usually end with a newline
+    zonefile = (
+        u'$TTL 3600\n'
+        u'{0} 300 A 172.16.29.111\n'
+        u'{0} AAAA 2001:db8::1\n'
+    ).format(name1)
+
+    tests = [
+        dict(
+            desc='Import zone file ending with a newline into %r' % zone1,
+            command=('dnszone_import', [zone1], {'zonefile': zonefile}),
+            expected={
+                'value': zone1_absolute_dnsname,
+                'summary': u'Imported 2 of 2 records into DNS zone "%s"'
+                           % zone1_absolute,
+                'result': {
+                    'records': 2,
+                    'names': 1,
+                    'added': 1,
+                    'updated': 0,
+                    'imported': 2,
+                    'skipped': 0,
+                    'failed': 0,
+                    'seconds': Fuzzy(type=(int, float)),
+                    'records_per_second': Fuzzy(type=int),
+                },
+                'failed': [],
+            },
+        ),
+        dict(
+            desc='Retrieve imported record %r in zone %r' % (name1, zone1),
+            command=('dnsrecord_show', [zone1, name1], {'all': True}),
+            expected={
+                'value': name1_dnsname,
+                'summary': None,
+                'result': {
+                    'dn': name1_dn,
+                    'idnsname': [name1_dnsname],
+                    'objectclass': objectclasses.dnsrecord,
+                    'dnsttl': [u'300'],
+                    'arecord': [u'172.16.29.111'],
+                    'aaaarecord': [u'2001:db8::1'],
+                },
+            },
+        ),
+    ]
@@ -432,6 +432,7 @@ AstroidBuilder(MANAGER).string_build(textwrap.dedent(
     api.env.ca_host = ''
     api.env.ca_install_port = None
     api.env.ca_port = 0
+    api.env.cert_expiry_poll_interval = 0
     api.env.conf = ''  # object
     api.env.conf_default = ''  # object
     api.env.confdir = ''  # object
@@ -504,18 +505,24 @@ AstroidBuilder(MANAGER).string_build(textwrap.dedent(
     api.env.interactive = True
     api.env.ipalib = ''  # object
     api.env.kinit_lifetime = None
+    api.env.ldap_pool_size = 0
+    api.env.ldap_pool_ttl = 0
     api.env.lite_pem = ''
     api.env.lite_profiler = ''
     api.env.lite_host = ''
     api.env.lite_port = 0
     api.env.log = ''  # object
     api.env.logdir = ''  # object
+    api.env.membership_graph = False
+    api.env.membership_poll_interval = 0
     api.env.mode = ''
     api.env.mount_ipa = ''
     api.env.nss_dir = ''  # object
+    api.env.plugin_snapshot = ''  # object
     api.env.plugins_on_demand = False  # object
     api.env.prompt_all = False
     api.env.ra_plugin = ''
+    api.env.ra_pool_size = 0
     api.env.recommended_max_agmts = 0
     api.env.replication_wait_timeout = 0
     api.env.rpc_protocol = ''